@@ -12,6 +12,7 @@
 
 from __future__ import print_function
 
+import atexit
 import json
 import os
 import sys
@@ -51,13 +52,20 @@ from flask import current_app, g, request, abort, jsonify, make_response, send_f
 from flask_apscheduler import APScheduler
 from flask_bootstrap import Bootstrap
 from werkzeug.security import check_password_hash, generate_password_hash
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
 
 import alignak_backend
 from alignak_backend import manifest
 from alignak_backend.grafana import Grafana
+from alignak_backend.historywriter import HistoryWriter
 from alignak_backend.livesynthesis import Livesynthesis
+from alignak_backend.livestate import Livestate
+from alignak_backend.groupsynthesis import Groupsynthesis
 from alignak_backend.models import register_models
+from alignak_backend.namecache import NameCache
+from alignak_backend.realmtree import RealmTree
+from alignak_backend.session import SessionToken
 from alignak_backend.template import Template
 from alignak_backend.timeseries import Timeseries
 
@@ -71,13 +79,24 @@ class MyTokenAuth(TokenAuth):
     children_realms = {}
     parent_realms = {}
 
+    # Resolved user rights, indexed by authentication key (token or JWT username)
+    rights_cache = {}
+
     """Authentication token class"""
 
     def check_auth(self, token, allowed_roles, resource, method):
-        # pylint: disable=too-many-locals
         """
         Check if account exist and get roles for this user
 
+        The user effective rights are read from the userrights collection where they are
+        materialized when the user, its restriction roles or the realms are modified. They are
+        stored in a per-worker cache for RIGHTS_CACHE_TTL seconds. This cache is cleared each
+        time a user or a user restriction role is created, updated or deleted and when the
+        realms tree is modified.
+
+        When a session token is used, the user rights are got from the cache unless they are
+        older than the user rights version stamped in the session token.
+
         :param token: token for auth
         :type token: str
         :param allowed_roles:
@@ -91,77 +110,204 @@ class MyTokenAuth(TokenAuth):
         """
         auth = request.headers.get('Authorization').strip()
         authorization_token_is_jwt = auth.lower().startswith('bearer')
-        if authorization_token_is_jwt:
+        version = 0
+        if SessionToken.is_session_token(token):
+            session = SessionToken.decode(token)
+            if not session:
+                return False
+            cache_key = 'session:%s' % session['user']
+            lookup = {'user': session['user']}
+            version = session['version']
+        elif authorization_token_is_jwt:
             try:
                 public_key = settings["KIWI_RSA_PUBLIC_KEY"]
                 username = jwt.decode(token, public_key, algorithms='RS256')["username"]
             except (ValueError, KeyError):
                 return False
-            user = current_app.data.driver.db['user'].find_one({'name': username})
+            cache_key = 'jwt:%s' % username
+            lookup = {'name': username}
         else:
-            user = current_app.data.driver.db['user'].find_one({'token': token})
-        if user:
-            # We get all resources we have in the backend for the userrestrictrole with *
-            resource_list = list(current_app.config['DOMAIN'])
+            cache_key = token
+            lookup = {'token': token}
+
+        rights = self.get_cached_rights(cache_key, version)
+        if rights is None:
+            user_rights = current_app.data.driver.db['userrights'].find_one(lookup)
+            if user_rights:
+                rights = user_rights['rights']
+            else:
+                # The user rights are not yet materialized (eg. realms tree modified)
+                if 'user' in lookup:
+                    lookup = {'_id': lookup['user']}
+                user = current_app.data.driver.db['user'].find_one(lookup)
+                if not user:
+                    return user
+                rights = self.materialize_user_rights(user)
+            if settings['RIGHTS_CACHE_TTL'] > 0:
+                rights['_cached'] = time.time()
+                self.rights_cache[cache_key] = rights
 
-            g.updateRealm = False
-            g.updateGroup = False
-            g.user_realm = user['_realm']
+        g.updateRealm = False
+        g.updateGroup = False
+        g.user_realm = rights['_realm']
+        g.back_role_super_admin = rights['back_role_super_admin']
+        g.can_submit_commands = rights['can_submit_commands']
+        for prop in ['resources_get', 'resources_get_parents', 'resources_get_custom',
+                     'resources_post', 'resources_post_parents',
+                     'resources_patch', 'resources_patch_parents', 'resources_patch_custom',
+                     'resources_delete', 'resources_delete_parents', 'resources_delete_custom']:
+            setattr(g, prop, rights[prop])
+        g.users_id = rights['_id']
+        # Lookup filters compiled for these user rights
+        g.rights_lookups = rights.setdefault('_lookups', {})
+        self.set_request_auth_value(rights['_id'])
+        return True
+
+    def get_cached_rights(self, cache_key, version=0):
+        """
+        Get the user rights from the cache if they are not expired
+
+        :param cache_key: token, JWT username or session user of the user
+        :type cache_key: str
+        :param version: minimum version of the user rights
+        :type version: float
+        :return: the cached user rights or None
+        :rtype: dict
+        """
+        rights = self.rights_cache.get(cache_key)
+        if rights is None:
+            return None
+        if rights.get('_version', 0) < version:
+            self.rights_cache.pop(cache_key, None)
+            return None
+        if time.time() - rights['_cached'] > settings['RIGHTS_CACHE_TTL']:
+            self.rights_cache.pop(cache_key, None)
+            return None
+        return rights
+
+    @classmethod
+    def clear_rights_cache(cls):
+        """
+        Clear all the cached user rights
 
-            # get children of realms for rights
-            realmsdrv = current_app.data.driver.db['realm']
-            allrealms = realmsdrv.find()
-            self.children_realms = {}
-            self.parent_realms = {}
-            for realm in allrealms:
-                self.children_realms[realm['_id']] = realm['_all_children']
-                self.parent_realms[realm['_id']] = realm['_tree_parents']
-
-            g.back_role_super_admin = user['back_role_super_admin']
-            g.can_submit_commands = user['can_submit_commands']
-            userrestrictroles = current_app.data.driver.db['userrestrictrole']
-            userrestrictrole = userrestrictroles.find({'user': user['_id']})
-            g.resources_get = {}
-            g.resources_get_parents = {}
-            get_parents = {}
-            g.resources_get_custom = {}
-            g.resources_post = {}
-            g.resources_post_parents = {}
-            g.resources_patch = {}
-            g.resources_patch_parents = {}
-            g.resources_patch_custom = {}
-            g.resources_delete = {}
-            g.resources_delete_parents = {}
-            g.resources_delete_custom = {}
-            for rights in userrestrictrole:
-                self.add_resources_realms('read', rights, False, g.resources_get, resource_list,
-                                          get_parents)
-                self.add_resources_realms('read', rights, True, g.resources_get_custom,
-                                          resource_list)
-                self.add_resources_realms('create', rights, False, g.resources_post, resource_list)
-                self.add_resources_realms('update', rights, False, g.resources_patch,
-                                          resource_list)
-                self.add_resources_realms('update', rights, True, g.resources_patch_custom,
-                                          resource_list)
-                self.add_resources_realms('delete', rights, False, g.resources_delete,
-                                          resource_list)
-                self.add_resources_realms('delete', rights, True, g.resources_delete_custom,
-                                          resource_list)
-            for res in g.resources_get:
-                g.resources_get[res] = list(set(g.resources_get[res]))
-                if res in g.resources_get_custom:
-                    g.resources_get_custom[res] = list(set(g.resources_get_custom[res]))
-                g.resources_get_parents[res] = [item for item in get_parents[res]
-                                                if item not in g.resources_get[res]]
-            for res in g.resources_post:
-                g.resources_post[res] = list(set(g.resources_post[res]))
-            for res in g.resources_patch:
-                g.resources_patch[res] = list(set(g.resources_patch[res]))
-            for res in g.resources_delete:
-                g.resources_delete[res] = list(set(g.resources_delete[res]))
-            g.users_id = user['_id']
-            self.set_request_auth_value(user['_id'])
-        return user
+        :return: None
+        """
+        cls.rights_cache.clear()
+
+    def get_user_rights(self, user):
+        # pylint: disable=too-many-locals
+        """
+        Resolve the rights of a user: resources and realms the user is allowed to read, create,
+        update and delete
+
+        :param user: the user (from mongo)
+        :type user: dict
+        :return: the user rights
+        :rtype: dict
+        """
+        # We get all resources we have in the backend for the userrestrictrole with *
+        resource_list = list(current_app.config['DOMAIN'])
+
+        # get children / parents of realms for rights
+        realms_tree = RealmTree.get()
+        self.children_realms = realms_tree['descendants']
+        self.parent_realms = realms_tree['ancestors']
+
+        userrestrictroles = current_app.data.driver.db['userrestrictrole']
+        userrestrictrole = userrestrictroles.find({'user': user['_id']})
+        rights = {
+            '_id': user['_id'],
+            '_realm': user['_realm'],
+            'back_role_super_admin': user['back_role_super_admin'],
+            'can_submit_commands': user['can_submit_commands'],
+            'resources_get': {},
+            'resources_get_parents': {},
+            'resources_get_custom': {},
+            'resources_post': {},
+            'resources_post_parents': {},
+            'resources_patch': {},
+            'resources_patch_parents': {},
+            'resources_patch_custom': {},
+            'resources_delete': {},
+            'resources_delete_parents': {},
+            'resources_delete_custom': {}
+        }
+        get_parents = {}
+        for data in userrestrictrole:
+            self.add_resources_realms('read', data, False, rights['resources_get'],
+                                      resource_list, get_parents)
+            self.add_resources_realms('read', data, True, rights['resources_get_custom'],
+                                      resource_list)
+            self.add_resources_realms('create', data, False, rights['resources_post'],
+                                      resource_list)
+            self.add_resources_realms('update', data, False, rights['resources_patch'],
+                                      resource_list)
+            self.add_resources_realms('update', data, True, rights['resources_patch_custom'],
+                                      resource_list)
+            self.add_resources_realms('delete', data, False, rights['resources_delete'],
+                                      resource_list)
+            self.add_resources_realms('delete', data, True, rights['resources_delete_custom'],
+                                      resource_list)
+        resources_get = rights['resources_get']
+        for res in resources_get:
+            resources_get[res] = list(set(resources_get[res]))
+            if res in rights['resources_get_custom']:
+                rights['resources_get_custom'][res] = \
+                    list(set(rights['resources_get_custom'][res]))
+            rights['resources_get_parents'][res] = [item for item in get_parents[res]
+                                                    if item not in resources_get[res]]
+        for prop in ['resources_post', 'resources_patch', 'resources_delete']:
+            for res in rights[prop]:
+                rights[prop][res] = list(set(rights[prop][res]))
+        return rights
+
+    def materialize_user_rights(self, user):
+        """
+        Resolve the rights of a user and store them in the userrights collection
+
+        The rights are resolved with the shared realms tree index. When the realms tree is
+        modified, the backend process that modified it materializes again the rights of the
+        concerned users, thus the stored rights do not depend on the index of another process.
+
+        :param user: the user (from mongo)
+        :type user: dict
+        :return: the user rights
+        :rtype: dict
+        """
+        rights = self.get_user_rights(user)
+        rights['_version'] = time.time()
+        current_app.data.driver.db['userrights'].update_one(
+            {'user': user['_id']},
+            {'$set': {'name': user['name'], 'token': user['token'], 'rights': rights,
+                      'schema_version': 1}},
+            upsert=True)
+        return rights
+
+    def materialize_users_rights(self, user_id=None):
+        """
+        Materialize the rights of one user or of all the users. The rights of the users that do
+        not exist anymore are deleted.
+
+        :param user_id: id of the user, None for all the users
+        :type user_id: ObjectId
+        :return: number of materialized users rights
+        :rtype: int
+        """
+        lookup = {}
+        if user_id is not None:
+            lookup = {'_id': user_id}
+        else:
+            # Materializing all the users rights, make sure the realms tree is up to date
+            RealmTree.build()
+        users_id = []
+        for user in current_app.data.driver.db['user'].find(lookup):
+            self.materialize_user_rights(user)
+            users_id.append(user['_id'])
+        if user_id is not None:
+            lookup = {'user': user_id}
+        current_app.data.driver.db['userrights'].delete_many(
+            {'$and': [lookup, {'user': {'$nin': users_id}}]})
+        return len(users_id)
 
     def add_resources_realms(self, right, data, custom, resource, resource_list, parents=None):
         """
@@ -246,6 +392,87 @@ def notify_alignak(event=None, parameters=None, notification=None):
 
 
 # Hooks used to check user's rights
+def compile_rights_lookup(method, resource):
+    """Build the lookup filter matching the user rights for a resource
+
+    The filter is reduced to the only needed conditions, thus a user without custom or sub-realm
+    rights for the resource gets a single `_realm $in` condition that may use the `_realm`
+    prefixed indexes. A realm and all its sub-realms are matched with a prefix on the
+    `_realm_path` field.
+
+    :param method: user rights method: get, patch or delete
+    :type method: str
+    :param resource: name of the resource requested by user
+    :type resource: str
+    :return: lookup filter
+    :rtype: dict
+    """
+    realms = g.get('resources_%s' % method, {}).get(resource, [])
+    realms_parents = g.get('resources_%s_parents' % method, {}).get(resource, [])
+    realms_custom = g.get('resources_%s_custom' % method, {}).get(resource, [])
+    if resource in ['realm']:
+        return {'_id': {'$in': realms}}
+
+    users_field = {'get': '_users_read', 'patch': '_users_update',
+                   'delete': '_users_delete'}[method]
+    conditions = []
+    if realms or (not realms_parents and not realms_custom):
+        if '_realm_path' in current_app.config['DOMAIN'][resource]['schema']:
+            conditions.extend(RealmTree.realms_lookups(realms))
+        else:
+            conditions.append({'_realm': {'$in': realms}})
+    if realms_parents:
+        conditions.append({'$and': [{'_sub_realm': True},
+                                    {'_realm': {'$in': realms_parents}}]})
+    if realms_custom:
+        conditions.append({'$and': [{users_field: g.get('users_id', {})},
+                                    {'_realm': {'$in': realms_custom}}]})
+    if len(conditions) == 1:
+        return conditions[0]
+    return {'$or': conditions}
+
+
+def copy_lookup(lookup):
+    """Copy the dictionaries and lists of a lookup filter, the values are not copied
+
+    :param lookup: lookup filter
+    :type lookup: dict or list
+    :return: copied lookup filter
+    :rtype: dict or list
+    """
+    if isinstance(lookup, dict):
+        return {key: copy_lookup(value) for key, value in lookup.items()}
+    if isinstance(lookup, list):
+        return [copy_lookup(value) for value in lookup]
+    return lookup
+
+
+def add_rights_lookup(method, resource, lookup):
+    """Add the lookup filter matching the user rights for a resource to the request lookup
+
+    The filters are compiled once for each resource and stored with the user rights, thus they
+    are used until the user rights are modified. The request gets its own copy of the filter
+    because Eve updates the lookup.
+
+    :param method: user rights method: get, patch or delete
+    :type method: str
+    :param resource: name of the resource requested by user
+    :type resource: str
+    :param lookup: values to get (filter in the request)
+    :type lookup: dict
+    :return: None
+    """
+    rights_lookups = g.get('rights_lookups', {})
+    if (method, resource) not in rights_lookups:
+        rights_lookups[(method, resource)] = compile_rights_lookup(method, resource)
+
+    for key, value in rights_lookups[(method, resource)].items():
+        if key in lookup:
+            lookup.setdefault('$and', []).append({key: copy_lookup(value)})
+        else:
+            lookup[key] = copy_lookup(value)
+
+
 def pre_get(resource, user_request, lookup):
     """Hook before get data. Add filter depend on roles of user
 
@@ -265,27 +492,12 @@ def pre_get(resource, user_request, lookup):
     if resource not in ['user']:
         # Get all resources we can have rights for reading
         resources_get = g.get('resources_get', {})
-        resources_get_parents = g.get('resources_get_parents', {})
         resources_get_custom = g.get('resources_get_custom', {})
-        users_id = g.get('users_id', {})
 
         if resource not in resources_get and resource not in resources_get_custom:
             lookup["_id"] = ''
         else:
-            if resource not in resources_get:
-                resources_get[resource] = []
-            if resource not in resources_get_parents:
-                resources_get_parents[resource] = []
-            if resource not in resources_get_custom:
-                resources_get_custom[resource] = []
-            if resource in ['realm']:
-                lookup['$or'] = [{'_id': {'$in': resources_get[resource]}}]
-            else:
-                lookup['$or'] = [{'_realm': {'$in': resources_get[resource]}},
-                                 {'$and': [{'_sub_realm': True},
-                                           {'_realm': {'$in': resources_get_parents[resource]}}]},
-                                 {'$and': [{'_users_read': users_id},
-                                           {'_realm': {'$in': resources_get_custom[resource]}}]}]
+            add_rights_lookup('get', resource, lookup)
 
 
 def pre_post(resource, user_request):
@@ -334,27 +546,12 @@ def pre_patch(resource, user_request, lookup):
     if resource not in ['user', 'actionacknowledge', 'actiondowntime', 'actionforcecheck']:
         # Get all resources we can have rights for updating
         resources_patch = g.get('resources_patch', {})
-        resources_patch_parents = g.get('resources_patch_parents', {})
         resources_patch_custom = g.get('resources_patch_custom', {})
-        users_id = g.get('users_id', {})
 
         if resource not in resources_patch and resource not in resources_patch_custom:
             abort(401, description='Not allowed to PATCH on this endpoint / resource.')
         else:
-            if resource not in resources_patch:
-                resources_patch[resource] = []
-            if resource not in resources_patch_parents:
-                resources_patch_parents[resource] = []
-            if resource not in resources_patch_custom:
-                resources_patch_custom[resource] = []
-            if resource in ['realm']:
-                lookup['$or'] = [{'_id': {'$in': resources_patch[resource]}}]
-            else:
-                lookup['$or'] = [{'_realm': {'$in': resources_patch[resource]}},
-                                 {'$and': [{'_sub_realm': True},
-                                           {'_realm': {'$in': resources_patch_parents[resource]}}]},
-                                 {'$and': [{'_users_update': users_id},
-                                           {'_realm': {'$in': resources_patch_custom[resource]}}]}]
+            add_rights_lookup('patch', resource, lookup)
 
 
 def pre_delete(resource, user_request, lookup):
@@ -378,29 +575,142 @@ def pre_delete(resource, user_request, lookup):
     if resource not in ['user']:
         # Get all resources we can have rights for delation
         resources_delete = g.get('resources_delete', {})
-        resources_delete_parents = g.get('resources_delete_parents', {})
         resources_delete_custom = g.get('resources_delete_custom', {})
-        users_id = g.get('users_id', {})
 
         if resource not in resources_delete and resource not in resources_delete_custom:
             abort(401, description='Not allowed to DELETE on this endpoint / resource.')
         else:
-            if resource not in resources_delete:
-                resources_delete[resource] = []
-            if resource not in resources_delete_parents:
-                resources_delete_parents[resource] = []
-            if resource not in resources_delete_custom:
-                resources_delete_custom[resource] = []
-            if resource in ['realm']:
-                lookup['$or'] = [{'_id': {'$in': resources_delete[resource]}}]
-            else:
-                lookup['$or'] = [{'_realm': {'$in': resources_delete[resource]}},
-                                 {'$and': [{'_sub_realm': True},
-                                           {'_realm': {
-                                               '$in': resources_delete_parents[resource]}}]},
-                                 {'$and': [{'_users_delete': users_id},
-                                           {'_realm': {
-                                               '$in': resources_delete_custom[resource]}}]}]
+            add_rights_lookup('delete', resource, lookup)
+
+
+# Users rights
+# The user and user restriction role fields used to resolve the user rights
+USER_RIGHTS_FIELDS = ['name', 'token', '_realm', '_sub_realm', 'is_admin', 'back_role_super_admin',
+                      'user', 'realm', 'sub_realm', 'resource', 'crud']
+
+
+def clear_rights_cache(*args):
+    """Hook called when a user or a user restriction role is created, updated or deleted and
+    when all the realms are deleted. The cached users rights are not valid anymore.
+
+    :return: None
+    """
+    # pylint: disable=unused-argument
+    MyTokenAuth.clear_rights_cache()
+
+
+def clear_users_rights(*args):
+    """Hook called when all the realms, users or user restriction roles are deleted. The
+    materialized users rights are not valid anymore, they will be materialized again on next
+    user authentication.
+
+    :return: None
+    """
+    # pylint: disable=unused-argument
+    current_app.data.driver.db['userrights'].delete_many({})
+
+
+def materialize_realms_users_rights(realms):
+    """Materialize again the rights of the users that have a restriction role on one of the
+    realms. It is used when the realms tree is modified: the sub-realms or the parent realms of
+    these realms changed, the rights of the other users are still valid.
+
+    :param realms: list of realms id
+    :type realms: list
+    :return: None
+    """
+    users_id = current_app.data.driver.db['userrestrictrole'].distinct(
+        'user', {'realm': {'$in': list(set(realms))}})
+    for user_id in users_id:
+        MyTokenAuth().materialize_users_rights(user_id)
+    if users_id:
+        MyTokenAuth.clear_rights_cache()
+
+
+def after_insert_realm_rights(items):
+    """Hook after realm insertion. The new realm is a sub-realm of all its parent realms
+
+    :param items: list of realms
+    :type items: list
+    :return: None
+    """
+    realms = []
+    for item in items:
+        realms.extend(RealmTree.ancestors(item['_id']))
+    materialize_realms_users_rights(realms)
+
+
+def after_update_realm_rights(updated, original):
+    """Hook after realm update. When the realm moved in the realms tree, its former and new
+    parent realms, the realm and its sub-realms are concerned. The internal updates of the
+    parent realms children fields are ignored.
+
+    :param updated: modified fields
+    :type updated: dict
+    :param original: original fields
+    :type original: dict
+    :return: None
+    """
+    if g.get('updateRealm', False):
+        return
+    if '_parent' not in updated or updated['_parent'] == original['_parent']:
+        return
+    realms = [original['_id'], original['_parent']]
+    realms.extend(RealmTree.ancestors(original['_parent']))
+    realms.extend(RealmTree.ancestors(original['_id']))
+    realms.extend(RealmTree.descendants(original['_id']))
+    materialize_realms_users_rights(realms)
+
+
+def after_delete_realm_rights(item):
+    """Hook after realm deletion. The realm is not a sub-realm of its parent realms anymore
+
+    :param item: deleted realm
+    :type item: dict
+    :return: None
+    """
+    realms = [item['_id'], item['_parent']]
+    realms.extend(RealmTree.ancestors(item['_parent']))
+    materialize_realms_users_rights(realms)
+
+
+def after_insert_user_rights(items):
+    """Hook after user or user restriction role insertion. Materialize the user rights
+
+    :param items: list of users or user restriction roles
+    :type items: list
+    :return: None
+    """
+    for item in items:
+        MyTokenAuth().materialize_users_rights(item.get('user', item['_id']))
+
+
+def after_update_user_rights(updated, original):
+    """Hook after user or user restriction role update. Materialize the user rights if a field
+    used to resolve them is modified
+
+    :param updated: modified fields
+    :type updated: dict
+    :param original: original fields
+    :type original: dict
+    :return: None
+    """
+    if not [field for field in updated
+            if field in USER_RIGHTS_FIELDS or field.startswith('can_')]:
+        return
+    MyTokenAuth().materialize_users_rights(original.get('user', original['_id']))
+    if 'user' in updated and updated['user'] != original['user']:
+        MyTokenAuth().materialize_users_rights(updated['user'])
+
+
+def after_delete_user_rights(item):
+    """Hook after user or user restriction role deletion. Materialize the user rights
+
+    :param item: deleted user or user restriction role
+    :type item: dict
+    :return: None
+    """
+    MyTokenAuth().materialize_users_rights(item.get('user', item['_id']))
 
 
 # Escalations
@@ -447,18 +757,15 @@ def pre_history_post(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
-    services_drv = current_app.data.driver.db['service']
-    users_drv = current_app.data.driver.db['user']
     for dummy, item in enumerate(items):
         if 'host' in item and item['host']:
-            host = hosts_drv.find_one({'_id': item['host']})
+            host = NameCache.get('host', item['host'])
             if host:
                 item['host_name'] = host['name']
             else:
                 continue
         elif 'host_name' in item and item['host_name']:
-            host = hosts_drv.find_one({'name': item['host_name']})
+            host = NameCache.get_by_name('host', item['host_name'])
             if host:
                 item['host'] = host['_id']
             else:
@@ -466,28 +773,28 @@ def pre_history_post(items):
         else:
             continue
 
-        host = hosts_drv.find_one({'_id': item['host']})
         # Set _realm as host's _realm
         item['_realm'] = host['_realm']
         item['_sub_realm'] = host['_sub_realm']
+        item['_realm_path'] = RealmTree.path(host['_realm'])
 
         # Find service and service_name
         if 'service' in item and item['service']:
-            service = services_drv.find_one({'_id': item['service']})
+            service = NameCache.get('service', item['service'])
             if service:
                 item['service_name'] = service['name']
         elif 'service_name' in item and item['service_name']:
-            service = services_drv.find_one({'host': item['host'], 'name': item['service_name']})
+            service = NameCache.get_by_name('service', item['service_name'], item['host'])
             if service:
                 item['service'] = service['_id']
 
         # Find user and user_name
         if 'user' in item and item['user']:
-            user = users_drv.find_one({'_id': item['user']})
+            user = NameCache.get('user', item['user'])
             if user:
                 item['user_name'] = user['name']
         elif 'user_name' in item and item['user_name']:
-            user = users_drv.find_one({'name': item['user_name']})
+            user = NameCache.get_by_name('user', item['user_name'])
             if user:
                 item['user'] = user['_id']
         else:
@@ -500,135 +807,166 @@ def pre_logcheckresult_post(items):
     """
     Hook before adding new logcheckresult
 
+    The hosts and the services of all the check results are got with one query for the hosts
+    and one query for the services. The last check of each host and service is stored in
+    g.logcheckresult_last_check to update the livestate with the recent check results only.
+
     :param items: logcheckresult fields
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
-    services_drv = current_app.data.driver.db['service']
-    for dummy, item in enumerate(items):
+    host_ids = set()
+    host_names = set()
+    for item in items:
         current_app.logger.debug("LCR - got a check result: %s" % item)
 
         if not item.get('host') and not item.get('host_name'):
             abort(make_response("Posting LCR without host information is not accepted.", 412))
+        if item.get('host'):
+            host_ids.add(item['host'])
+        else:
+            host_names.add(item['host_name'])
 
-        # Find the concerned host
-        if not item.get('host'):
-            host = hosts_drv.find_one({'name': item['host_name']})
-            item['host'] = host['_id']
+    # Find the concerned hosts
+    hosts_by_id = {}
+    hosts_by_name = {}
+    hosts_drv = current_app.data.driver.db['host']
+    for host in Livestate.join('host', list(
+            hosts_drv.find({'$or': [{'_id': {'$in': list(host_ids)}},
+                                    {'name': {'$in': list(host_names)}}]},
+                           {'name': 1, '_realm': 1, 'ls_last_check': 1}))):
+        hosts_by_id[host['_id']] = host
+        hosts_by_name[host['name']] = host
+
+    service_ids = set()
+    service_names = set()
+    for item in items:
+        if item.get('host'):
+            host = hosts_by_id.get(item['host'])
         else:
-            host = hosts_drv.find_one({'_id': item['host']})
-            item['host_name'] = host['name']
-        item_last_check = host['ls_last_check']
+            host = hosts_by_name.get(item['host_name'])
+        if host is None:
+            abort(make_response("Posting LCR for an unknown host is not accepted.", 412))
+        item['host'] = host['_id']
+        item['host_name'] = host['name']
+        # Set _realm as host's _realm
+        item['_realm'] = host['_realm']
+        item['_realm_path'] = RealmTree.path(host['_realm'])
 
+        if item.get('service'):
+            service_ids.add(item['service'])
+        elif item.get('service_name'):
+            service_names.add(item['service_name'])
+
+    # Find the concerned services
+    services_by_id = {}
+    services_by_name = {}
+    if service_ids or service_names:
+        services_drv = current_app.data.driver.db['service']
+        lookup = [{'_id': {'$in': list(service_ids)}}]
+        if service_names:
+            lookup.append({'host': {'$in': list(set([item['host'] for item in items]))},
+                           'name': {'$in': list(service_names)}})
+        for service in Livestate.join('service', list(
+                services_drv.find({'$or': lookup}, {'name': 1, 'host': 1, 'ls_last_check': 1}))):
+            services_by_id[service['_id']] = service
+            services_by_name[(service['host'], service['name'])] = service
+
+    last_check = {}
+    for item in items:
         if not item.get('service') and not item.get('service_name'):
             # This is valid for an host check result
             item['service'] = None
             item['service_name'] = ''
+            element = hosts_by_id[item['host']]
         else:
             # We got a service check result
-            if item.get('service_name') and not item.get('service'):
-                service = services_drv.find_one(
-                    {'host': item['host'], 'name': item['service_name']})
-                item['service'] = service['_id']
-
-            if item.get('service') and not item.get('service_name'):
-                service = services_drv.find_one({'_id': item['service']})
-                item['service_name'] = service['name']
-            item_last_check = service['ls_last_check']
-
-        # Set _realm as host's _realm
-        item['_realm'] = host['_realm']
-
-        g.updateLivestate = True
-        # If the log check result is older than the item last check, do not update the livestate
-        if item_last_check and item['last_check'] < item_last_check:
-            current_app.logger.debug("LCR - will not update the livestate: %s / %s",
-                                     item['last_check'], item_last_check)
-            g.updateLivestate = False
+            if item.get('service'):
+                element = services_by_id.get(item['service'])
+            else:
+                element = services_by_name.get((item['host'], item['service_name']))
+            if element is None:
+                abort(make_response("Posting LCR for an unknown service is not accepted.", 412))
+            item['service'] = element['_id']
+            item['service_name'] = element['name']
+        last_check[(item['host'], item['service'])] = element.get('ls_last_check')
 
         current_app.logger.debug("LCR - inserting an LCR for %s/%s...",
                                  item['host_name'], item['service_name'])
+    g.logcheckresult_last_check = last_check
 
 
 def after_insert_logcheckresult(items):
     """
     Hook after logcheckresult inserted.
 
+    The livestate of the hosts and services is updated with one bulk write for all the check
+    results, see Livestate.apply.
+
     :param items: realm fields
     :type items: dict
     :return: None
     """
+    checks = []
     for dummy, item in enumerate(items):
         current_app.logger.debug("LCR - inserted an LCR for %s/%s...",
                                  item['host_name'], item['service_name'])
         current_app.logger.debug("    -> %s..." % item)
 
-        if g.updateLivestate:
-            # Update the livestate...
-            if item['service']:
-                # ...for a service
-                lookup = {"_id": item['service']}
-                data = {
-                    'ls_state': item['state'],
-                    'ls_state_type': item['state_type'],
-                    'ls_state_id': item['state_id'],
-                    'ls_acknowledged': item['acknowledged'],
-                    'ls_acknowledgement_type': item['acknowledgement_type'],
-                    'ls_downtimed': item['downtimed'],
-                    'ls_last_check': item['last_check'],
-                    'ls_last_state': item['last_state'],
-                    'ls_last_state_type': item['last_state_type'],
-                    'ls_output': item['output'],
-                    'ls_long_output': item['long_output'],
-                    'ls_perf_data': item['perf_data'],
-                    'ls_current_attempt': item['current_attempt'],
-                    'ls_latency': item['latency'],
-                    'ls_execution_time': item['execution_time'],
-                    'ls_passive_check': item['passive_check'],
-                    'ls_state_changed': item.get('state_changed'),
-                    'ls_last_state_changed': item['last_state_changed'],
-                    'ls_last_hard_state_changed': item['last_hard_state_changed'],
-                    'ls_last_time_ok': item['last_time_0'],
-                    'ls_last_time_warning': item['last_time_1'],
-                    'ls_last_time_critical': item['last_time_2'],
-                    'ls_last_time_unknown': item['last_time_3'],
-                    'ls_last_time_unreachable': item['last_time_4']
-                }
-                (pi_a, pi_b, pi_c, pi_d) = patch_internal('service', data, False, False, **lookup)
-            else:
-                # ...for an host
-                lookup = {"_id": item['host']}
-                data = {
-                    'ls_state': item['state'],
-                    'ls_state_type': item['state_type'],
-                    'ls_state_id': item['state_id'],
-                    'ls_acknowledged': item['acknowledged'],
-                    'ls_acknowledgement_type': item['acknowledgement_type'],
-                    'ls_downtimed': item['downtimed'],
-                    'ls_last_check': item['last_check'],
-                    'ls_last_state': item['last_state'],
-                    'ls_last_state_type': item['last_state_type'],
-                    'ls_output': item['output'],
-                    'ls_long_output': item['long_output'],
-                    'ls_perf_data': item['perf_data'],
-                    'ls_current_attempt': item['current_attempt'],
-                    'ls_latency': item['latency'],
-                    'ls_execution_time': item['execution_time'],
-                    'ls_passive_check': item['passive_check'],
-                    'ls_state_changed': item.get('state_changed'),
-                    'ls_last_state_changed': item['last_state_changed'],
-                    'ls_last_hard_state_changed': item['last_hard_state_changed'],
-                    'ls_last_time_up': item['last_time_0'],
-                    'ls_last_time_down': item['last_time_1'],
-
-                    'ls_last_time_unreachable': item['last_time_4']
-                }
-                (pi_a, pi_b, pi_c, pi_d) = patch_internal('host', data, False, False, **lookup)
+        # If the log check result is older than the item last check, do not update the livestate
+        key = (item['host'], item['service'])
+        item_last_check = g.logcheckresult_last_check.get(key)
+        if item_last_check and item['last_check'] < item_last_check:
+            current_app.logger.debug("LCR - will not update the livestate: %s / %s",
+                                     item['last_check'], item_last_check)
+            continue
+        g.logcheckresult_last_check[key] = item['last_check']
 
-            current_app.logger.debug("LCR - updated the livestate: %s, %s, %s, %s",
-                                     pi_a, pi_b, pi_c, pi_d)
+        # Update the livestate...
+        data = {
+            'ls_state': item['state'],
+            'ls_state_type': item['state_type'],
+            'ls_state_id': item['state_id'],
+            'ls_acknowledged': item['acknowledged'],
+            'ls_acknowledgement_type': item['acknowledgement_type'],
+            'ls_downtimed': item['downtimed'],
+            'ls_last_check': item['last_check'],
+            'ls_last_state': item['last_state'],
+            'ls_last_state_type': item['last_state_type'],
+            'ls_output': item['output'],
+            'ls_long_output': item['long_output'],
+            'ls_perf_data': item['perf_data'],
+            'ls_current_attempt': item['current_attempt'],
+            'ls_latency': item['latency'],
+            'ls_execution_time': item['execution_time'],
+            'ls_passive_check': item['passive_check'],
+            'ls_state_changed': item.get('state_changed'),
+            'ls_last_state_changed': item['last_state_changed'],
+            'ls_last_hard_state_changed': item['last_hard_state_changed'],
+            'ls_last_time_unreachable': item['last_time_4']
+        }
+        if item['service']:
+            # ...for a service
+            data.update({
+                'ls_last_time_ok': item['last_time_0'],
+                'ls_last_time_warning': item['last_time_1'],
+                'ls_last_time_critical': item['last_time_2'],
+                'ls_last_time_unknown': item['last_time_3']
+            })
+            checks.append(('service', item['service'], item['host'], data))
+        else:
+            # ...for an host
+            data.update({
+                'ls_last_time_up': item['last_time_0'],
+                'ls_last_time_down': item['last_time_1']
+            })
+            checks.append(('host', item['host'], item['host'], data))
 
+    if checks:
+        count = Livestate.apply(checks)
+        current_app.logger.debug("LCR - updated the livestate of %d elements", count)
+
+    for dummy, item in enumerate(items):
         # Create an history event for the new logcheckresult
         message = "%s[%s] (%s/%s): %s" % (item['state'], item['state_type'],
                                           item['acknowledged'], item['downtimed'],
@@ -643,7 +981,7 @@ def after_insert_logcheckresult(items):
             'message': message,
             'logcheckresult': item['_id']
         }
-        post_internal("history", data, True)
+        HistoryWriter.add(data)
 
 
 # Actions
@@ -679,12 +1017,12 @@ def pre_actionacknowledge_post(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
     for dummy, item in enumerate(items):
         # Set _realm as host's _realm
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = NameCache.get('host', item['host'])
         item['_realm'] = host['_realm']
         item['_sub_realm'] = host['_sub_realm']
+        item['_realm_path'] = RealmTree.path(host['_realm'])
 
 
 def after_insert_actionacknowledge(items):
@@ -695,14 +1033,12 @@ def after_insert_actionacknowledge(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
-    services_drv = current_app.data.driver.db['service']
     for dummy, item in enumerate(items):
         # Get concerned host
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = NameCache.get('host', item['host'])
         service_name = ''
         if item['service']:
-            service = services_drv.find_one({'_id': item['service']})
+            service = NameCache.get('service', item['service'])
             service_name = service['name']
 
         # Create an history event for the new acknowledge
@@ -715,7 +1051,7 @@ def after_insert_actionacknowledge(items):
             'type': 'ack.' + item['action'],
             'message': item['comment']
         }
-        post_internal("history", data, True)
+        HistoryWriter.add(data)
 
 
 def after_update_actionacknowledge(updated, original):
@@ -729,14 +1065,11 @@ def after_update_actionacknowledge(updated, original):
     :return: None
     """
     if 'processed' in updated and updated['processed']:
-        hosts_drv = current_app.data.driver.db['host']
-        services_drv = current_app.data.driver.db['service']
-
         # Get concerned host
-        host = hosts_drv.find_one({'_id': original['host']})
+        host = NameCache.get('host', original['host'])
         service_name = ''
         if original['service']:
-            service = services_drv.find_one({'_id': original['service']})
+            service = NameCache.get('service', original['service'])
             service_name = service['name']
 
         # Create an history event for the changed acknowledge
@@ -751,7 +1084,7 @@ def after_update_actionacknowledge(updated, original):
             'content': {
             }
         }
-        post_internal("history", data, True)
+        HistoryWriter.add(data)
 
 
 # Actions downtime
@@ -763,12 +1096,12 @@ def pre_actiondowntime_post(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
     for dummy, item in enumerate(items):
         # Set _realm as host's _realm
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = NameCache.get('host', item['host'])
         item['_realm'] = host['_realm']
         item['_sub_realm'] = host['_sub_realm']
+        item['_realm_path'] = RealmTree.path(host['_realm'])
 
 
 def after_insert_actiondowntime(items):
@@ -779,14 +1112,12 @@ def after_insert_actiondowntime(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
-    services_drv = current_app.data.driver.db['service']
     for dummy, item in enumerate(items):
         # Get concerned host
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = NameCache.get('host', item['host'])
         service_name = ''
         if item['service']:
-            service = services_drv.find_one({'_id': item['service']})
+            service = NameCache.get('service', item['service'])
             service_name = service['name']
 
         # Create an history event for the new downtime
@@ -799,7 +1130,7 @@ def after_insert_actiondowntime(items):
             'type': 'downtime.' + item['action'],
             'message': item['comment']
         }
-        post_internal("history", data, True)
+        HistoryWriter.add(data)
 
 
 def after_update_actiondowntime(updated, original):
@@ -813,14 +1144,11 @@ def after_update_actiondowntime(updated, original):
     :return: None
     """
     if 'processed' in updated and updated['processed']:
-        hosts_drv = current_app.data.driver.db['host']
-        services_drv = current_app.data.driver.db['service']
-
         # Get concerned host
-        host = hosts_drv.find_one({'_id': original['host']})
+        host = NameCache.get('host', original['host'])
         service_name = ''
         if original['service']:
-            service = services_drv.find_one({'_id': original['service']})
+            service = NameCache.get('service', original['service'])
             service_name = service['name']
 
         # Create an history event for the changed downtime
@@ -835,7 +1163,7 @@ def after_update_actiondowntime(updated, original):
             'content': {
             }
         }
-        post_internal("history", data, True)
+        HistoryWriter.add(data)
 
 
 # Actions forcecheck
@@ -847,12 +1175,12 @@ def pre_actionforcecheck_post(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
     for dummy, item in enumerate(items):
         # Set _realm as host's _realm
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = NameCache.get('host', item['host'])
         item['_realm'] = host['_realm']
         item['_sub_realm'] = host['_sub_realm']
+        item['_realm_path'] = RealmTree.path(host['_realm'])
 
 
 def after_insert_actionforcecheck(items):
@@ -863,14 +1191,12 @@ def after_insert_actionforcecheck(items):
     :type items: dict
     :return: None
     """
-    hosts_drv = current_app.data.driver.db['host']
-    services_drv = current_app.data.driver.db['service']
     for dummy, item in enumerate(items):
         # Get concerned host
-        host = hosts_drv.find_one({'_id': item['host']})
+        host = NameCache.get('host', item['host'])
         service_name = ''
         if item['service']:
-            service = services_drv.find_one({'_id': item['service']})
+            service = NameCache.get('service', item['service'])
             service_name = service['name']
 
         # Create an history event for the new forcecheck
@@ -883,7 +1209,7 @@ def after_insert_actionforcecheck(items):
             'type': 'check.request',
             'message': item['comment']
         }
-        post_internal("history", data, True)
+        HistoryWriter.add(data)
 
 
 def after_update_actionforcecheck(updated, original):
@@ -897,14 +1223,11 @@ def after_update_actionforcecheck(updated, original):
     :return: None
     """
     if 'processed' in updated and updated['processed']:
-        hosts_drv = current_app.data.driver.db['host']
-        services_drv = current_app.data.driver.db['service']
-
         # Get concerned host
-        host = hosts_drv.find_one({'_id': original['host']})
+        host = NameCache.get('host', original['host'])
         service_name = ''
         if original['service']:
-            service = services_drv.find_one({'_id': original['service']})
+            service = NameCache.get('service', original['service'])
             service_name = service['name']
 
         # Create an history event for the changed forcecheck
@@ -919,7 +1242,7 @@ def after_update_actionforcecheck(updated, original):
             'content': {
             }
         }
-        post_internal("history", data, True)
+        HistoryWriter.add(data)
 
 
 # Hosts groups
@@ -1153,7 +1476,6 @@ def pre_timeseries_post(items):
     """
     graphite_drv = current_app.data.driver.db['graphite']
     influxdb_drv = current_app.data.driver.db['influxdb']
-    realm_drv = current_app.data.driver.db['realm']
     for dummy, item in enumerate(items):
         if 'grafana' in item and item['grafana'] is not None:
             # search graphite with grafana id in this realm
@@ -1165,13 +1487,13 @@ def pre_timeseries_post(items):
                     {'_realm': item['_realm'], 'grafana': item['grafana']}) > 0:
                 abort(make_response("A timeserie is yet attached to grafana in this realm", 412))
             # get parent realms
-            tsrealms = realm_drv.find_one({'_id': item['_realm']})
+            parent_realms = RealmTree.ancestors(item['_realm'])
             if graphite_drv.count(
-                    {'_realm': {'$in': tsrealms['_tree_parents']}, 'grafana': item['grafana'],
+                    {'_realm': {'$in': parent_realms}, 'grafana': item['grafana'],
                      '_sub_realm': True}) > 0:
                 abort(make_response("A timeserie is yet attached to grafana in parent realm", 412))
             if influxdb_drv.count(
-                    {'_realm': {'$in': tsrealms['_tree_parents']}, 'grafana': item['grafana'],
+                    {'_realm': {'$in': parent_realms}, 'grafana': item['grafana'],
                      '_sub_realm': True}) > 0:
                 abort(make_response("A timeserie is yet attached to grafana in parent realm", 412))
 
@@ -1261,6 +1583,7 @@ def after_insert_realm(items):
     :return: None
     """
     # pylint: disable=unused-argument
+    RealmTree.invalidate()
     for dummy, item in enumerate(items):
         # update _children fields on all parents
         realmsdrv = current_app.data.driver.db['realm']
@@ -1289,6 +1612,15 @@ def after_update_realm(updated, original):
     :type original: dict
     :return: None
     """
+    RealmTree.invalidate()
+    if '_parent' in updated and updated['_parent'] != original['_parent']:
+        # The realm moved in the tree, update the path of its elements and sub-realms elements
+        RealmTree.update_paths([original['_id']] + RealmTree.descendants(original['_id']))
+    if '_parent' in updated or '_all_children' in updated:
+        # The realm sub-realms changed, update the live synthesis sub-tree counters once at the
+        # end of the request, the parent realms are also updated
+        Livesynthesis.schedule_rollup()
+
     if g.updateRealm:
         if '_all_children' in updated and updated['_all_children'] != original['_all_children']:
             s = set(original['_all_children'])
@@ -1338,6 +1670,7 @@ def after_delete_realm(item):
     :type item: dict
     :return: None
     """
+    RealmTree.invalidate()
     realmsdrv = current_app.data.driver.db['realm']
     if item['_tree_parents']:
         parent = realmsdrv.find_one({'_id': item['_tree_parents'][-1]})
@@ -1363,6 +1696,7 @@ def after_delete_resource_realm():
 
     :return: None
     """
+    RealmTree.invalidate()
     realmsdrv = current_app.data.driver.db['realm']
     realmall = realmsdrv.find_one({'_level': 0})
     lookup = {"_id": realmall['_id']}
@@ -1386,10 +1720,15 @@ def pre_delete_host(item):
     current_app.logger.debug("Deleting host: %s", item['name'])
     services_drv = current_app.data.driver.db['service']
     services = services_drv.find({'host': item['_id']})
-    for service in services:
-        current_app.logger.debug("Deleting service: %s/%s", item['name'], service['name'])
-        lookup = {"_id": service['_id']}
-        deleteitem_internal('service', False, False, **lookup)
+    # Update the live synthesis once for all the host services
+    Livesynthesis.start_batch()
+    try:
+        for service in services:
+            current_app.logger.debug("Deleting service: %s/%s", item['name'], service['name'])
+            lookup = {"_id": service['_id']}
+            deleteitem_internal('service', False, False, **lookup)
+    finally:
+        Livesynthesis.end_batch()
 
 
 def after_delete_host(item):
@@ -1492,53 +1831,14 @@ def pre_host_patch(updates, original):
         # We updated some host services live state, compute the new overall state
         if ('_overall_state_id' in updates and updates['_overall_state_id'] == -1) or \
                 ('ls_state_type' in updates and updates['ls_state_type'] == 'HARD'):
-
-            overall_state = 0
-
-            active_checked = original['active_checks_enabled']
-            if 'ls_active_checked' in updates:
-                active_checked = updates['active_checks_enabled']
-
-            passive_checked = original['passive_checks_enabled']
-            if 'ls_passive_checked' in updates:
-                passive_checked = updates['passive_checks_enabled']
-
-            acknowledged = original['ls_acknowledged']
-            if 'ls_acknowledged' in updates:
-                acknowledged = updates['ls_acknowledged']
-
-            downtimed = original['ls_downtimed']
-            if 'ls_downtimed' in updates:
-                downtimed = updates['ls_downtimed']
-
-            state = original['ls_state']
-            if 'ls_state' in updates:
-                state = updates['ls_state']
-            state = state.upper()
-
-            if acknowledged:
-                overall_state = 1
-            elif downtimed:
-                overall_state = 2
-            else:
-                if state == 'UNREACHABLE':
-                    overall_state = 3
-                elif state == 'DOWN':
-                    overall_state = 4
-
-            if not active_checked and not passive_checked:
-                overall_state = 5
-            else:
-                if overall_state <= 2:
-                    services_drv = current_app.data.driver.db['service']
-                    services = services_drv.find({'host': original['_id']})
-                    for service in services:
-                        # Only for HARD states and monitored services
-                        if service['ls_state_type'] == 'HARD' and service['_overall_state_id'] < 5:
-                            overall_state = max(overall_state, service['_overall_state_id'])
+            host = dict(original)
+            for key in ['ls_state', 'ls_acknowledged', 'ls_downtimed']:
+                if key in updates:
+                    host[key] = updates[key]
 
             # Get the host services overall states
-            updates['_overall_state_id'] = overall_state
+            updates['_overall_state_id'] = Livestate.host_overall_state(
+                host, original.get('_services_overall', {}))
 
         # Only some live state fields, do not change _updated field
         del updates['_updated']
@@ -1638,46 +1938,11 @@ def pre_service_patch(updates, original):
         if 'ls_state_type' in updates and updates['ls_state_type'] == 'HARD':
             # We updated the service live state, compute the new overall state
             if 'ls_state' in updates or 'ls_acknowledged' in updates or 'ls_downtimed' in updates:
-                overall_state = 0
-
-                active_checked = original['active_checks_enabled']
-                if 'ls_active_checked' in updates:
-                    active_checked = updates['active_checks_enabled']
-
-                passive_checked = original['passive_checks_enabled']
-                if 'ls_passive_checked' in updates:
-                    passive_checked = updates['passive_checks_enabled']
-
-                acknowledged = original['ls_acknowledged']
-                if 'ls_acknowledged' in updates:
-                    acknowledged = updates['ls_acknowledged']
-
-                downtimed = original['ls_downtimed']
-                if 'ls_downtimed' in updates:
-                    downtimed = updates['ls_downtimed']
-
-                state = original['ls_state']
-                if 'ls_state' in updates:
-                    state = updates['ls_state']
-                state = state.upper()
-
-                if not active_checked and not passive_checked:
-                    overall_state = 5
-                elif acknowledged:
-                    overall_state = 1
-                elif downtimed:
-                    overall_state = 2
-                else:
-                    if state == 'WARNING':
-                        overall_state = 3
-                    elif state == 'CRITICAL':
-                        overall_state = 4
-                    elif state == 'UNKNOWN':
-                        overall_state = 3
-                    elif state == 'UNREACHABLE':
-                        overall_state = 4
-
-                updates['_overall_state_id'] = overall_state
+                service = dict(original)
+                for key in ['ls_state', 'ls_acknowledged', 'ls_downtimed']:
+                    if key in updates:
+                        service[key] = updates[key]
+                updates['_overall_state_id'] = Livestate.service_overall_state(service)
 
         # Only updated some live state fields, do not change _updated field
         del updates['_updated']
@@ -1693,6 +1958,9 @@ def after_insert_service(items):
     """
     etags = {}
     for dummy, item in enumerate(items):
+        # Count the new service in its host services overall states
+        Livestate.update_services_overall({}, item)
+
         overall_state = 0
 
         active_checked = item['active_checks_enabled']
@@ -1757,10 +2025,13 @@ def after_updated_service(updated, original):
     :type original: dict
     :return: None
     """
+    if g.get('livestate_bulk', False):
+        # The live state bulk update already updated the host
+        return
+    Livestate.update_services_overall(original, updated)
     if '_overall_state_id' in updated:
-        # Service overall was updated, we should update its host overall state
-        lookup = {"_id": original['host']}
-        patch_internal('host', {"_overall_state_id": -1}, False, False, **lookup)
+        # Service overall was updated, its host overall state is updated at the end of the request
+        Livestate.update_host_overall(original['host'])
 
 
 # Users
@@ -1786,7 +2057,8 @@ def pre_user_patch(updates, original):
     Hook before update.
 
     When updating user:
-    - hash the backend password of the user if one tries to change it
+    - hash the backend password of the user if one tries to change it, and revoke the user
+    session tokens
     - generate the user token if a token (even empty) is provided
 
     If only the user preferences are updated do not change the _updated field (see comment in the
@@ -1801,6 +2073,8 @@ def pre_user_patch(updates, original):
     # pylint: disable=unused-argument
     if 'password' in updates:
         updates['password'] = generate_password_hash(updates['password'])
+        # The user session tokens are not valid anymore
+        SessionToken.revoke_user(original['_id'])
     if 'token' in updates:
         updates['token'] = generate_token()
     # Special case, we don't want update _updated field when update ui_preferences field
@@ -1980,6 +2254,72 @@ def pre_post_alias(resource_name, items):
                 items[key]['alias'] = items[key]['name']
 
 
+def pre_post_realm_path(resource_name, items):
+    """
+    Hook before insert.
+    Set the `_realm_path` field with the path of the element realm
+
+    :param resource_name: name of the resource
+    :type resource_name: str
+    :param items: list of items (list because can use bulk)
+    :type items: list
+    :return: None
+    """
+    if '_realm_path' not in current_app.config['DOMAIN'][resource_name]['schema']:
+        return
+    for item in items:
+        if '_realm' in item:
+            item['_realm_path'] = RealmTree.path(item['_realm'])
+
+
+def pre_patch_realm_path(resource_name, updates, original):
+    """
+    Hook before update.
+    Set the `_realm_path` field with the path of the element realm
+
+    :param resource_name: name of the resource
+    :type resource_name: str
+    :param updates: modified fields
+    :type updates: dict
+    :param original: original fields
+    :type original: dict
+    :return: None
+    """
+    if '_realm_path' not in current_app.config['DOMAIN'][resource_name]['schema']:
+        return
+    if '_realm' in updates or '_realm_path' in updates:
+        updates['_realm_path'] = RealmTree.path(updates.get('_realm', original['_realm']))
+
+
+def defer_request_writes():
+    """
+    Buffer some modifications made by the hooks during a backend request, they are written at
+    the end of the request by flush_request. The cron routes and the scheduler jobs run in their
+    own request context where this function is not called, their modifications are written
+    immediately.
+
+    :return: None
+    """
+    g.deferred_writes = True
+
+
+def flush_request(response):
+    """
+    Write the modifications buffered during the request, at the end of the request: the hosts
+    overall states first because they may add history events, the realms live synthesis
+    sub-trees, then the history events
+
+    :param response: request response
+    :type response: flask.Response
+    :return: the response
+    :rtype: flask.Response
+    """
+    Livestate.flush()
+    Livesynthesis.flush_rollup()
+    HistoryWriter.flush()
+    return response
+
+
 def generate_token():
     """
     Generate a user token
@@ -2083,6 +2423,38 @@ settings['JOBS'] = []
 
 settings['ALIGNAK_URL'] = ''
 
+# Users rights are cached for some seconds, 0 to disable the cache
+settings['RIGHTS_CACHE_TTL'] = 60
+# Realms tree index is rebuilt at least every some seconds
+settings['REALMS_TREE_TTL'] = 60
+# Hosts, services and users names cache: maximum number of elements, 0 to disable the cache
+settings['NAME_CACHE_SIZE'] = 10000
+# Hosts, services and users names are cached for some seconds
+settings['NAME_CACHE_TTL'] = 60
+# Session tokens are signed with this secret, empty to disable the session tokens
+settings['SESSION_TOKEN_SECRET'] = ''
+# Session tokens are valid for some seconds
+settings['SESSION_TOKEN_TTL'] = 3600
+# Live synthesis counters are written every some seconds, 0 to write them on each modification
+settings['LIVESYNTHESIS_FLUSH_PERIOD'] = 0
+# Live synthesis counters are written when some modifications are pending
+settings['LIVESYNTHESIS_FLUSH_COUNT'] = 1000
+# Live synthesis recalculations are grouped every some seconds, 0 to recalculate them in the
+# request (once per realm for a bulk insert or a host deletion)
+settings['LIVESYNTHESIS_RECALCULATE_PERIOD'] = 0
+# Live synthesis history tiers: [resolution, retention] in seconds, empty to disable the tiers
+settings['LIVESYNTHESIS_HISTORY_TIERS'] = []
+# Live synthesis counters are also maintained for the hosts groups and services groups
+settings['LIVESYNTHESIS_GROUPS'] = False
+# Live synthesis counters of some realms are checked every some seconds, 0 to disable
+settings['LIVESYNTHESIS_CHECK_PERIOD'] = 0
+# Number of realms which live synthesis counters are checked each time
+settings['LIVESYNTHESIS_CHECK_REALMS'] = 10
+# Live synthesis counters are updated by the backend hooks or by a change stream consumer
+settings['LIVESYNTHESIS_ENGINE'] = 'hooks'
+# Hosts and services live state of each check result stored in separate collections
+settings['LIVESTATE_COLLECTIONS'] = False
+
 # Read configuration file to update/complete the configuration
 configuration_file = get_settings(settings)
 print("Application configuration file: %s" % configuration_file)
@@ -2140,6 +2512,36 @@ if settings['SCHEDULER_LIVESYNTHESIS_HISTORY'] > 0:
             'seconds': settings['SCHEDULER_LIVESYNTHESIS_HISTORY']
         }
     )
+if settings['LIVESYNTHESIS_FLUSH_PERIOD'] > 0:
+    jobs.append(
+        {
+            'id': 'cron_livesynthesis_flush',
+            'func': 'alignak_backend.scheduler:cron_livesynthesis_flush',
+            'args': (),
+            'trigger': 'interval',
+            'seconds': settings['LIVESYNTHESIS_FLUSH_PERIOD']
+        }
+    )
+if settings['LIVESYNTHESIS_RECALCULATE_PERIOD'] > 0:
+    jobs.append(
+        {
+            'id': 'cron_livesynthesis_scheduled',
+            'func': 'alignak_backend.scheduler:cron_livesynthesis_scheduled',
+            'args': (),
+            'trigger': 'interval',
+            'seconds': settings['LIVESYNTHESIS_RECALCULATE_PERIOD']
+        }
+    )
+if settings['LIVESYNTHESIS_CHECK_PERIOD'] > 0:
+    jobs.append(
+        {
+            'id': 'cron_livesynthesis_check',
+            'func': 'alignak_backend.scheduler:cron_livesynthesis_check',
+            'args': (),
+            'trigger': 'interval',
+            'seconds': settings['LIVESYNTHESIS_CHECK_PERIOD']
+        }
+    )
 if settings['SCHEDULER_ALIGNAK_ACTIVE']:
     jobs.append(
         {
@@ -2256,6 +2658,10 @@ app.on_insert_user += pre_user_post
 # Manage alias when insert
 app.on_insert += pre_post_alias
 
+# Manage realm path
+app.on_insert += pre_post_realm_path
+app.on_update += pre_patch_realm_path
+
 app.on_update_user += pre_user_patch
 app.on_inserted_user += after_insert_user
 app.on_inserted_host += after_insert_host
@@ -2265,6 +2671,15 @@ app.on_post_POST_service += update_etag
 app.on_update_host += pre_host_patch
 app.on_update_service += pre_service_patch
 app.on_updated_service += after_updated_service
+app.on_deleted_item_service += Livestate.on_deleted_service
+app.on_deleted_resource_service += Livestate.on_deleted_resource_service
+if settings['LIVESTATE_COLLECTIONS']:
+    app.on_inserted += Livestate.on_inserted
+    app.on_fetched_resource += Livestate.on_fetched_resource
+    app.on_fetched_item += Livestate.on_fetched_item
+    app.on_updated += Livestate.on_updated
+    app.on_deleted_item += Livestate.on_deleted_item
+    app.on_deleted_resource += Livestate.on_deleted_resource
 app.on_delete_item_host += pre_delete_host
 app.on_deleted_item_host += after_delete_host
 app.on_delete_item_realm += pre_delete_realm
@@ -2440,17 +2855,44 @@ with app.test_request_context():
         app.logger.info(
             "===============================================================================")
 
-    # Live synthesis management
-    app.on_inserted_host += Livesynthesis.on_inserted_host
-    app.on_inserted_service += Livesynthesis.on_inserted_service
-    app.on_updated_host += Livesynthesis.on_updated_host
-    app.on_updated_service += Livesynthesis.on_updated_service
-    app.on_deleted_item_host += Livesynthesis.on_deleted_host
-    app.on_deleted_item_service += Livesynthesis.on_deleted_service
-    app.on_deleted_resource_host += Livesynthesis.on_deleted_resource_host
-    app.on_deleted_resource_host += Livesynthesis.on_deleted_resource_service
+    # Live synthesis management, updated by the change stream consumer if configured
+    if settings['LIVESYNTHESIS_ENGINE'] != 'changestream':
+        app.on_inserted_host += Livesynthesis.on_inserted_host
+        app.on_inserted_service += Livesynthesis.on_inserted_service
+        app.on_updated_host += Livesynthesis.on_updated_host
+        app.on_updated_service += Livesynthesis.on_updated_service
+        app.on_deleted_item_host += Livesynthesis.on_deleted_host
+        app.on_deleted_item_service += Livesynthesis.on_deleted_service
+        app.on_deleted_resource_host += Livesynthesis.on_deleted_resource_host
+        app.on_deleted_resource_host += Livesynthesis.on_deleted_resource_service
     app.on_fetched_item_livesynthesis += Livesynthesis.on_fetched_item_history
 
+    if settings['LIVESYNTHESIS_GROUPS']:
+        Livesynthesis.end_batch_handlers.append(Groupsynthesis.end_batch)
+        app.on_updated_host += Groupsynthesis.on_updated_host
+        app.on_updated_service += Groupsynthesis.on_updated_service
+        app.on_deleted_item_host += Groupsynthesis.on_deleted_host
+        app.on_deleted_item_service += Groupsynthesis.on_deleted_service
+        app.on_inserted_hostgroup += Groupsynthesis.on_changed_hostgroup
+        app.on_updated_hostgroup += Groupsynthesis.on_changed_hostgroup
+        app.on_deleted_item_hostgroup += Groupsynthesis.on_changed_hostgroup
+        app.on_deleted_resource_hostgroup += Groupsynthesis.on_changed_hostgroup
+        app.on_inserted_servicegroup += Groupsynthesis.on_changed_servicegroup
+        app.on_updated_servicegroup += Groupsynthesis.on_changed_servicegroup
+        app.on_deleted_item_servicegroup += Groupsynthesis.on_changed_servicegroup
+        app.on_deleted_resource_servicegroup += Groupsynthesis.on_changed_servicegroup
+
+    # Names cache management
+    app.on_updated_host += NameCache.on_updated_host
+    app.on_updated_service += NameCache.on_updated_service
+    app.on_updated_user += NameCache.on_updated_user
+    app.on_deleted_item_host += NameCache.on_deleted_host
+    app.on_deleted_item_service += NameCache.on_deleted_service
+    app.on_deleted_item_user += NameCache.on_deleted_user
+    app.on_deleted_resource_host += NameCache.on_deleted_resource_host
+    app.on_deleted_resource_service += NameCache.on_deleted_resource_service
+    app.on_deleted_resource_user += NameCache.on_deleted_resource_user
+
     # Templates management
     app.on_pre_POST_host += Template.pre_post_host
     app.on_update_host += Template.on_update_host
@@ -2468,8 +2910,20 @@ with app.test_request_context():
     app.on_update_user += Template.on_update_user
     app.on_updated_user += Template.on_updated_user
 
-    # Initial livesynthesis
-    Livesynthesis.recalculate()
+    # Set the realm path of the elements created before the realm path was introduced
+    RealmTree.update_paths()
+
+    # Count the services overall states of the hosts that were not yet counted
+    Livestate.recalculate_services_overall(missing=True)
+
+    # Move the live state fields if LIVESTATE_COLLECTIONS was changed
+    Livestate.migrate()
+
+    # Initial livesynthesis, the change stream consumer recalculates it when it starts
+    if settings['LIVESYNTHESIS_ENGINE'] != 'changestream':
+        Livesynthesis.recalculate()
+    if settings['LIVESYNTHESIS_GROUPS']:
+        Groupsynthesis.recalculate()
 
 # hooks post-init
 app.on_insert_realm += pre_realm_post
@@ -2493,6 +2947,8 @@ app.on_inserted_actionforcecheck += after_insert_actionforcecheck
 app.on_updated_actionforcecheck += after_update_actionforcecheck
 
 app.on_insert_history += pre_history_post
+app.before_request(defer_request_writes)
+app.after_request(flush_request)
 
 app.on_insert_hostescalation += pre_hostescalation_post
 app.on_insert_serviceescalation += pre_serviceescalation_post
@@ -2506,6 +2962,31 @@ app.on_delete_item += keep_default_items_item
 
 app.on_insert_service += pre_service_post
 
+# users rights materialization
+app.on_inserted_user += after_insert_user_rights
+app.on_updated_user += after_update_user_rights
+app.on_deleted_item_user += after_delete_user_rights
+app.on_deleted_resource_user += clear_users_rights
+app.on_inserted_userrestrictrole += after_insert_user_rights
+app.on_updated_userrestrictrole += after_update_user_rights
+app.on_deleted_item_userrestrictrole += after_delete_user_rights
+app.on_deleted_resource_userrestrictrole += clear_users_rights
+app.on_inserted_realm += after_insert_realm_rights
+app.on_updated_realm += after_update_realm_rights
+app.on_deleted_item_realm += after_delete_realm_rights
+app.on_deleted_resource_realm += clear_users_rights
+
+# users rights cache invalidation
+app.on_inserted_user += clear_rights_cache
+app.on_updated_user += clear_rights_cache
+app.on_deleted_item_user += clear_rights_cache
+app.on_deleted_resource_user += clear_rights_cache
+app.on_inserted_userrestrictrole += clear_rights_cache
+app.on_updated_userrestrictrole += clear_rights_cache
+app.on_deleted_item_userrestrictrole += clear_rights_cache
+app.on_deleted_resource_userrestrictrole += clear_rights_cache
+app.on_deleted_resource_realm += clear_rights_cache
+
 # hook for tree resources
 app.on_fetched_resource += on_fetched_resource_tree
 app.on_fetched_item += on_fetched_item_tree
@@ -2518,6 +2999,24 @@ if settings['JOBS']:
         scheduler.start()
 
 
+def flush_livesynthesis():
+    """
+    Write the pending live synthesis counters modifications when the process exits
+
+    :return: None
+    """
+    with app.test_request_context():
+        Livesynthesis.flush(send_metrics=True)
+        if Groupsynthesis.enabled():
+            Groupsynthesis.flush()
+
+
+# Flush the live synthesis write-behind on shutdown / reload (uWSGI runs the atexit functions
+# when a worker exits)
+if settings['LIVESYNTHESIS_FLUSH_PERIOD'] > 0:
+    atexit.register(flush_livesynthesis)
+
+
 @app.route("/login", methods=['POST'])
 def login_app():  # pylint: disable=inconsistent-return-statements
     """
@@ -2547,14 +3046,28 @@ def login_app():  # pylint: disable=inconsistent-return-statements
         user = _users.find_one({'name': posted_data['username']})
         if user:
             if check_password_hash(user['password'], posted_data['password']):
+                if posted_data.get('action') == 'session' and SessionToken.enabled():
+                    user_rights = app.data.driver.db['userrights'].find_one({'user': user['_id']})
+                    if user_rights:
+                        rights = user_rights['rights']
+                    else:
+                        rights = MyTokenAuth().materialize_user_rights(user)
+                    token = SessionToken.generate(user['_id'], rights.get('_version', 0))
+                    return jsonify({'token': token})
                 if 'action' in posted_data:
                     if posted_data['action'] == 'generate' or not user['token']:
                         token = generate_token()
                         _users.update({'_id': user['_id']}, {'$set': {'token': token}})
+                        app.data.driver.db['userrights'].update_one(
+                            {'user': user['_id']}, {'$set': {'token': token}})
+                        # The former token is not valid anymore
+                        MyTokenAuth.clear_rights_cache()
                         return jsonify({'token': token})
                 elif not user['token']:
                     token = generate_token()
                     _users.update({'_id': user['_id']}, {'$set': {'token': token}})
+                    app.data.driver.db['userrights'].update_one(
+                        {'user': user['_id']}, {'$set': {'token': token}})
                     return jsonify({'token': token})
                 return jsonify({'token': user['token']})
         abort(401, description='Please provide proper credentials')
@@ -2564,7 +3077,18 @@ def login_app():  # pylint: disable=inconsistent-return-statements
 def logout_app():
     """
     Log out from backend
-    """
+
+    If a session token is provided, it is revoked
+    """
+    token = None
+    if request.authorization:
+        token = request.authorization.username
+    elif request.headers.get('Authorization', '').lower().startswith('bearer'):
+        token = request.headers.get('Authorization').strip()[6:].strip()
+    if token and SessionToken.is_session_token(token):
+        session = SessionToken.decode(token)
+        if session:
+            SessionToken.revoke(session)
     return 'ok'
 
 
@@ -2587,6 +3111,115 @@ def backend_version():
     return jsonify(my_version)
 
 
+@app.route("/livestate", methods=['POST'])
+def livestate_bulk():
+    # pylint: disable=too-many-locals
+    """
+    Update the live state of some hosts and services
+
+    Posted data: list of live state updates, each one with the identifier of an host (host) or
+    of a service (service) and some live state fields (ls_* and _overall_state_id, -1 to
+    recompute the host overall state), eg:
+    [{"host": "<host id>", "ls_state": "DOWN", "ls_state_type": "HARD"},
+     {"service": "<service id>", "ls_state": "CRITICAL", "ls_output": "Connection refused"}]
+
+    Only the live state fields are accepted and validated, no etag is required. The hosts and
+    services are updated with one bulk write for each collection, their overall states and the
+    live synthesis are updated as for a PATCH, see Livestate.apply. The user must be allowed to
+    update the hosts and services.
+
+    Return the status of each update, in the posted order
+
+    :return: See upper comment
+    :rtype: dict
+    """
+    if not app.auth.authorized([], 'host', 'PATCH'):
+        return app.auth.authenticate()
+
+    items = request.get_json(silent=True)
+    if isinstance(items, dict):
+        items = [items]
+    if not isinstance(items, list):
+        abort(make_response("Posted data must be a list of live state updates.", 400))
+
+    pending = []
+    ids = {'host': set(), 'service': set()}
+    for item in items:
+        result = {'_status': 'ERR'}
+        pending.append((result, item))
+        if not isinstance(item, dict) or ('host' in item) == ('service' in item):
+            result['_issues'] = {'host': 'an host or a service identifier is required'}
+            continue
+        resource = 'service' if 'service' in item else 'host'
+        try:
+            element_id = ObjectId(item[resource])
+        except (InvalidId, TypeError):
+            result['_issues'] = {resource: "value '%s' cannot be converted to a ObjectId"
+                                           % item[resource]}
+            continue
+        schema = current_app.config['DOMAIN'][resource]['schema']
+        data = dict([(field, value) for field, value in item.items() if field != resource])
+        livestate_fields = [field for field in schema
+                            if field.startswith('ls_') or field == '_overall_state_id']
+        issues = dict([(field, 'unknown field') for field in data
+                       if field not in livestate_fields])
+        if not data:
+            issues[resource] = 'no live state field'
+        if issues:
+            result['_issues'] = issues
+            continue
+        result['_id'] = str(element_id)
+        result['_resource'] = resource
+        result['_data'] = data
+        ids[resource].add(element_id)
+
+    # Get the hosts and services the user is allowed to update
+    hosts = {}
+    for resource in ['host', 'service']:
+        if not ids[resource]:
+            continue
+        lookup = {'_id': {'$in': list(ids[resource])}}
+        if not g.get('back_role_super_admin', False):
+            if resource not in g.get('resources_patch', {}) and \
+                    resource not in g.get('resources_patch_custom', {}):
+                continue
+            add_rights_lookup('patch', resource, lookup)
+        for element in current_app.data.driver.db[resource].find(lookup, {'host': 1}):
+            hosts[(resource, element['_id'])] = element.get('host', element['_id'])
+
+    checks = []
+    results = []
+    for result, _ in pending:
+        resource = result.pop('_resource', None)
+        data = result.pop('_data', None)
+        if data is None:
+            continue
+        key = (resource, ObjectId(result['_id']))
+        if key not in hosts:
+            result['_issues'] = {resource: "value '%s' is not allowed or does not exist"
+                                           % result['_id']}
+            continue
+        checks.append((resource, key[1], hosts[key], data))
+        results.append(result)
+
+    # The issues of the refused updates, by position in the checks
+    issues = {}
+    if checks:
+        Livestate.apply(checks, issues)
+    for position, result in enumerate(results):
+        if position in issues:
+            result['_issues'] = issues[position]
+        else:
+            result['_status'] = 'OK'
+
+    resp = {'_status': 'OK', '_items': []}
+    for result, _ in pending:
+        if result['_status'] != 'OK':
+            resp['_status'] = 'ERR'
+        resp['_items'].append(result)
+    return jsonify(resp)
+
+
 @app.route("/cron_alignak")
 def cron_alignak():
     """
@@ -3084,14 +3717,13 @@ if settings.get('GRAFANA_DATASOURCE', True):
                     resp.append(item)
 
             if endpoint == 'livestate':
-                host_db = current_app.data.driver.db['host']
                 search = {
                     "name": {"$in": hosts}, "_is_template": False
                 }
                 if services:
                     search["name"] = {"$in": services}
 
-                hosts = host_db.find(search)
+                hosts = Livestate.find('host', search)
                 for host in hosts:
                     text = "%s: %s (%s) - %s" % (host['name'],
                                                  host['ls_state'], host['ls_state_type'],
@@ -3134,7 +3766,6 @@ def cron_grafana(engine='jsonify'):
     with app.test_request_context():
         resp = {}
         hosts_db = current_app.data.driver.db['host']
-        services_db = current_app.data.driver.db['service']
         grafana_db = current_app.data.driver.db['grafana']
 
         for grafana in grafana_db.find():
@@ -3151,9 +3782,7 @@ def cron_grafana(engine='jsonify'):
             app.logger.info("[cron_grafana] Grafana: %s", grafana['name'])
 
             search = {'_is_template': False}
-            search['_realm'] = {"$in": graf.realms}
-            if len(graf.realms) == 1:
-                search['_realm'] = graf.realms[0]
+            search.update(graf.realms_lookup)
 
             if forcegenerate is not None:
                 app.logger.info("[cron_grafana] Force regeneration of '%s' dashboards",
@@ -3163,7 +3792,7 @@ def cron_grafana(engine='jsonify'):
                 search['ls_perf_data'] = {"$ne": ""}
                 search['ls_last_check'] = {"$ne": 0}
 
-            hosts = hosts_db.find(search)
+            hosts = Livestate.find('host', search)
             for host in hosts:
                 app.logger.info("[cron_grafana] host: %s", host['name'])
 
@@ -3193,12 +3822,10 @@ def cron_grafana(engine='jsonify'):
             # manage the cases hosts have new services or hosts that do not have ls_perf_data
             hosts_dashboards = {}
             search = {'ls_grafana': False, '_is_template': False,
-                      'ls_perf_data': {"$ne": ""}, 'ls_last_check': {"$ne": 0},
-                      '_realm': {"$in": graf.realms}}
-            if len(graf.realms) == 1:
-                search['_realm'] = graf.realms[0]
+                      'ls_perf_data': {"$ne": ""}, 'ls_last_check': {"$ne": 0}}
+            search.update(graf.realms_lookup)
 
-            services = services_db.find(search)
+            services = Livestate.find('service', search)
             for service in services:
                 if service['host'] in hosts_dashboards:
                     continue
@@ -3206,6 +3833,7 @@ def cron_grafana(engine='jsonify'):
                 host = hosts_db.find_one({'_id': service['host']})
                 if host['_is_template']:
                     continue
+                Livestate.join('host', [host])
 
                 created = graf.create_dashboard(host)
                 if created:
@@ -3230,29 +3858,167 @@ def cron_livesynthesis_history():
     """
     Cron used to generate new history line for livesynthesis (+ delete too old entries)
 
-    :return: empty dictionary
+    The history lines of all the livesynthesis are inserted with one bulk insert and they all
+    have the same creation date. The too old entries are deleted with one ranged delete.
+
+    :return: number of inserted and deleted history lines, and time spent in each step
     :rtype: dict
     """
     minutes = settings['SCHEDULER_LIVESYNTHESIS_HISTORY']
     with app.test_request_context():
-        # for each livesynthesis, add into internal livesynthesisretention endpoint
+        start = time.time()
+        timing = {}
+        now = datetime.utcnow().replace(microsecond=0)
         livesynthesis_db = current_app.data.driver.db['livesynthesis']
         livesynthesisretention_db = current_app.data.driver.db['livesynthesisretention']
-        livesynthesis = livesynthesis_db.find()
-        for livesynth in livesynthesis:
-            livesynth['livesynthesis'] = livesynth['_id']
-            for prop in ['_id', '_created', '_updated', '_realm', '_users_read']:
-                if prop in livesynth:
-                    del livesynth[prop]
-            post_internal("livesynthesisretention", livesynth, True)
-            # delete older data
-            if minutes > 0:
-                items = livesynthesisretention_db.find(
-                    {"_created": {"$lt": (datetime.utcnow() - timedelta(seconds=60 * minutes))}})
-                for item in items:
-                    lookup = {"_id": item['_id']}
-                    deleteitem_internal('livesynthesisretention', False, False, **lookup)
-        return jsonify({})
+        schema_version = \
+            settings['DOMAIN']['livesynthesisretention']['schema']['schema_version']['default']
+
+        # for each livesynthesis, add a snapshot in the internal livesynthesisretention
+        names = Livesynthesis.get_counters_names()
+        snapshots = []
+        for livesynth in livesynthesis_db.find({}, dict([(name, 1) for name in names])):
+            snapshot = dict([(name, livesynth.get(name, 0)) for name in names])
+            snapshot['livesynthesis'] = livesynth['_id']
+            snapshot['schema_version'] = schema_version
+            snapshot['_created'] = now
+            snapshot['_updated'] = now
+            snapshots.append(snapshot)
+        timing['snapshot'] = time.time() - start
+
+        step = time.time()
+        if snapshots:
+            livesynthesisretention_db.insert_many(snapshots, ordered=False)
+        timing['insert'] = time.time() - step
+
+        # delete older data
+        step = time.time()
+        deleted = 0
+        if minutes > 0:
+            result = livesynthesisretention_db.delete_many(
+                {"_created": {"$lt": (now - timedelta(seconds=60 * minutes))}})
+            deleted = result.deleted_count
+        timing['expire'] = time.time() - step
+
+        # Add the snapshot to the down-sampled history tiers
+        step = time.time()
+        Livesynthesis.add_history_tiers(snapshots, now)
+        timing['tiers'] = time.time() - step
+
+        timing['total'] = time.time() - start
+        current_app.logger.info("LS - History: inserted %d, deleted %d: %s",
+                                len(snapshots), deleted, timing)
+        return jsonify({'inserted': len(snapshots), 'deleted': deleted, 'timing': timing})
+
+
+@app.route('/cron_livesynthesis_recalculate')
+def cron_livesynthesis_recalculate():
+    """
+    Maintenance command used to recalculate the live synthesis counters of all the realms
+
+    :return: number of realms and time spent in each step
+    :rtype: dict
+    """
+    if request.remote_addr not in settings['IP_CRON']:
+        app.logger.warning('Access denied for %s', request.remote_addr)
+        return make_response("Access denied from remote host %s" % request.remote_addr, 412)
+
+    with app.test_request_context():
+        result = Livesynthesis.recalculate()
+        if Groupsynthesis.enabled():
+            result['groups'] = Groupsynthesis.recalculate()
+        return jsonify(result)
+
+
+@app.route('/cron_livestate_recalculate')
+def cron_livestate_recalculate():
+    """
+    Maintenance command used to recalculate the services overall states of all the hosts and
+    the hosts overall states
+
+    :return: number of updated hosts
+    :rtype: dict
+    """
+    if request.remote_addr not in settings['IP_CRON']:
+        app.logger.warning('Access denied for %s', request.remote_addr)
+        return make_response("Access denied from remote host %s" % request.remote_addr, 412)
+
+    with app.test_request_context():
+        count = Livestate.recalculate_services_overall()
+        checks = []
+        for host in current_app.data.driver.db['host'].find({'_is_template': False}, {'_id': 1}):
+            checks.append(('host', host['_id'], host['_id'], {'_overall_state_id': -1}))
+            if len(checks) >= 1000:
+                Livestate.apply(checks)
+                checks = []
+        if checks:
+            Livestate.apply(checks)
+        return jsonify({'hosts': count})
+
+
+@app.route('/cron_livesynthesis_flush')
+def cron_livesynthesis_flush():
+    """
+    Cron used to write the pending live synthesis counters modifications and to send the live
+    synthesis of the modified realms to the TSDB
+
+    :return: number of updated realms and groups
+    :rtype: dict
+    """
+    with app.test_request_context():
+        result = {'realms': Livesynthesis.flush(send_metrics=True)}
+        if Groupsynthesis.enabled():
+            result['groups'] = Groupsynthesis.flush()
+        return jsonify(result)
+
+
+@app.route('/cron_livesynthesis_scheduled')
+def cron_livesynthesis_scheduled():
+    """
+    Cron used to recalculate the live synthesis of the realms and groups which recalculation was
+    requested
+
+    :return: number of realms and time spent in each step, number of groups
+    :rtype: dict
+    """
+    with app.test_request_context():
+        result = Livesynthesis.recalculate_scheduled() or {}
+        if Groupsynthesis.enabled():
+            result['groups'] = Groupsynthesis.recalculate_scheduled()
+        return jsonify(result)
+
+
+@app.route('/cron_livesynthesis_check')
+def cron_livesynthesis_check():
+    """
+    Cron used to check the live synthesis counters of some realms and to recalculate the
+    counters of the realms with a drift
+
+    :return: number of checked realms, drift of the drifted realms and time spent
+    :rtype: dict
+    """
+    with app.test_request_context():
+        return jsonify(Livesynthesis.check(settings['LIVESYNTHESIS_CHECK_REALMS']))
+
+
+@app.route('/cron_users_rights')
+def cron_users_rights():
+    """
+    Maintenance command used to materialize again the effective rights of all the users, for
+    example after a big import of users, user restriction roles or realms
+
+    :return: number of users and time spent
+    :rtype: dict
+    """
+    if request.remote_addr not in settings['IP_CRON']:
+        app.logger.warning('Access denied for %s', request.remote_addr)
+        return make_response("Access denied from remote host %s" % request.remote_addr, 412)
+
+    with app.test_request_context():
+        start = time.time()
+        count = MyTokenAuth().materialize_users_rights()
+        MyTokenAuth.clear_rights_cache()
+        return jsonify({'users': count, 'time': time.time() - start})
 
 
 @app.route('/docs')
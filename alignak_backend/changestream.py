@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.changestream`` module
+
+    This module maintains the live synthesis from a MongoDB change stream
+"""
+from __future__ import print_function
+import sys
+import time
+import pymongo
+from pymongo.errors import PyMongoError
+from flask import current_app
+
+from alignak_backend.livesynthesis import Livesynthesis
+
+
+class LivesynthesisStream(object):
+    """
+        Live synthesis change stream class
+
+        When LIVESYNTHESIS_ENGINE is 'changestream', the backend processes do not update the live
+        synthesis counters when a host or a service is modified. A single consumer process (the
+        alignak-backend-livesynthesis script) tails a change stream on the host and service
+        collections and updates the counters, whatever wrote in the database (any backend
+        process, any backend node or a maintenance script).
+
+        The consumer keeps the live state of each host and service in memory. For each change,
+        the live state of the element is compared with the known one: a change that does not
+        modify the live state (or that was already applied) does not modify the counters. The
+        stream is opened before the live states are loaded, so no change is lost in between.
+        MongoDB change streams require a replica set (a single node replica set is enough).
+    """
+    # Element types: collection and live synthesis counters type
+    types = {
+        'host': 'hosts',
+        'service': 'services'
+    }
+
+    # Fields that modify the live synthesis counters
+    fields = ['_realm', '_is_template', 'active_checks_enabled', 'passive_checks_enabled',
+              'ls_state', 'ls_state_type', 'ls_acknowledged', 'ls_downtimed']
+
+    # Known live state of each host and service
+    states = {}
+
+    @staticmethod
+    def get_state(document):
+        """
+            Get the live state of a host or service, as counted in the live synthesis
+
+        :param document: host or service fields
+        :type document: dict
+        :return: realm, monitored, state, state type, acknowledged and downtimed; None for a
+        template
+        :rtype: tuple
+        """
+        if document is None or document.get('_is_template', False):
+            return None
+        monitored = document.get('active_checks_enabled') or \
+            document.get('passive_checks_enabled')
+        return (document.get('_realm'), bool(monitored),
+                document.get('ls_state'), document.get('ls_state_type'),
+                document.get('ls_acknowledged'), document.get('ls_downtimed'))
+
+    @staticmethod
+    def get_pipeline():
+        """
+            Get the change stream pipeline: the hosts and services changes that may modify the
+            live synthesis
+
+        :return: aggregation pipeline
+        :rtype: list
+        """
+        modified = [{'operationType': {'$ne': 'update'}}]
+        for field in LivesynthesisStream.fields:
+            modified.append({'updateDescription.updatedFields.%s' % field: {'$exists': True}})
+        return [
+            {'$match': {
+                'ns.coll': {'$in': list(LivesynthesisStream.types)},
+                'operationType': {'$in': ['insert', 'update', 'replace', 'delete']},
+                '$or': modified
+            }}
+        ]
+
+    @staticmethod
+    def load():
+        """
+            Load the live state of all the hosts and services and recalculate the live synthesis
+
+        :return: number of hosts and services
+        :rtype: int
+        """
+        states = {}
+        projection = dict([(field, 1) for field in LivesynthesisStream.fields])
+        for collection in LivesynthesisStream.types:
+            for document in current_app.data.driver.db[collection].find({}, projection):
+                state = LivesynthesisStream.get_state(document)
+                if state is not None:
+                    states[(collection, document['_id'])] = state
+        LivesynthesisStream.states = states
+        Livesynthesis.recalculate()
+        return len(states)
+
+    @staticmethod
+    def process(changes):
+        """
+            Update the live synthesis counters with some changes of the change stream, the
+            counters of each modified realm are updated once
+
+        :param changes: change stream events
+        :type changes: list
+        :return: number of updated realms
+        :rtype: int
+        """
+        increments = {}
+        for change in changes:
+            collection = change['ns']['coll']
+            key = (collection, change['documentKey']['_id'])
+            if change['operationType'] == 'delete':
+                state = None
+            elif change.get('fullDocument') is None:
+                # The element was deleted since, the deletion will follow
+                continue
+            else:
+                state = LivesynthesisStream.get_state(change['fullDocument'])
+
+            previous = LivesynthesisStream.states.get(key)
+            if state == previous:
+                continue
+            type_check = LivesynthesisStream.types[collection]
+            for count, current in [(-1, previous), (1, state)]:
+                if current is None:
+                    continue
+                if (current[0], type_check) not in increments:
+                    increments[(current[0], type_check)] = \
+                        Livesynthesis.get_empty_counters(type_check)
+                Livesynthesis.add_counters(increments[(current[0], type_check)], type_check, {
+                    'monitored': current[1], 'state': current[2], 'state_type': current[3],
+                    'acknowledged': current[4], 'downtimed': current[5]
+                }, count)
+            if state is None:
+                LivesynthesisStream.states.pop(key, None)
+            else:
+                LivesynthesisStream.states[key] = state
+
+        if not increments:
+            return 0
+        for (realm_id, _), data in increments.items():
+            Livesynthesis.add_pending(realm_id, data)
+        return Livesynthesis.flush(send_metrics=True)
+
+    @staticmethod
+    def run():
+        """
+            Tail the change stream and update the live synthesis, forever
+
+            The changes are processed by batches of LIVESYNTHESIS_FLUSH_COUNT changes at most.
+            If the change stream fails, it is opened again and the live states are loaded again.
+
+        :return: None
+        """
+        batch_size = current_app.config['LIVESYNTHESIS_FLUSH_COUNT']
+        while True:
+            try:
+                with current_app.data.driver.db.watch(LivesynthesisStream.get_pipeline(),
+                                                      full_document='updateLookup',
+                                                      max_await_time_ms=1000) as stream:
+                    count = LivesynthesisStream.load()
+                    current_app.logger.info("LS - change stream opened, %d elements", count)
+                    while stream.alive:
+                        changes = []
+                        change = stream.try_next()
+                        while change is not None:
+                            changes.append(change)
+                            if len(changes) >= batch_size:
+                                break
+                            change = stream.try_next()
+                        if changes:
+                            LivesynthesisStream.process(changes)
+            except PyMongoError as exp:
+                current_app.logger.error("LS - change stream failed: %s", exp)
+                time.sleep(1)
+
+
+def main():  # pragma: no cover - needs a replica set
+    """Main function to run the live synthesis change stream consumer
+
+    This function is used by the `alignak-backend-livesynthesis` script installed with
+    setup.py. Only one consumer must run for a backend database.
+    """
+    from alignak_backend.app import app
+
+    if app.config.get('LIVESYNTHESIS_ENGINE') != 'changestream':
+        print("LIVESYNTHESIS_ENGINE is not 'changestream', the live synthesis is updated by "
+              "the backend")
+        return
+    # The change streams need pymongo 3.7 and a MongoDB replica set
+    if pymongo.version_tuple < (3, 7):
+        sys.exit("[ERROR] The change stream engine requires pymongo 3.7 or newer, installed "
+                 "version: %s" % pymongo.version)
+    with app.app_context():
+        if not app.data.driver.db.client.admin.command('ismaster').get('setName'):
+            sys.exit("[ERROR] The change stream engine requires a MongoDB replica set")
+        LivesynthesisStream.run()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
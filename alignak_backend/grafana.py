@@ -13,7 +13,9 @@ import requests
 from bson.objectid import ObjectId
 from flask import current_app
 from eve.methods.patch import patch_internal
+from alignak_backend.livestate import Livestate
 from alignak_backend.perfdata import PerfDatas
+from alignak_backend.realmtree import RealmTree
 from alignak_backend.timeseries import Timeseries
 
 
@@ -34,11 +36,11 @@ class Grafana(object):
         self.dashboard_data = data
 
         # get the realms of this grafana instance
-        realm_db = current_app.data.driver.db['realm']
-        realm = realm_db.find_one({'_id': data['_realm']})
-        self.realms = [realm['_id']]
+        self.realms = [data['_realm']]
+        self.realms_lookup = {'_realm': data['_realm']}
         if data['_sub_realm']:
-            self.realms.extend(realm['_all_children'])
+            self.realms.extend(RealmTree.descendants(data['_realm']))
+            self.realms_lookup = RealmTree.path_lookup(data['_realm'])
 
         # get graphite / influx for each realm of the grafana
         self.timeseries = {}
@@ -77,8 +79,7 @@ class Grafana(object):
             graphite['type'] = 'graphite'
             self.timeseries[graphite['_realm']] = graphite
             if graphite['_sub_realm']:
-                realm = realm_db.find_one({'_id': graphite['_realm']})
-                for child_realm in realm['_all_children']:
+                for child_realm in RealmTree.descendants(graphite['_realm']):
                     if child_realm not in self.realms:
                         current_app.logger.error("[grafana-%s] linked graphite %s, "
                                                  "ignore sub-realm: %s",
@@ -116,8 +117,7 @@ class Grafana(object):
             influxdb['type'] = 'influxdb'
             self.timeseries[influxdb['_realm']] = influxdb
             if influxdb['_sub_realm']:
-                realm = realm_db.find_one({'_id': influxdb['_realm']})
-                for child_realm in realm['_all_children']:
+                for child_realm in RealmTree.descendants(influxdb['_realm']):
                     if child_realm not in self.realms:
                         current_app.logger.error("[grafana-%s] linked influxdb %s, "
                                                  "ignore sub-realm: %s",
@@ -223,8 +223,6 @@ class Grafana(object):
 
         self.panel_id = 0
 
-        service_db = current_app.data.driver.db['service']
-
         # Set host Graphite prefix
         hostname = host['name']
         current_app.logger.info("[grafana-%s] create dashboard for the host '%s'",
@@ -307,7 +305,7 @@ class Grafana(object):
         # now get services
         search = {'host': ObjectId(host['_id']), '_is_template': False,
                   'ls_perf_data': {"$ne": ""}, 'ls_last_check': {"$ne": 0}}
-        services = service_db.find(search)
+        services = Livestate.find('service', search)
         for service in services:
             service['hostname'] = host['name']
             current_app.logger.info("[grafana-%s] - service: %s", self.name, service['name'])
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.groupsynthesis`` module
+
+    This module manages the live synthesis of the hosts groups and services groups
+"""
+from __future__ import print_function
+import time
+from datetime import datetime
+import pymongo
+from flask import current_app, g
+
+from alignak_backend.livesynthesis import Livesynthesis
+from alignak_backend.realmtree import RealmTree
+
+
+class Groupsynthesis(object):
+    """
+        Groups live synthesis class
+
+        For each hosts group (services group), the live synthesis counters of the hosts (services)
+        of the group and of all its sub-groups are stored in the livesynthesisgroup resource.
+        They are recalculated when a group is modified and they are incremented when a host
+        (service) live state is modified, like the realms live synthesis.
+
+        The groups of each host and service are indexed in memory. The index carries a
+        generation number that is bumped each time a group is modified. The index is rebuilt
+        when its generation is not the current one or when it is older than REALMS_TREE_TTL
+        seconds (other backend processes may have modified the groups).
+
+        The counters modifications and the recalculations follow the realms live synthesis
+        settings: they are merged in the batches of modifications, kept pending when
+        LIVESYNTHESIS_FLUSH_PERIOD is set and the recalculations are grouped when
+        LIVESYNTHESIS_RECALCULATE_PERIOD is set.
+    """
+    # Group types: type of the counted elements and group members field
+    types = {
+        'hostgroup': 'hosts',
+        'servicegroup': 'services'
+    }
+
+    # Current groups index generation
+    generation = 0
+
+    # Groups index: groups of each host and service, including the parents groups
+    index = None
+
+    # Pending counters modifications of each group (write-behind), per second of modification
+    pending = {}
+    # Group types which live synthesis must be recalculated, None for all the types
+    pending_recalculate = set()
+
+    @staticmethod
+    def enabled():
+        """
+            The groups live synthesis is enabled with LIVESYNTHESIS_GROUPS
+
+        :return: True if the groups live synthesis is enabled
+        :rtype: bool
+        """
+        return bool(current_app.config.get('LIVESYNTHESIS_GROUPS'))
+
+    @staticmethod
+    def invalidate():
+        """
+            Bump the groups index generation, the index will be rebuilt on next use
+        """
+        Groupsynthesis.generation += 1
+
+    @staticmethod
+    def build():
+        """
+            Build the groups index from the hostgroup and servicegroup collections
+
+        :return: the groups index
+        :rtype: dict
+        """
+        index = {'generation': Groupsynthesis.generation, 'built': time.time()}
+        for group_type, type_check in Groupsynthesis.types.items():
+            members = {}
+            groups_db = current_app.data.driver.db[group_type]
+            for group in groups_db.find({}, {type_check: 1, '_tree_parents': 1}):
+                groups = [group['_id']] + group.get('_tree_parents', [])
+                for member in group.get(type_check, []):
+                    members.setdefault(member, set()).update(groups)
+            index[group_type] = dict([(member, list(groups))
+                                      for member, groups in members.items()])
+        Groupsynthesis.index = index
+        return index
+
+    @staticmethod
+    def get():
+        """
+            Get the current groups index, build it if needed
+
+        :return: the groups index
+        :rtype: dict
+        """
+        index = Groupsynthesis.index
+        if index is None or index['generation'] != Groupsynthesis.generation \
+                or time.time() - index['built'] > current_app.config['REALMS_TREE_TTL']:
+            return Groupsynthesis.build()
+        return index
+
+    @staticmethod
+    def recalculate(group_type=None):
+        """
+            Recalculate the live synthesis counters of all the groups of a type
+
+        :param group_type: hostgroup or servicegroup, None for both
+        :type group_type: str
+        :return: number of groups
+        :rtype: int
+        """
+        start = time.time()
+        livesynthesisgroup_db = current_app.data.driver.db['livesynthesisgroup']
+        if current_app.config.get('LIVESYNTHESIS_FLUSH_PERIOD'):
+            Groupsynthesis.flush()
+        index = Groupsynthesis.build()
+        count = 0
+        for current_type, type_check in Groupsynthesis.types.items():
+            if group_type is not None and current_type != group_type:
+                continue
+            if current_app.config.get('LIVESYNTHESIS_FLUSH_PERIOD'):
+                livesynthesisgroup_db.update_many({current_type: {'$exists': True}},
+                                                  {'$set': {'_recalculating': start}})
+
+            counters = {}
+            realms = {}
+            groups_db = current_app.data.driver.db[current_type]
+            for group in groups_db.find({}, {'_realm': 1, '_sub_realm': 1}):
+                counters[group['_id']] = Livesynthesis.get_empty_counters(type_check)
+                realms[group['_id']] = group
+
+            members = index[current_type]
+            elements_db = current_app.data.driver.db[type_check[:-1]]
+            for element in elements_db.find({'_id': {'$in': list(members)},
+                                             '_is_template': False},
+                                            {'active_checks_enabled': 1,
+                                             'passive_checks_enabled': 1, 'ls_state': 1,
+                                             'ls_state_type': 1, 'ls_acknowledged': 1,
+                                             'ls_downtimed': 1}):
+                checks = [element.get('active_checks_enabled'),
+                          element.get('passive_checks_enabled')]
+                key = {
+                    'monitored': any(checks),
+                    'state': element.get('ls_state'),
+                    'state_type': element.get('ls_state_type'),
+                    'acknowledged': element.get('ls_acknowledged'),
+                    'downtimed': element.get('ls_downtimed')
+                }
+                for group_id in members[element['_id']]:
+                    if group_id in counters:
+                        Livesynthesis.add_counters(counters[group_id], type_check, key, 1)
+
+            now = datetime.utcnow()
+            operations = []
+            for group_id, data in counters.items():
+                data['_realm'] = realms[group_id]['_realm']
+                data['_sub_realm'] = realms[group_id].get('_sub_realm', True)
+                data['_realm_path'] = RealmTree.path(data['_realm'])
+                data['_updated'] = now
+                data['_recalculated'] = start
+                operations.append(pymongo.UpdateOne(
+                    {current_type: group_id},
+                    {'$set': data, '$unset': {'_recalculating': ''},
+                     '$setOnInsert': {'_created': now}},
+                    upsert=True))
+            if operations:
+                livesynthesisgroup_db.bulk_write(operations, ordered=False)
+            # Delete the live synthesis of the deleted groups
+            livesynthesisgroup_db.delete_many({current_type: {'$exists': True,
+                                                              '$nin': list(counters)}})
+            count += len(counters)
+        current_app.logger.debug("LS - Recalculated %d groups", count)
+        return count
+
+    @staticmethod
+    def schedule_recalculate(group_type=None):
+        """
+            Request a recalculation of the live synthesis counters of the groups of a type, like
+            Livesynthesis.schedule_recalculate for the realms
+
+        :param group_type: hostgroup or servicegroup, None for both
+        :type group_type: str
+        :return: None
+        """
+        if current_app.config.get('LIVESYNTHESIS_RECALCULATE_PERIOD'):
+            with Livesynthesis.lock:
+                Groupsynthesis.pending_recalculate.add(group_type)
+            return
+
+        batch = Groupsynthesis.get_batch()
+        if batch is not None:
+            batch['recalculate'].add(group_type)
+            return
+
+        Groupsynthesis.recalculate(group_type)
+
+    @staticmethod
+    def recalculate_scheduled():
+        """
+            Recalculate the live synthesis counters of the groups types which recalculation was
+            requested since the last call
+
+        :return: number of groups
+        :rtype: int
+        """
+        with Livesynthesis.lock:
+            group_types = Groupsynthesis.pending_recalculate
+            Groupsynthesis.pending_recalculate = set()
+        if None in group_types:
+            return Groupsynthesis.recalculate()
+        return sum([Groupsynthesis.recalculate(group_type) for group_type in group_types])
+
+    @staticmethod
+    def get_batch():
+        """
+            Get the groups modifications of the current batch of modifications
+            (see Livesynthesis.start_batch)
+
+        :return: increments of each group and group types to recalculate, None if no batch is
+        started
+        :rtype: dict
+        """
+        if getattr(g, 'livesynthesis_batch', None) is None:
+            return None
+        if getattr(g, 'groupsynthesis_batch', None) is None:
+            g.groupsynthesis_batch = {'counters': {}, 'recalculate': set()}
+        return g.groupsynthesis_batch
+
+    @staticmethod
+    def end_batch():
+        """
+            End a batch of modifications: update the counters of each modified group once, or
+            recalculate the groups if it was requested during the batch
+
+        :return: None
+        """
+        batch = getattr(g, 'groupsynthesis_batch', None)
+        g.groupsynthesis_batch = None
+        if batch is None:
+            return
+        if None in batch['recalculate']:
+            Groupsynthesis.recalculate()
+            return
+        for group_type in batch['recalculate']:
+            Groupsynthesis.recalculate(group_type)
+        for (group_type, group_id), data in batch['counters'].items():
+            data = dict([(counter, value) for counter, value in data.items() if value])
+            if data and group_type not in batch['recalculate']:
+                Groupsynthesis.increment(group_type, [group_id], data)
+
+    @staticmethod
+    def update_counters(group_type, element_id, data):
+        """
+            Increment the live synthesis counters of the groups of an element
+
+        :param group_type: hostgroup or servicegroup
+        :type group_type: str
+        :param element_id: id of the host or service
+        :type element_id: ObjectId
+        :param data: increment of each counter
+        :type data: dict
+        :return: None
+        """
+        groups = Groupsynthesis.get()[group_type].get(element_id)
+        if not groups:
+            return
+
+        batch = Groupsynthesis.get_batch()
+        if batch is not None:
+            for group_id in groups:
+                Livesynthesis.merge_counters(
+                    batch['counters'].setdefault((group_type, group_id), {}), data)
+            return
+
+        Groupsynthesis.increment(group_type, groups, data)
+
+    @staticmethod
+    def increment(group_type, groups, data):
+        """
+            Increment the live synthesis counters of some groups, or merge the increments with
+            the pending ones when the write-behind is enabled
+
+        :param group_type: hostgroup or servicegroup
+        :type group_type: str
+        :param groups: ids of the groups
+        :type groups: list
+        :param data: increment of each counter
+        :type data: dict
+        :return: None
+        """
+        if not current_app.config.get('LIVESYNTHESIS_FLUSH_PERIOD'):
+            current_app.data.driver.db['livesynthesisgroup'].update_many(
+                {group_type: {'$in': groups}}, {'$inc': data})
+            return
+
+        for group_id in groups:
+            Groupsynthesis.add_pending(group_type, group_id, data)
+
+    @staticmethod
+    def add_pending(group_type, group_id, data, when=None):
+        """
+            Merge counters increments of a group with the pending modifications made in the
+            same second
+
+        :param group_type: hostgroup or servicegroup
+        :type group_type: str
+        :param group_id: id of the group
+        :type group_id: ObjectId
+        :param data: increment of each counter
+        :type data: dict
+        :param when: time of the modification, now if None
+        :type when: float
+        :return: None
+        """
+        second = int(time.time() if when is None else when)
+        with Livesynthesis.lock:
+            buckets = Groupsynthesis.pending.setdefault((group_type, group_id), {})
+            Livesynthesis.merge_counters(buckets.setdefault(second, {}), data)
+
+    @staticmethod
+    def flush():
+        """
+            Write the pending groups live synthesis counters modifications, one merged increment
+            for each group (see Livesynthesis.flush)
+
+        :return: number of updated groups
+        :rtype: int
+        """
+        with Livesynthesis.lock:
+            pending = Groupsynthesis.pending
+            Groupsynthesis.pending = {}
+        if not pending:
+            return 0
+
+        livesynthesisgroup_db = current_app.data.driver.db['livesynthesisgroup']
+        states = {}
+        for group_type in Groupsynthesis.types:
+            groups = [group_id for (current_type, group_id) in pending
+                      if current_type == group_type]
+            if not groups:
+                continue
+            for live_current in livesynthesisgroup_db.find(
+                    {group_type: {'$in': groups}},
+                    {group_type: 1, '_recalculated': 1, '_recalculating': 1}):
+                states[(group_type, live_current[group_type])] = live_current
+
+        operations = []
+        for (group_type, group_id), buckets in pending.items():
+            counters, kept = Livesynthesis.merge_pending(buckets,
+                                                         states.get((group_type, group_id), {}))
+            for second, data in kept.items():
+                Groupsynthesis.add_pending(group_type, group_id, data, second)
+            if counters:
+                operations.append(pymongo.UpdateOne({group_type: group_id}, {'$inc': counters}))
+        if operations:
+            livesynthesisgroup_db.bulk_write(operations, ordered=False)
+            current_app.logger.debug("LS - flushed %d groups", len(operations))
+        return len(operations)
+
+    @staticmethod
+    def on_updated_element(group_type, updated, original):
+        """
+            Update the groups live synthesis when a host or service live state is updated
+
+        :param group_type: hostgroup or servicegroup
+        :type group_type: str
+        :param updated: updated fields
+        :type updated: dict
+        :param original: original fields
+        :type original: dict
+        :return: None
+        """
+        if original['_is_template']:
+            return
+
+        # If the element is not monitored and we do not change its monitoring state
+        if not original['active_checks_enabled'] and not original['passive_checks_enabled'] \
+                and 'active_checks_enabled' not in updated \
+                and 'passive_checks_enabled' not in updated:
+            return
+
+        type_check = Groupsynthesis.types[group_type]
+        minus, plus = Livesynthesis.livesynthesis_to_update(type_check, updated, original)
+        if minus is False:
+            return
+        if 'not_monitored' in minus or (plus and 'not_monitored' in plus):
+            Groupsynthesis.schedule_recalculate(group_type)
+            return
+
+        data = {minus: -1}
+        if plus is not False:
+            data = {minus: -1, plus: 1}
+        Groupsynthesis.update_counters(group_type, original['_id'], data)
+
+    @staticmethod
+    def on_deleted_element(group_type, item):
+        """
+            Update the groups live synthesis when a host or service is deleted
+
+        :param group_type: hostgroup or servicegroup
+        :type group_type: str
+        :param item: fields of the deleted item
+        :type item: dict
+        :return: None
+        """
+        if item['_is_template']:
+            return
+
+        type_check = Groupsynthesis.types[group_type]
+        minus = Livesynthesis.livesynthesis_to_delete(type_check, item)
+        Groupsynthesis.update_counters(group_type, item['_id'],
+                                       {minus: -1, '%s_total' % type_check: -1})
+
+    @staticmethod
+    def on_updated_host(updated, original):
+        """
+            What to do when an host live state is updated ...
+        """
+        Groupsynthesis.on_updated_element('hostgroup', updated, original)
+
+    @staticmethod
+    def on_updated_service(updated, original):
+        """
+            What to do when a service live state is updated ...
+        """
+        Groupsynthesis.on_updated_element('servicegroup', updated, original)
+
+    @staticmethod
+    def on_deleted_host(item):
+        """
+            What to do when an host is deleted ...
+        """
+        Groupsynthesis.on_deleted_element('hostgroup', item)
+
+    @staticmethod
+    def on_deleted_service(item):
+        """
+            What to do when a service is deleted ...
+        """
+        Groupsynthesis.on_deleted_element('servicegroup', item)
+
+    @staticmethod
+    def on_changed_hostgroup(*args):
+        # pylint: disable=unused-argument
+        """
+            What to do when a hosts group is created, updated or deleted ...
+        """
+        Groupsynthesis.invalidate()
+        Groupsynthesis.schedule_recalculate('hostgroup')
+
+    @staticmethod
+    def on_changed_servicegroup(*args):
+        # pylint: disable=unused-argument
+        """
+            What to do when a services group is created, updated or deleted ...
+        """
+        Groupsynthesis.invalidate()
+        Groupsynthesis.schedule_recalculate('servicegroup')
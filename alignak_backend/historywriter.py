@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.historywriter`` module
+
+    This module writes the history events of the check results and actions
+"""
+from __future__ import print_function
+from datetime import datetime
+from flask import current_app, g
+from eve.methods.common import resolve_document_etag
+
+from alignak_backend.namecache import NameCache
+from alignak_backend.realmtree import RealmTree
+
+
+class HistoryWriter(object):
+    """
+        History writer class
+
+        The history events created by the check results and actions hooks are completed with
+        the host realm and the user name got from the names cache, as pre_history_post would
+        do. They are buffered during the request and they are inserted with one insert_many
+        at the end of the request. Out of a backend request (cron routes, scheduler jobs), they
+        are inserted immediately.
+    """
+
+    @staticmethod
+    def add(event):
+        """
+            Add a history event
+
+            The event has the host, host_name, service, service_name, user, type and message
+            fields of a history item. The realm of the event is the realm of its host.
+
+        :param event: history event
+        :type event: dict
+        :return: None
+        """
+        host = NameCache.get('host', event['host'])
+        if host:
+            event['_realm'] = host['_realm']
+            event['_sub_realm'] = host['_sub_realm']
+        if event['user']:
+            user = NameCache.get('user', event['user'])
+            if user:
+                event['user_name'] = user['name']
+        else:
+            event['user_name'] = 'Alignak'
+            event['user'] = None
+
+        if not g.get('deferred_writes', False):
+            HistoryWriter.write([event])
+            return
+        if g.get('history_events') is None:
+            g.history_events = []
+        g.history_events.append(event)
+
+    @staticmethod
+    def write(events):
+        """
+            Insert some history events
+
+        :param events: history events
+        :type events: list
+        :return: None
+        """
+        schema = current_app.config['DOMAIN']['history']['schema']
+        now = datetime.utcnow().replace(microsecond=0)
+        for event in events:
+            event.setdefault('message', schema['message']['default'])
+            event.setdefault('_sub_realm', schema['_sub_realm']['default'])
+            event['schema_version'] = schema['schema_version']['default']
+            if '_realm' in event:
+                event['_realm_path'] = RealmTree.path(event['_realm'])
+            event['_created'] = now
+            event['_updated'] = now
+        resolve_document_etag(events, 'history')
+        current_app.data.driver.db['history'].insert_many(events, ordered=False)
+
+    @staticmethod
+    def flush():
+        """
+            Insert the history events buffered during the request
+
+        :return: number of inserted events
+        :rtype: int
+        """
+        events = g.get('history_events')
+        if not events:
+            return 0
+        g.history_events = None
+        HistoryWriter.write(events)
+        return len(events)
@@ -0,0 +1,601 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.livestate`` module
+
+    This module computes the overall state of the hosts and services and updates their live
+    state in bulk
+"""
+from __future__ import print_function
+from copy import deepcopy
+from datetime import datetime
+import pymongo
+from flask import current_app, g
+from eve.methods.common import resolve_document_etag
+from eve.methods.patch import patch_internal
+
+from alignak_backend.livesynthesis import Livesynthesis
+
+
+class Livestate(object):
+    """
+        Live state class
+
+        Each host stores the number of its services for each overall state identifier in its
+        _services_overall field (only the HARD states of the monitored services are counted).
+        This field is incremented when a service is created, modified or deleted, so the host
+        overall state is computed without reading the host services.
+
+        The live state of the hosts and services of a batch of check results is updated with
+        one bulk write for each collection instead of one PATCH for each check result. The
+        elements are read with one query for each collection. Each update is validated, the
+        overall states and the etags are computed as the PATCH hooks do, then the on_updated
+        hooks are called for each update, the live synthesis being updated once for the batch.
+
+        When the overall state of a service is modified, the overall state of its host is
+        recomputed once at the end of the request (or of the batch), whatever the number of
+        modified services of this host.
+
+        When LIVESTATE_COLLECTIONS is set, the live state fields modified by each check result
+        (output, performance data, last check, ...) are stored in the hostlivestate and
+        servicelivestate collections, with the id of their host or service. They are joined to
+        the hosts and services when they are read. The state fields (state_fields) stay in the
+        hosts and services documents, they are written (and the etag is modified) only when they
+        change, so the live synthesis, the overall states and the filters on the state still
+        use the hosts and services collections.
+    """
+    # Live state fields stored in the hosts and services documents when LIVESTATE_COLLECTIONS
+    # is set, the other live state fields are stored in the live state collections
+    state_fields = ['ls_state', 'ls_state_id', 'ls_state_type', 'ls_acknowledged',
+                    'ls_acknowledgement_type', 'ls_downtimed', 'ls_grafana', 'ls_grafana_panelid']
+
+    @staticmethod
+    def split():
+        """
+            The live state is stored in the live state collections with LIVESTATE_COLLECTIONS
+
+        :return: True if the live state collections are used
+        :rtype: bool
+        """
+        return bool(current_app.config.get('LIVESTATE_COLLECTIONS'))
+
+    @staticmethod
+    def is_collection_field(field):
+        """
+            A live state field stored in the live state collections
+
+        :param field: field name
+        :type field: str
+        :return: True if the field is stored in the live state collections
+        :rtype: bool
+        """
+        return field.startswith('ls_') and field not in Livestate.state_fields
+
+    @staticmethod
+    def join(resource, documents):
+        """
+            Set the live state fields stored in the live state collection in some hosts or
+            services, with one query. Only the fields existing in the documents are set, so the
+            projection of the documents is respected.
+
+        :param resource: host or service
+        :type resource: str
+        :param documents: hosts or services
+        :type documents: list
+        :return: the documents
+        :rtype: list
+        """
+        if not Livestate.split() or resource not in ['host', 'service']:
+            return documents
+        elements = dict([(document['_id'], document) for document in documents
+                         if '_id' in document])
+        if not elements:
+            return documents
+        for livestate in current_app.data.driver.db['%slivestate' % resource].find(
+                {'_id': {'$in': list(elements)}}):
+            document = elements[livestate['_id']]
+            for field, value in livestate.items():
+                if field in document and field != '_id':
+                    document[field] = value
+        return documents
+
+    @staticmethod
+    def find(resource, lookup):
+        """
+            Find some hosts or services with their live state
+
+            When LIVESTATE_COLLECTIONS is set, the criteria on the fields stored in the live
+            state collection are applied to this collection first, then the hosts or services
+            are found among the matching ones and their live state is joined.
+
+        :param resource: host or service
+        :type resource: str
+        :param lookup: filter of the elements
+        :type lookup: dict
+        :return: the hosts or services, a cursor when LIVESTATE_COLLECTIONS is not set
+        :rtype: pymongo.cursor.Cursor or list
+        """
+        elements_db = current_app.data.driver.db[resource]
+        if not Livestate.split():
+            return elements_db.find(lookup)
+
+        lookup = dict(lookup)
+        criteria = {}
+        for field in [field for field in lookup if Livestate.is_collection_field(field)]:
+            criteria[field] = lookup.pop(field)
+        if criteria:
+            elements = [livestate['_id'] for livestate in current_app.data.driver.db[
+                '%slivestate' % resource].find(criteria, {'_id': 1})]
+            lookup = {'$and': [lookup, {'_id': {'$in': elements}}]}
+        return Livestate.join(resource, list(elements_db.find(lookup)))
+
+    @staticmethod
+    def migrate():
+        """
+            Move the live state fields when LIVESTATE_COLLECTIONS was changed on an existing
+            database
+
+            When it is set, the hosts and services that do not have a live state document get one,
+            with the live state fields of the host or service. When it is not set, the fields of
+            the live state collections are copied back to the hosts and services and the live
+            state collections are emptied.
+
+        :return: number of moved hosts and services
+        :rtype: int
+        """
+        count = 0
+        for resource in ['host', 'service']:
+            elements_db = current_app.data.driver.db[resource]
+            livestate_db = current_app.data.driver.db['%slivestate' % resource]
+            operations = []
+            if Livestate.split():
+                if livestate_db.count() >= elements_db.count():
+                    continue
+                target = livestate_db
+                projection = dict([(field, 1) for field in
+                                   current_app.config['DOMAIN'][resource]['schema']
+                                   if Livestate.is_collection_field(field)])
+                for element in elements_db.find({}, projection):
+                    operations.append(pymongo.UpdateOne({'_id': element.pop('_id')},
+                                                        {'$setOnInsert': element}, upsert=True))
+            else:
+                target = elements_db
+                for livestate in livestate_db.find():
+                    operations.append(pymongo.UpdateOne({'_id': livestate.pop('_id')},
+                                                        {'$set': livestate}))
+            for position in range(0, len(operations), 1000):
+                result = target.bulk_write(operations[position:position + 1000], ordered=False)
+                count += result.upserted_count if Livestate.split() else result.modified_count
+            if not Livestate.split():
+                livestate_db.delete_many({})
+        if count:
+            current_app.logger.info("Live state of %d elements moved", count)
+        return count
+
+    @staticmethod
+    def on_inserted(resource, items):
+        """
+            Store the live state fields of the created hosts or services in the live state
+            collection
+        """
+        if resource not in ['host', 'service']:
+            return
+        operations = []
+        for item in items:
+            data = dict([(field, value) for field, value in item.items()
+                         if Livestate.is_collection_field(field)])
+            operations.append(pymongo.UpdateOne({'_id': item['_id']}, {'$setOnInsert': data},
+                                                upsert=True))
+        if operations:
+            livestate_db = current_app.data.driver.db['%slivestate' % resource]
+            livestate_db.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def on_fetched_resource(resource, response):
+        """
+            What to do when some hosts or services are read ...
+        """
+        Livestate.join(resource, response['_items'])
+
+    @staticmethod
+    def on_fetched_item(resource, response):
+        """
+            What to do when an host or a service is read ...
+        """
+        Livestate.join(resource, [response])
+
+    @staticmethod
+    def on_updated(resource, updates, original):
+        """
+            Store the live state fields of an host or a service modified by a PATCH in the live
+            state collection
+        """
+        if resource not in ['host', 'service'] or g.get('livestate_bulk', False):
+            return
+        data = dict([(field, value) for field, value in updates.items()
+                     if Livestate.is_collection_field(field)])
+        if data:
+            current_app.data.driver.db['%slivestate' % resource].update_one(
+                {'_id': original['_id']}, {'$set': data}, upsert=True)
+
+    @staticmethod
+    def on_deleted_item(resource, item):
+        """
+            What to do when an host or a service is deleted ...
+        """
+        if resource in ['host', 'service']:
+            current_app.data.driver.db['%slivestate' % resource].delete_one({'_id': item['_id']})
+
+    @staticmethod
+    def on_deleted_resource(resource):
+        """
+            What to do when all the hosts or services are deleted ...
+        """
+        if resource in ['host', 'service']:
+            current_app.data.driver.db['%slivestate' % resource].delete_many({})
+
+    @staticmethod
+    def host_overall_state(host, services_overall):
+        """
+            Compute the overall state of an host, see pre_host_patch
+
+        :param host: host fields
+        :type host: dict
+        :param services_overall: number of host services for each overall state identifier
+        :type services_overall: dict
+        :return: overall state identifier
+        :rtype: int
+        """
+        if not host['active_checks_enabled'] and not host['passive_checks_enabled']:
+            return 5
+
+        overall_state = 0
+        state = host['ls_state'].upper()
+        if host['ls_acknowledged']:
+            overall_state = 1
+        elif host['ls_downtimed']:
+            overall_state = 2
+        elif state == 'UNREACHABLE':
+            overall_state = 3
+        elif state == 'DOWN':
+            overall_state = 4
+
+        if overall_state <= 2:
+            for state_id, count in services_overall.items():
+                if count > 0:
+                    overall_state = max(overall_state, int(state_id))
+        return overall_state
+
+    @staticmethod
+    def service_overall_state(service):
+        """
+            Compute the overall state of a service, see pre_service_patch
+
+        :param service: service fields
+        :type service: dict
+        :return: overall state identifier
+        :rtype: int
+        """
+        if not service['active_checks_enabled'] and not service['passive_checks_enabled']:
+            return 5
+        if service['ls_acknowledged']:
+            return 1
+        if service['ls_downtimed']:
+            return 2
+        return {'WARNING': 3, 'CRITICAL': 4, 'UNKNOWN': 3,
+                'UNREACHABLE': 4}.get(service['ls_state'].upper(), 0)
+
+    @staticmethod
+    def service_overall_key(service):
+        """
+            Get the overall state identifier a service is counted with in its host services
+            overall states: only the HARD states of the monitored services are counted
+
+        :param service: service fields
+        :type service: dict
+        :return: overall state identifier, None if the service is not counted
+        :rtype: str
+        """
+        if service.get('ls_state_type') == 'HARD' and service.get('_overall_state_id', 5) < 5:
+            return str(service['_overall_state_id'])
+        return None
+
+    @staticmethod
+    def get_services_overall_increments(original, updated):
+        """
+            Get the increments of the hosts services overall states when a service is modified
+
+        :param original: original fields of the service, empty for a new service
+        :type original: dict
+        :param updated: updated fields of the service, empty for a deleted service
+        :type updated: dict
+        :return: increment of each services overall state of each host
+        :rtype: dict
+        """
+        current = dict(original)
+        current.update(updated)
+        if not updated:
+            current = {}
+        old = (original.get('host'), Livestate.service_overall_key(original))
+        new = (current.get('host'), Livestate.service_overall_key(current))
+        increments = {}
+        if old == new:
+            return increments
+        if old[1] is not None:
+            increments.setdefault(old[0], {})['_services_overall.%s' % old[1]] = -1
+        if new[1] is not None:
+            host_increments = increments.setdefault(new[0], {})
+            field = '_services_overall.%s' % new[1]
+            host_increments[field] = host_increments.get(field, 0) + 1
+        return increments
+
+    @staticmethod
+    def update_services_overall(original, updated):
+        """
+            Update the services overall states of the host of a service when the service is
+            created, modified or deleted
+
+        :param original: original fields of the service, empty for a new service
+        :type original: dict
+        :param updated: updated fields of the service, empty for a deleted service
+        :type updated: dict
+        :return: None
+        """
+        increments = Livestate.get_services_overall_increments(original, updated)
+        for host_id, host_increments in increments.items():
+            current_app.data.driver.db['host'].update_one({'_id': host_id},
+                                                          {'$inc': host_increments})
+
+    @staticmethod
+    def recalculate_services_overall(missing=False):
+        """
+            Recalculate the services overall states of the hosts with one aggregation
+
+            The services overall states are incremented by all the backend processes, the
+            recalculation of all the hosts must be run when no check result is received (see
+            cron_livestate_recalculate). When missing is True, only the hosts that do not have
+            services overall states yet are updated, this is done when the backend starts.
+
+        :param missing: only update the hosts without services overall states
+        :type missing: bool
+        :return: number of updated hosts
+        :rtype: int
+        """
+        host_db = current_app.data.driver.db['host']
+        match = {'ls_state_type': 'HARD', '_overall_state_id': {'$lt': 5}}
+        host_lookup = {}
+        host_ids = None
+        if missing:
+            host_lookup = {'_services_overall': {'$exists': False}}
+            host_ids = [host['_id'] for host in host_db.find(host_lookup, {'_id': 1})]
+            if not host_ids:
+                return 0
+            match['host'] = {'$in': host_ids}
+
+        services_overall = {}
+        groups = current_app.data.driver.db['service'].aggregate([
+            {'$match': match},
+            {'$group': {'_id': {'host': '$host', 'state_id': '$_overall_state_id'},
+                        'count': {'$sum': 1}}}
+        ])
+        for group in groups:
+            services_overall.setdefault(group['_id']['host'], {})[
+                str(group['_id']['state_id'])] = group['count']
+
+        if host_ids is None:
+            host_ids = [host['_id'] for host in host_db.find({}, {'_id': 1})]
+        operations = []
+        for host_id in host_ids:
+            lookup = dict(host_lookup)
+            lookup['_id'] = host_id
+            operations.append(pymongo.UpdateOne(
+                lookup, {'$set': {'_services_overall': services_overall.get(host_id, {})}}))
+        if operations:
+            host_db.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    @staticmethod
+    def on_deleted_service(item):
+        """
+            What to do when a service is deleted ...
+        """
+        Livestate.update_services_overall(item, {})
+
+    @staticmethod
+    def on_deleted_resource_service():
+        """
+            What to do when all the services are deleted ...
+        """
+        current_app.data.driver.db['host'].update_many({}, {'$set': {'_services_overall': {}}})
+
+    @staticmethod
+    def update_host_overall(host_id):
+        """
+            Request the overall state of an host to be recomputed at the end of the request. Out
+            of a backend request (cron routes, scheduler jobs), it is recomputed immediately
+
+        :param host_id: id of the host
+        :type host_id: ObjectId
+        :return: None
+        """
+        if not g.get('deferred_writes', False):
+            patch_internal('host', {'_overall_state_id': -1}, False, False, _id=host_id)
+            return
+        if g.get('livestate_hosts') is None:
+            g.livestate_hosts = set()
+        g.livestate_hosts.add(host_id)
+
+    @staticmethod
+    def flush():
+        """
+            Recompute the overall state of the hosts requested during the request, each host
+            is updated once. The request is already processed: an host update that fails is only
+            logged
+
+        :return: number of updated hosts
+        :rtype: int
+        """
+        count = 0
+        while g.get('livestate_hosts'):
+            host_ids = g.livestate_hosts
+            g.livestate_hosts = None
+            for host_id in host_ids:
+                try:
+                    patch_internal('host', {'_overall_state_id': -1}, False, False, _id=host_id)
+                    count += 1
+                except Exception as exp:  # pylint: disable=broad-except
+                    current_app.logger.error("Host %s overall state update failed: %s",
+                                             host_id, exp)
+        return count
+
+    @staticmethod
+    def apply(checks, issues=None):
+        # pylint: disable=too-many-locals,too-many-branches,too-many-statements
+        """
+            Update the live state of some hosts and services
+
+            Each update is validated and the Eve update hooks are run as for a PATCH: the
+            on_update and on_update_<resource> hooks (realm path, overall state, templates fields)
+            before the update, the on_updated and on_updated_<resource> hooks (live synthesis,
+            history, ...) after the bulk writes.
+
+        :param checks: live state updates, in order: resource (host or service), id of the
+        element, id of the host and live state fields
+        :type checks: list
+        :param issues: if not None, the validation errors of each refused update are stored in
+        this dictionary, with the position of the update in the checks as key
+        :type issues: dict
+        :return: number of updated elements
+        :rtype: int
+        """
+        split = Livestate.split()
+        host_ids = list(set([check[2] for check in checks]))
+        service_ids = list(set([check[1] for check in checks if check[0] == 'service']))
+        documents = {'host': {}, 'service': {}}
+        for host in Livestate.join('host', list(
+                current_app.data.driver.db['host'].find({'_id': {'$in': host_ids}}))):
+            documents['host'][host['_id']] = host
+        if service_ids:
+            for service in Livestate.join('service', list(
+                    current_app.data.driver.db['service'].find({'_id': {'$in': service_ids}}))):
+                documents['service'][service['_id']] = service
+
+        validators = {}
+        written = {'host': {}, 'service': {}}
+        written_livestate = {'host': {}, 'service': {}}
+        services_overall = {}
+        events = []
+
+        def update(resource, element_id, data, position=None):
+            """Update an element in memory as a PATCH would do"""
+            original = documents[resource].get(element_id)
+            if original is None:
+                return None
+            if resource not in validators:
+                validators[resource] = current_app.validator(
+                    current_app.config['DOMAIN'][resource]['schema'], resource=resource)
+            validator = validators[resource]
+            if not validator.validate_update(data, element_id, original):
+                current_app.logger.warning("LCR - livestate not updated for %s %s: %s",
+                                           resource, element_id, validator.errors)
+                if issues is not None and position is not None:
+                    issues[position] = validator.errors
+                return None
+            updates = validator.document
+            updates['_updated'] = datetime.utcnow().replace(microsecond=0)
+            getattr(current_app, 'on_update')(resource, updates, original)
+            getattr(current_app, 'on_update_%s' % resource)(updates, original)
+
+            updated = dict(original)
+            updated.update(updates)
+            if resource == 'host':
+                if updates.get('_overall_state_id') == -1 or \
+                        updates.get('ls_state_type') == 'HARD':
+                    updates['_overall_state_id'] = Livestate.host_overall_state(
+                        updated, updated.get('_services_overall', {}))
+            elif updates.get('ls_state_type') == 'HARD' and \
+                    set(['ls_state', 'ls_acknowledged', 'ls_downtimed']) & set(updates):
+                updates['_overall_state_id'] = Livestate.service_overall_state(updated)
+
+            document_updates = updates
+            if split:
+                # Only the modified state fields are written in the host / service document
+                document_updates = dict([(field, value) for field, value in updates.items()
+                                         if not Livestate.is_collection_field(field)])
+                document_updates = dict([(field, value)
+                                         for field, value in document_updates.items()
+                                         if original.get(field) != value])
+                written_livestate[resource].setdefault(element_id, {}).update(
+                    dict([(field, value) for field, value in updates.items()
+                          if Livestate.is_collection_field(field)]))
+
+            updated = deepcopy(original)
+            updated.update(updates)
+            if document_updates:
+                resolve_document_etag(updated, resource)
+                if '_etag' in updated:
+                    updates['_etag'] = updated['_etag']
+                    document_updates['_etag'] = updated['_etag']
+                written[resource].setdefault(element_id, {}).update(document_updates)
+            documents[resource][element_id] = updated
+            events.append((resource, updates, original))
+
+            if resource == 'service':
+                # Update the services overall states of the host
+                increments = Livestate.get_services_overall_increments(original, updates)
+                for host_id, host_increments in increments.items():
+                    Livesynthesis.merge_counters(services_overall.setdefault(host_id, {}),
+                                                 host_increments)
+                    host = documents['host'].get(host_id)
+                    if host is not None:
+                        host = dict(host)
+                        host['_services_overall'] = dict(host.get('_services_overall', {}))
+                        for field, value in host_increments.items():
+                            state_id = field.split('.')[1]
+                            host['_services_overall'][state_id] = \
+                                host['_services_overall'].get(state_id, 0) + value
+                        documents['host'][host_id] = host
+            return updates
+
+        hosts = []
+        for position, (resource, element_id, host_id, data) in enumerate(checks):
+            updates = update(resource, element_id, data, position)
+            if resource == 'service' and updates and '_overall_state_id' in updates \
+                    and host_id not in hosts:
+                hosts.append(host_id)
+        for host_id in hosts:
+            # Services overall were updated, update their host overall state once
+            update('host', host_id, {'_overall_state_id': -1})
+
+        for resource in ['service', 'host']:
+            operations = []
+            for element_id, updates in written[resource].items():
+                operation = {'$set': updates}
+                if resource == 'host' and services_overall.get(element_id):
+                    operation['$inc'] = services_overall.pop(element_id)
+                operations.append(pymongo.UpdateOne({'_id': element_id}, operation))
+            if resource == 'host':
+                operations.extend([pymongo.UpdateOne({'_id': host_id}, {'$inc': increments})
+                                   for host_id, increments in services_overall.items()
+                                   if increments])
+            if operations:
+                current_app.data.driver.db[resource].bulk_write(operations, ordered=False)
+            operations = [pymongo.UpdateOne({'_id': element_id}, {'$set': data}, upsert=True)
+                          for element_id, data in written_livestate[resource].items() if data]
+            if operations:
+                current_app.data.driver.db['%slivestate' % resource].bulk_write(operations,
+                                                                                ordered=False)
+
+        # The host overall states and services overall states are already updated by this batch
+        g.livestate_bulk = True
+        Livesynthesis.start_batch()
+        try:
+            for resource, updates, original in events:
+                getattr(current_app, 'on_updated')(resource, updates, original)
+                getattr(current_app, 'on_updated_%s' % resource)(updates, original)
+        finally:
+            Livesynthesis.end_batch()
+            g.livestate_bulk = False
+        return len(set(written['host']) | set(written_livestate['host'])) + \
+            len(set(written['service']) | set(written_livestate['service']))
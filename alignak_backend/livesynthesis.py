@@ -8,279 +8,684 @@
 """
 from __future__ import print_function
 import os
+import calendar
+import threading
+import time
+from datetime import datetime, timedelta
 import pymongo
-from flask import current_app, g, request
-from eve.methods.patch import patch_internal
+from flask import current_app, g, request, abort, make_response
+from eve.utils import str_to_date
 
+from alignak_backend.realmtree import RealmTree
 from alignak_backend.timeseries import Timeseries
 
 
 class Livesynthesis(object):
     """
         Livesynthesis class
+
+        When LIVESYNTHESIS_FLUSH_PERIOD is set, the counters modifications are not written on
+        each host / service modification. They are merged per realm in memory and flushed with
+        one bulk write every LIVESYNTHESIS_FLUSH_PERIOD seconds or when LIVESYNTHESIS_FLUSH_COUNT
+        modifications are pending. The live synthesis metrics are sent to the TSDB by the
+        periodic flush only, once for each modified realm.
+
+        The pending modifications are kept in memory by each process. A recalculation stamps
+        the realms live synthesis with its start time (`_recalculating`, then `_recalculated`
+        once written) and the flush of each process drops the pending modifications made
+        before this time because they are already included in the recalculated counters.
     """
+    # Live synthesis states counters for each element type
+    counters = {
+        'hosts': ['up_hard', 'up_soft', 'down_hard', 'down_soft',
+                  'unreachable_hard', 'unreachable_soft'],
+        'services': ['ok_hard', 'ok_soft', 'warning_hard', 'warning_soft',
+                     'critical_hard', 'critical_soft', 'unknown_hard', 'unknown_soft',
+                     'unreachable_hard', 'unreachable_soft']
+    }
+
+    # Pending counters modifications of each realm (write-behind), per second of modification
+    pending = {}
+    # Number of pending modifications
+    pending_count = 0
+    # Realms modified since the last metrics sending
+    pending_metrics = set()
+    # Realms which live synthesis must be recalculated, None for all the realms
+    pending_recalculate = set()
+    # Protect the pending modifications
+    lock = threading.Lock()
+    # Position of the next realms to check in the realms list
+    check_position = 0
+    # A recalculation not ended after this delay (seconds) is considered as failed
+    recalculate_timeout = 300
+    # Functions called when a batch of modifications is ended
+    end_batch_handlers = []
+
+    @staticmethod
+    def get_empty_counters(type_check):
+        """
+            Get the live synthesis counters of an element type, all set to 0
+
+        :param type_check: hosts or services
+        :type type_check: str
+        :return: live synthesis counters
+        :rtype: dict
+        """
+        data = {'%s_total' % type_check: 0, '%s_not_monitored' % type_check: 0,
+                '%s_acknowledged' % type_check: 0, '%s_in_downtime' % type_check: 0}
+        for counter in Livesynthesis.counters[type_check]:
+            data['%s_%s' % (type_check, counter)] = 0
+        return data
+
+    @staticmethod
+    def aggregate_counters(type_check, match=None):
+        """
+            Count the elements of a type for each realm with one aggregation grouping the
+            elements by realm, monitored state, state, state type, acknowledgement and downtime
+
+        :param type_check: hosts or services
+        :type type_check: str
+        :param match: filter the counted elements
+        :type match: dict
+        :return: live synthesis counters of each realm
+        :rtype: dict
+        """
+        lookup = {'_is_template': False}
+        if match:
+            lookup.update(match)
+        collection = current_app.data.driver.db[type_check[:-1]]
+        groups = collection.aggregate([
+            {'$match': lookup},
+            {'$group': {
+                '_id': {
+                    'realm': '$_realm',
+                    'monitored': {'$or': ['$active_checks_enabled',
+                                          '$passive_checks_enabled']},
+                    'state': '$ls_state',
+                    'state_type': '$ls_state_type',
+                    'acknowledged': '$ls_acknowledged',
+                    'downtimed': '$ls_downtimed'
+                },
+                'count': {'$sum': 1}
+            }}
+        ])
+
+        realms = {}
+        for group in groups:
+            key = group['_id']
+            if key['realm'] not in realms:
+                realms[key['realm']] = Livesynthesis.get_empty_counters(type_check)
+            Livesynthesis.add_counters(realms[key['realm']], type_check, key, group['count'])
+        return realms
+
+    @staticmethod
+    def add_counters(data, type_check, key, count):
+        """
+            Count some elements in the live synthesis counters
+
+        :param data: live synthesis counters, updated
+        :type data: dict
+        :param type_check: hosts or services
+        :type type_check: str
+        :param key: state of the elements: monitored, state, state_type, acknowledged and
+        downtimed
+        :type key: dict
+        :param count: number of elements
+        :type count: int
+        :return: None
+        """
+        data['%s_total' % type_check] += count
+        if not key['monitored']:
+            data['%s_not_monitored' % type_check] += count
+            return
+        if key.get('acknowledged') is True:
+            data['%s_acknowledged' % type_check] += count
+        elif key.get('acknowledged') is False and key.get('state') \
+                and key.get('state_type'):
+            counter = "%s_%s_%s" % (type_check, key['state'].lower(),
+                                    key['state_type'].lower())
+            if counter in data:
+                data[counter] += count
+        if key.get('downtimed') is True:
+            data['%s_in_downtime' % type_check] += count
+
     @staticmethod
-    def recalculate():
+    def recalculate(realms=None):
         """
-            Recalculate all the live synthesis counters
+            Recalculate the live synthesis counters
+
+            The hosts and services counters of all the realms are computed with one aggregation
+            on each collection and they are written with one bulk write.
+
+        :param realms: only recalculate the counters of these realms, None for all the realms
+        :type realms: list
+        :return: number of realms and time spent in each step
+        :rtype: dict
         """
-        current_app.logger.debug("LS - Recalculating...")
+        current_app.logger.debug("LS - Recalculating %s...", realms or 'all realms')
+        start = time.time()
+        lookup = {}
+        match = None
+        if realms is not None:
+            lookup = {'_id': {'$in': list(realms)}}
+            match = {'_realm': {'$in': list(realms)}}
+        timing = {}
         livesynthesis = current_app.data.driver.db['livesynthesis']
-        realmsdrv = current_app.data.driver.db['realm']
-        allrealms = realmsdrv.find()
-        for _, realm in enumerate(allrealms):
-            live_current = livesynthesis.find_one({'_realm': realm['_id']})
-            if live_current is None:
-                current_app.logger.debug("     new LS for realm %s", realm['name'])
-                data = {
-                    'hosts_total': 0,
-                    'hosts_not_monitored': 0,
-                    'hosts_up_hard': 0,
-                    'hosts_up_soft': 0,
-                    'hosts_down_hard': 0,
-                    'hosts_down_soft': 0,
-                    'hosts_unreachable_hard': 0,
-                    'hosts_unreachable_soft': 0,
-                    'hosts_acknowledged': 0,
-                    'hosts_in_downtime': 0,
-                    'hosts_flapping': 0,
-                    'services_total': 0,
-                    'services_not_monitored': 0,
-                    'services_ok_hard': 0,
-                    'services_ok_soft': 0,
-                    'services_warning_hard': 0,
-                    'services_warning_soft': 0,
-                    'services_critical_hard': 0,
-                    'services_critical_soft': 0,
-                    'services_unreachable_hard': 0,
-                    'services_unreachable_soft': 0,
-                    'services_unknown_hard': 0,
-                    'services_unknown_soft': 0,
-                    'services_acknowledged': 0,
-                    'services_in_downtime': 0,
-                    'services_flapping': 0,
-                    '_realm': realm['_id']
-                }
-                livesynthesis.insert(data)
-                live_current = livesynthesis.find_one({'_realm': realm['_id']})
-
-            # Update hosts live synthesis
-            hosts = current_app.data.driver.db['host']
-            hosts_count = hosts.count({'_is_template': False, '_realm': realm['_id']})
-            data = {'hosts_total': hosts_count}
-
-            data['hosts_not_monitored'] = hosts.count({
-                '_is_template': False,
-                'active_checks_enabled': False, 'passive_checks_enabled': False,
-                '_realm': realm['_id']
-            })
-            data['hosts_up_hard'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UP', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['hosts_down_hard'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'DOWN', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['hosts_unreachable_hard'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNREACHABLE', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-
-            data['hosts_up_soft'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UP', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['hosts_down_soft'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'DOWN', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['hosts_unreachable_soft'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNREACHABLE', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-
-            data['hosts_acknowledged'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_acknowledged': True, '_realm': realm['_id']
-            })
-            data['hosts_in_downtime'] = hosts.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_downtimed': True, '_realm': realm['_id']
-            })
-
-            current_app.logger.debug("     realm %s, hosts LS: %s", realm['name'], data)
-
-            lookup = {"_id": live_current['_id']}
-            patch_internal('livesynthesis', data, False, False, **lookup)
+        if current_app.config.get('LIVESYNTHESIS_FLUSH_PERIOD'):
+            # Write the pending modifications of this process before the recalculation, the
+            # other processes will drop their modifications made before it
+            Livesynthesis.flush()
+            livesynthesis.update_many(match or {}, {'$set': {'_recalculating': start}})
+        realms = [realm['_id'] for realm in
+                  current_app.data.driver.db['realm'].find(lookup, {'_id': 1})]
+        timing['realms'] = time.time() - start
+
+        counters = {}
+        for type_check in ['hosts', 'services']:
+            step = time.time()
+            counters[type_check] = Livesynthesis.aggregate_counters(type_check, match)
+            timing[type_check] = time.time() - step
+
+        step = time.time()
+        now = datetime.utcnow()
+        operations = []
+        realms_data = {}
+        for realm_id in realms:
+            data = {'_updated': now, '_recalculated': start}
+            for type_check in ['hosts', 'services']:
+                data.update(counters[type_check].get(
+                    realm_id, Livesynthesis.get_empty_counters(type_check)))
+            realms_data[realm_id] = data
+            operations.append(pymongo.UpdateOne(
+                {'_realm': realm_id},
+                {'$set': data,
+                 '$unset': {'_recalculating': ''},
+                 '$setOnInsert': {'hosts_flapping': 0, 'services_flapping': 0,
+                                  '_realm_path': RealmTree.path(realm_id),
+                                  '_created': now}},
+                upsert=True))
+        if operations:
+            livesynthesis.bulk_write(operations, ordered=False)
+        timing['write'] = time.time() - step
+
+        step = time.time()
+        Livesynthesis.rollup(None if match is None else realms)
+        timing['rollup'] = time.time() - step
+
+        # Send livesynthesis to TSDB
+        step = time.time()
+        for realm_id, data in realms_data.items():
+            Timeseries.send_livesynthesis_metrics(realm_id, data)
+        timing['timeseries'] = time.time() - step
+
+        timing['total'] = time.time() - start
+        current_app.logger.info("LS - Recalculated %d realms: %s", len(realms), timing)
+        return {'realms': len(realms), 'timing': timing}
 
-            # Send livesynthesis to TSDB
-            Timeseries.send_livesynthesis_metrics(realm['_id'], data)
-
-            # Update services live synthesis
-            services = current_app.data.driver.db['service']
-            services_count = services.count({'_is_template': False, '_realm': realm['_id']})
-            data = {'services_total': services_count}
-
-            data['services_not_monitored'] = services.count({
-                '_is_template': False,
-                'active_checks_enabled': False, 'passive_checks_enabled': False,
-                '_realm': realm['_id']
-            })
-            data['services_ok_hard'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'OK', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_warning_hard'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'WARNING', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_critical_hard'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'CRITICAL', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_unknown_hard'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNKNOWN', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_unreachable_hard'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNREACHABLE', 'ls_state_type': 'HARD',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-
-            data['services_ok_soft'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'OK', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_warning_soft'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'WARNING', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_critical_soft'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'CRITICAL', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_unknown_soft'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNKNOWN', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-            data['services_unreachable_soft'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_state': 'UNREACHABLE', 'ls_state_type': 'SOFT',
-                'ls_acknowledged': False, '_realm': realm['_id']
-            })
-
-            data['services_acknowledged'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_acknowledged': True, '_realm': realm['_id']
-            })
-            data['services_in_downtime'] = services.count({
-                '_is_template': False,
-                '$or': [{'active_checks_enabled': True}, {'passive_checks_enabled': True}],
-                'ls_downtimed': True, '_realm': realm['_id']
-            })
-
-            current_app.logger.debug("     realm %s, services LS: %s", realm['name'], data)
-
-            lookup = {"_id": live_current['_id']}
-            patch_internal('livesynthesis', data, False, False, **lookup)
+    @staticmethod
+    def get_counters_names():
+        """
+            Get the names of all the live synthesis counters
+
+        :return: counters names
+        :rtype: list
+        """
+        names = ['hosts_flapping', 'services_flapping']
+        for type_check in ['hosts', 'services']:
+            names.extend(Livesynthesis.get_empty_counters(type_check))
+        return names
+
+    @staticmethod
+    def rollup(realms=None):
+        """
+            Compute the counters of the realms sub-trees (`_subtree` field) from the counters of
+            each realm
+
+        :param realms: compute the sub-trees that include these realms (the realms and their
+        ancestors), None for all the realms
+        :type realms: list
+        :return: number of updated realms
+        :rtype: int
+        """
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+        names = Livesynthesis.get_counters_names()
+        projection = dict([(name, 1) for name in names])
+        projection['_realm'] = 1
+        counters = {}
+        for live_current in livesynthesis_db.find({}, projection):
+            counters[live_current['_realm']] = live_current
+
+        if realms is None:
+            targets = set(counters)
+        else:
+            targets = set(realms)
+            for realm_id in realms:
+                targets.update(RealmTree.ancestors(realm_id))
+
+        operations = []
+        for realm_id in targets:
+            if realm_id not in counters:
+                continue
+            subtree = dict([(name, 0) for name in names])
+            for sub_realm in [realm_id] + RealmTree.descendants(realm_id):
+                if sub_realm in counters:
+                    for name in names:
+                        subtree[name] += counters[sub_realm].get(name, 0)
+            operations.append(pymongo.UpdateOne({'_realm': realm_id},
+                                                {'$set': {'_subtree': subtree}}))
+        if operations:
+            livesynthesis_db.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    @staticmethod
+    def schedule_rollup():
+        """
+            Request the sub-trees counters of all the realms to be computed at the end of the
+            request, once whatever the number of modified realms. Out of a backend request (cron
+            routes, scheduler jobs), they are computed immediately
+
+        :return: None
+        """
+        if not g.get('deferred_writes', False):
+            Livesynthesis.rollup()
+            return
+        g.livesynthesis_rollup = True
+
+    @staticmethod
+    def flush_rollup():
+        """
+            Compute the sub-trees counters of all the realms if it was requested during the
+            request
+
+        :return: number of updated realms
+        :rtype: int
+        """
+        if not g.get('livesynthesis_rollup'):
+            return 0
+        g.livesynthesis_rollup = False
+        return Livesynthesis.rollup()
+
+    @staticmethod
+    def get_increments(realm_id, data, increments):
+        """
+            Add the counters increments of a realm to the increments of each live synthesis:
+            the realm counters and the sub-tree counters of the realm and its ancestors
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :param data: increment of each counter
+        :type data: dict
+        :param increments: increments of each realm live synthesis, updated
+        :type increments: dict
+        :return: None
+        """
+        subtree = dict([('_subtree.%s' % counter, value) for counter, value in data.items()])
+        Livesynthesis.merge_counters(increments.setdefault(realm_id, {}), data)
+        for ancestor in [realm_id] + RealmTree.ancestors(realm_id):
+            Livesynthesis.merge_counters(increments.setdefault(ancestor, {}), subtree)
+
+    @staticmethod
+    def check(count):
+        """
+            Check the live synthesis counters of some realms: the counters of the realms are
+            counted again and compared with the stored counters. The drift of each checked realm
+            (sum of the counters differences) is sent to the TSDB and the realms with a drift
+            are recalculated.
+
+            The realms are checked in turn, each call checks the next realms.
+
+        :param count: number of realms to check
+        :type count: int
+        :return: number of checked realms, drift of the drifted realms and time spent
+        :rtype: dict
+        """
+        start = time.time()
+        if current_app.config.get('LIVESYNTHESIS_FLUSH_PERIOD'):
+            # The pending modifications are not a drift
+            Livesynthesis.flush()
+
+        realms = sorted([realm['_id'] for realm in
+                         current_app.data.driver.db['realm'].find({}, {'_id': 1})])
+        if not realms:
+            return {'realms': 0, 'drift': {}, 'timing': {'total': time.time() - start}}
+        position = Livesynthesis.check_position % len(realms)
+        realms = (realms[position:] + realms[:position])[:count]
+        Livesynthesis.check_position = position + len(realms)
+
+        counters = {}
+        match = {'_realm': {'$in': realms}}
+        for type_check in ['hosts', 'services']:
+            counters[type_check] = Livesynthesis.aggregate_counters(type_check, match)
+        stored = {}
+        for live_current in current_app.data.driver.db['livesynthesis'].find(match):
+            stored[live_current['_realm']] = live_current
+
+        drift = {}
+        drifted = []
+        for realm_id in realms:
+            realm_drift = 0
+            for type_check in ['hosts', 'services']:
+                data = counters[type_check].get(
+                    realm_id, Livesynthesis.get_empty_counters(type_check))
+                for counter, value in data.items():
+                    realm_drift += abs(stored.get(realm_id, {}).get(counter, 0) - value)
+            if realm_id not in stored:
+                realm_drift += 1
+            Timeseries.send_livesynthesis_metrics(realm_id, {'drift': realm_drift})
+            if realm_drift:
+                drift[str(realm_id)] = realm_drift
+                drifted.append(realm_id)
+
+        if drifted:
+            current_app.logger.warning("LS - Drift of the realms counters: %s", drift)
+            Livesynthesis.recalculate(drifted)
+        return {'realms': len(realms), 'drift': drift, 'timing': {'total': time.time() - start}}
+
+    @staticmethod
+    def schedule_recalculate(realm_id=None):
+        """
+            Request a recalculation of the live synthesis counters of a realm
+
+            When LIVESYNTHESIS_RECALCULATE_PERIOD is set, the requests are deduplicated and
+            the realms are recalculated together by the next periodic job. Else, in a batch of
+            modifications, the realms are recalculated once when the batch is ended, otherwise
+            the realm is recalculated immediately.
+
+        :param realm_id: id of the realm, None for all the realms
+        :type realm_id: ObjectId
+        :return: None
+        """
+        if current_app.config.get('LIVESYNTHESIS_RECALCULATE_PERIOD'):
+            with Livesynthesis.lock:
+                Livesynthesis.pending_recalculate.add(realm_id)
+            return
+
+        if getattr(g, 'livesynthesis_batch', None) is not None:
+            g.livesynthesis_batch_recalculate.add(realm_id)
+            return
+
+        Livesynthesis.recalculate(None if realm_id is None else [realm_id])
+
+    @staticmethod
+    def recalculate_scheduled():
+        """
+            Recalculate the live synthesis counters of the realms which recalculation was
+            requested since the last call
+
+        :return: number of realms and time spent in each step, None if nothing to do
+        :rtype: dict
+        """
+        with Livesynthesis.lock:
+            realms = Livesynthesis.pending_recalculate
+            Livesynthesis.pending_recalculate = set()
+        if not realms:
+            return None
+        if None in realms:
+            return Livesynthesis.recalculate()
+        return Livesynthesis.recalculate(list(realms))
+
+    @staticmethod
+    def update_counters(realm_id, data):
+        """
+            Increment the live synthesis counters of a realm
+
+            When the write-behind is enabled, the increments are merged with the pending ones
+            and they will be written by the next flush. Else they are written immediately and the
+            live synthesis is sent to the TSDB.
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :param data: increment of each counter
+        :type data: dict
+        :return: None
+        """
+        batch = getattr(g, 'livesynthesis_batch', None)
+        if batch is not None:
+            Livesynthesis.merge_counters(batch.setdefault(realm_id, {}), data)
+            return
+
+        if not current_app.config.get('LIVESYNTHESIS_FLUSH_PERIOD'):
+            livesynthesis_db = current_app.data.driver.db['livesynthesis']
+            subtree = dict([('_subtree.%s' % counter, value) for counter, value in data.items()])
+            increments = dict(data)
+            increments.update(subtree)
+            result = livesynthesis_db.update_one({'_realm': realm_id}, {'$inc': increments})
+            if not result.matched_count:
+                Livesynthesis.schedule_recalculate(realm_id)
+                return
+            ancestors = RealmTree.ancestors(realm_id)
+            if ancestors:
+                # Update the sub-tree counters of the realm ancestors
+                livesynthesis_db.update_many({'_realm': {'$in': ancestors}}, {'$inc': subtree})
 
             # Send livesynthesis to TSDB
-            Timeseries.send_livesynthesis_metrics(realm['_id'], data)
+            live_current = livesynthesis_db.find_one({'_realm': realm_id})
+            Timeseries.send_livesynthesis_metrics(realm_id, live_current)
+            return
+
+        count = Livesynthesis.add_pending(realm_id, data)
+        if count >= current_app.config['LIVESYNTHESIS_FLUSH_COUNT']:
+            Livesynthesis.flush()
+
+    @staticmethod
+    def add_pending(realm_id, data, when=None):
+        """
+            Merge counters increments of a realm with the pending modifications made in the
+            same second
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :param data: increment of each counter
+        :type data: dict
+        :param when: time of the modification, now if None
+        :type when: float
+        :return: number of pending modifications
+        :rtype: int
+        """
+        second = int(time.time() if when is None else when)
+        with Livesynthesis.lock:
+            buckets = Livesynthesis.pending.setdefault(realm_id, {})
+            Livesynthesis.merge_counters(buckets.setdefault(second, {}), data)
+            Livesynthesis.pending_count += 1
+            Livesynthesis.pending_metrics.add(realm_id)
+            return Livesynthesis.pending_count
+
+    @staticmethod
+    def merge_pending(buckets, state):
+        """
+            Merge the pending modifications of a live synthesis made since its last
+            recalculation. The modifications made before the recalculation are already included
+            in the recalculated counters. While the live synthesis is being recalculated, the
+            modifications made since the recalculation start must be kept pending.
+
+        :param buckets: pending increments of each counter per second of modification
+        :type buckets: dict
+        :param state: `_recalculated` and `_recalculating` fields of the live synthesis
+        :type state: dict
+        :return: merged increment of each counter and the increments to keep pending
+        :rtype: tuple
+        """
+        recalculated = state.get('_recalculated', 0)
+        recalculating = state.get('_recalculating')
+        # Older recalculations that are not ended failed
+        timeout = time.time() - Livesynthesis.recalculate_timeout
+        if recalculating is not None and recalculating < timeout:
+            recalculating = None
+        counters = {}
+        kept = {}
+        for second, data in buckets.items():
+            if second + 1 <= recalculated:
+                continue
+            if recalculating is not None:
+                if second + 1 > recalculating:
+                    kept[second] = data
+                continue
+            Livesynthesis.merge_counters(counters, data)
+        counters = dict([(counter, value) for counter, value in counters.items() if value])
+        return counters, kept
+
+    @staticmethod
+    def merge_counters(counters, data):
+        """
+            Add counters increments to other ones
+
+        :param counters: increment of each counter, updated
+        :type counters: dict
+        :param data: increment of each counter to add
+        :type data: dict
+        :return: None
+        """
+        for counter, value in data.items():
+            counters[counter] = counters.get(counter, 0) + value
+
+    @staticmethod
+    def start_batch():
+        """
+            Start a batch of modifications: the counters increments of the following
+            modifications are merged per realm until the batch is ended. Batches may be nested,
+            the counters are updated when the outer batch is ended
+
+        :return: None
+        """
+        depth = getattr(g, 'livesynthesis_batch_depth', 0)
+        if not depth:
+            g.livesynthesis_batch = {}
+            g.livesynthesis_batch_recalculate = set()
+        g.livesynthesis_batch_depth = depth + 1
+
+    @staticmethod
+    def end_batch():
+        """
+            End a batch of modifications: update the counters of each modified realm once, or
+            recalculate them if it was requested during the batch
+
+        :return: None
+        """
+        g.livesynthesis_batch_depth -= 1
+        if g.livesynthesis_batch_depth:
+            return
+        batch = g.livesynthesis_batch
+        recalculate = g.livesynthesis_batch_recalculate
+        g.livesynthesis_batch = None
+        for handler in Livesynthesis.end_batch_handlers:
+            handler()
+        if None in recalculate:
+            Livesynthesis.recalculate()
+            return
+        if recalculate:
+            Livesynthesis.recalculate(list(recalculate))
+        for realm_id, data in batch.items():
+            data = dict([(counter, value) for counter, value in data.items() if value])
+            if data and realm_id not in recalculate:
+                Livesynthesis.update_counters(realm_id, data)
+
+    @staticmethod
+    def flush(send_metrics=False):
+        """
+            Write the pending live synthesis counters modifications, one merged increment for
+            each realm
+
+            The modifications made before the last recalculation of a realm are dropped. While a
+            realm is being recalculated, the modifications made since the recalculation start
+            are kept for the next flush.
+
+        :param send_metrics: send the live synthesis of the modified realms to the TSDB
+        :type send_metrics: bool
+        :return: number of updated realms
+        :rtype: int
+        """
+        with Livesynthesis.lock:
+            pending = Livesynthesis.pending
+            Livesynthesis.pending = {}
+            Livesynthesis.pending_count = 0
+            realms = []
+            if send_metrics:
+                realms = list(Livesynthesis.pending_metrics)
+                Livesynthesis.pending_metrics = set()
+
+        livesynthesis_db = current_app.data.driver.db['livesynthesis']
+        states = {}
+        if pending:
+            for live_current in livesynthesis_db.find(
+                    {'_realm': {'$in': list(pending)}},
+                    {'_realm': 1, '_recalculated': 1, '_recalculating': 1}):
+                states[live_current['_realm']] = live_current
+
+        increments = {}
+        for realm_id, buckets in pending.items():
+            counters, kept = Livesynthesis.merge_pending(buckets, states.get(realm_id, {}))
+            for second, data in kept.items():
+                Livesynthesis.add_pending(realm_id, data, second)
+            if counters:
+                Livesynthesis.get_increments(realm_id, counters, increments)
+        operations = [pymongo.UpdateOne({'_realm': realm_id}, {'$inc': counters})
+                      for realm_id, counters in increments.items()]
+        if operations:
+            result = livesynthesis_db.bulk_write(operations, ordered=False)
+            current_app.logger.debug("LS - flushed %d realms", len(operations))
+            if result.matched_count < len(operations):
+                # Some realms live synthesis are missing, they will be recalculated
+                found = livesynthesis_db.distinct('_realm', {'_realm': {'$in': list(increments)}})
+                for realm_id in set(increments).difference(found):
+                    Livesynthesis.schedule_recalculate(realm_id)
+
+        # Send livesynthesis to TSDB
+        if realms:
+            for live_current in livesynthesis_db.find({'_realm': {'$in': realms}}):
+                Timeseries.send_livesynthesis_metrics(live_current['_realm'], live_current)
+        return len(operations)
 
     @staticmethod
     def on_inserted_host(items):
         """
             What to do when an host is inserted in the backend ...
+
+            The counters increments of all the inserted hosts are merged per realm and the
+            counters of each realm are updated once.
         """
-        livesynthesis_db = current_app.data.driver.db['livesynthesis']
-        for _, item in enumerate(items):
-            if item['_is_template']:
-                continue
+        Livesynthesis.start_batch()
+        try:
+            for _, item in enumerate(items):
+                if item['_is_template']:
+                    continue
 
-            live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-            if live_current is None:
-                ls = Livesynthesis()
-                ls.recalculate()
-            else:
                 typecheck = 'hosts'
                 if not item['active_checks_enabled'] and not item['passive_checks_enabled']:
-                    data = {"$inc": {"%s_not_monitored" % typecheck: 1,
-                                     "%s_total" % typecheck: 1}}
+                    data = {"%s_not_monitored" % typecheck: 1, "%s_total" % typecheck: 1}
                 else:
-                    data = {"$inc": {"%s_%s_%s" % (typecheck, item['ls_state'].lower(),
-                                                   item['ls_state_type'].lower()): 1,
-                                     "%s_total" % typecheck: 1}}
+                    data = {"%s_%s_%s" % (typecheck, item['ls_state'].lower(),
+                                          item['ls_state_type'].lower()): 1,
+                            "%s_total" % typecheck: 1}
                 current_app.logger.debug("LS - inserted host %s: %s...", item['name'], data)
-                current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-                # Send livesynthesis to TSDB
-                live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-                Timeseries.send_livesynthesis_metrics(item['_realm'], live_current)
+                Livesynthesis.update_counters(item['_realm'], data)
+        finally:
+            Livesynthesis.end_batch()
 
     @staticmethod
     def on_inserted_service(items):
         """
             What to do when a service is inserted in the backend ...
+
+            The counters increments of all the inserted services are merged per realm and the
+            counters of each realm are updated once.
         """
-        livesynthesis_db = current_app.data.driver.db['livesynthesis']
-        for _, item in enumerate(items):
-            if item['_is_template']:
-                continue
+        Livesynthesis.start_batch()
+        try:
+            for _, item in enumerate(items):
+                if item['_is_template']:
+                    continue
 
-            live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-            if live_current is None:
-                ls = Livesynthesis()
-                ls.recalculate()
-            else:
                 typecheck = 'services'
                 if not item['active_checks_enabled'] and not item['passive_checks_enabled']:
-                    data = {"$inc": {"%s_not_monitored" % typecheck: 1,
-                                     "%s_total" % typecheck: 1}}
+                    data = {"%s_not_monitored" % typecheck: 1, "%s_total" % typecheck: 1}
                 else:
-                    data = {"$inc": {"%s_%s_%s" % (typecheck, item['ls_state'].lower(),
-                                                   item['ls_state_type'].lower()): 1,
-                                     "%s_total" % typecheck: 1}}
+                    data = {"%s_%s_%s" % (typecheck, item['ls_state'].lower(),
+                                          item['ls_state_type'].lower()): 1,
+                            "%s_total" % typecheck: 1}
                 current_app.logger.debug("LS - inserted service %s: %s...", item['name'], data)
-                current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-                # Send livesynthesis to TSDB
-                live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-                Timeseries.send_livesynthesis_metrics(item['_realm'], live_current)
+                Livesynthesis.update_counters(item['_realm'], data)
+        finally:
+            Livesynthesis.end_batch()
 
     @staticmethod
     def on_updated_host(updated, original):
@@ -301,22 +706,14 @@ class Livesynthesis(object):
 
         minus, plus = Livesynthesis.livesynthesis_to_update('hosts', updated, original)
         if minus is not False:
-            livesynthesis_db = current_app.data.driver.db['livesynthesis']
-            live_current = livesynthesis_db.find_one({'_realm': original['_realm']})
-            if live_current is None or 'not_monitored' in minus \
-                    or (plus and 'not_monitored' in plus):
-                ls = Livesynthesis()
-                ls.recalculate()
+            if 'not_monitored' in minus or (plus and 'not_monitored' in plus):
+                Livesynthesis.schedule_recalculate(original['_realm'])
             else:
-                data = {"$inc": {minus: -1}}
+                data = {minus: -1}
                 if plus is not False:
-                    data = {"$inc": {minus: -1, plus: 1}}
+                    data = {minus: -1, plus: 1}
                 current_app.logger.debug("LS - updated host %s: %s...", original['name'], data)
-                current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-                # Send livesynthesis to TSDB
-                live_current = livesynthesis_db.find_one({'_realm': original['_realm']})
-                Timeseries.send_livesynthesis_metrics(original['_realm'], live_current)
+                Livesynthesis.update_counters(original['_realm'], data)
 
     @staticmethod
     def on_updated_service(updated, original):
@@ -337,24 +734,16 @@ class Livesynthesis(object):
 
         minus, plus = Livesynthesis.livesynthesis_to_update('services', updated, original)
         if minus is not False:
-            livesynthesis_db = current_app.data.driver.db['livesynthesis']
-            live_current = livesynthesis_db.find_one({'_realm': original['_realm']})
-            if live_current is None \
-                    or (not isinstance(minus, bool) and 'not_monitored' in minus) \
+            if (not isinstance(minus, bool) and 'not_monitored' in minus) \
                     or (not isinstance(plus, bool) and 'not_monitored' in plus):
-                ls = Livesynthesis()
-                ls.recalculate()
+                Livesynthesis.schedule_recalculate(original['_realm'])
             else:
-                data = {"$inc": {minus: -1}}
+                data = {minus: -1}
                 if plus is not False:
-                    data = {"$inc": {minus: -1, plus: 1}}
+                    data = {minus: -1, plus: 1}
                 current_app.logger.debug("LS - updated service %s: %s...",
                                          original['name'], data)
-                current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-                # Send livesynthesis to TSDB
-                live_current = livesynthesis_db.find_one({'_realm': original['_realm']})
-                Timeseries.send_livesynthesis_metrics(original['_realm'], live_current)
+                Livesynthesis.update_counters(original['_realm'], data)
 
     @staticmethod
     def on_deleted_host(item):
@@ -367,20 +756,10 @@ class Livesynthesis(object):
         if item['_is_template']:
             return
 
-        livesynthesis_db = current_app.data.driver.db['livesynthesis']
-        live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-        if live_current is None:
-            ls = Livesynthesis()
-            ls.recalculate()
-        else:
-            minus = Livesynthesis.livesynthesis_to_delete('hosts', item)
-            data = {"$inc": {minus: -1, 'hosts_total': -1}}
-            current_app.logger.debug("LS - Deleted host %s: %s", item['name'], data)
-            current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-            # Send livesynthesis to TSDB
-            live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-            Timeseries.send_livesynthesis_metrics(item['_realm'], live_current)
+        minus = Livesynthesis.livesynthesis_to_delete('hosts', item)
+        data = {minus: -1, 'hosts_total': -1}
+        current_app.logger.debug("LS - Deleted host %s: %s", item['name'], data)
+        Livesynthesis.update_counters(item['_realm'], data)
 
     @staticmethod
     def on_deleted_resource_host():
@@ -389,8 +768,7 @@ class Livesynthesis(object):
         :return: None
         """
         current_app.logger.debug("LS - Deleted all hosts...")
-        ls = Livesynthesis()
-        ls.recalculate()
+        Livesynthesis.schedule_recalculate()
 
     @staticmethod
     def on_deleted_service(item):
@@ -403,20 +781,10 @@ class Livesynthesis(object):
         if item['_is_template']:
             return
 
-        livesynthesis_db = current_app.data.driver.db['livesynthesis']
-        live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-        if live_current is None:
-            ls = Livesynthesis()
-            ls.recalculate()
-        else:
-            minus = Livesynthesis.livesynthesis_to_delete('services', item)
-            data = {"$inc": {minus: -1, 'services_total': -1}}
-            current_app.logger.debug("LS - Deleted service %s: %s", item['name'], data)
-            current_app.data.driver.db.livesynthesis.update({'_id': live_current['_id']}, data)
-
-            # Send livesynthesis to TSDB
-            live_current = livesynthesis_db.find_one({'_realm': item['_realm']})
-            Timeseries.send_livesynthesis_metrics(item['_realm'], live_current)
+        minus = Livesynthesis.livesynthesis_to_delete('services', item)
+        data = {minus: -1, 'services_total': -1}
+        current_app.logger.debug("LS - Deleted service %s: %s", item['name'], data)
+        Livesynthesis.update_counters(item['_realm'], data)
 
     @staticmethod
     def on_deleted_resource_service():
@@ -426,8 +794,7 @@ class Livesynthesis(object):
         """
         current_app.logger.debug("LS - Deleted all services...")
         # the most simple method is to recalculate the livesynthesis
-        ls = Livesynthesis()
-        ls.recalculate()
+        Livesynthesis.schedule_recalculate()
 
     @staticmethod
     def livesynthesis_to_delete(type_check, item):
@@ -536,6 +903,163 @@ class Livesynthesis(object):
 
         return minus, plus
 
+    @staticmethod
+    def get_history(livesynthesis_id, start=None, end=None, max_points=None, resolution=None):
+        # pylint: disable=too-many-arguments
+        """
+            Get the history of some live synthesis, summed for each date, the most recent
+            first. The history is computed by the database with one aggregation.
+
+            If a resolution is requested, the history is got from the coarsest history tier
+            which resolution is not greater than the requested one.
+
+        :param livesynthesis_id: list of the live synthesis id
+        :type livesynthesis_id: list
+        :param start: only get the history since this date
+        :type start: datetime
+        :param end: only get the history until this date
+        :type end: datetime
+        :param max_points: only get the most recent points
+        :type max_points: int
+        :param resolution: requested resolution, in seconds
+        :type resolution: int
+        :return: the history
+        :rtype: list
+        """
+        tiers = [tier[0] for tier in current_app.config.get('LIVESYNTHESIS_HISTORY_TIERS', [])
+                 if resolution and tier[0] <= resolution]
+        if tiers:
+            return Livesynthesis.get_tier_history(livesynthesis_id, max(tiers), start, end,
+                                                  max_points)
+
+        names = Livesynthesis.get_counters_names()
+        match = {'livesynthesis': {'$in': livesynthesis_id}}
+        if start is not None or end is not None:
+            match['_created'] = {}
+            if start is not None:
+                match['_created']['$gte'] = start
+            if end is not None:
+                match['_created']['$lte'] = end
+
+        pipeline = [{'$match': match}]
+        if len(livesynthesis_id) > 1:
+            group = {'_id': '$_created'}
+            for name in names:
+                group[name] = {'$sum': '$%s' % name}
+            pipeline.append({'$group': group})
+            pipeline.append({'$sort': {'_id': pymongo.DESCENDING}})
+        else:
+            pipeline.append({'$sort': {'_created': pymongo.DESCENDING}})
+            project = {'_id': '$_created'}
+            for name in names:
+                project[name] = {'$ifNull': ['$%s' % name, 0]}
+            pipeline.append({'$project': project})
+        if max_points:
+            pipeline.append({'$limit': max_points})
+
+        history = []
+        livesynthesisretention_db = current_app.data.driver.db['livesynthesisretention']
+        for point in livesynthesisretention_db.aggregate(pipeline):
+            item = {'_created': point['_id']}
+            for name in names:
+                item[name] = int(point[name])
+            history.append(item)
+        return history
+
+    @staticmethod
+    def get_tier_history(livesynthesis_id, resolution, start=None, end=None, max_points=None):
+        # pylint: disable=too-many-arguments
+        """
+            Get the history of some live synthesis from a history tier, summed for each period,
+            the most recent first. Each history item contains the average of each counter during
+            the period. For a single live synthesis, it also contains the minimum and maximum in
+            the `_min` and `_max` fields: the sum of the extremes of several live synthesis is not
+            an extreme of their summed counters.
+
+        :param livesynthesis_id: list of the live synthesis id
+        :type livesynthesis_id: list
+        :param resolution: resolution of the tier, in seconds
+        :type resolution: int
+        :param start: only get the history since this date
+        :type start: datetime
+        :param end: only get the history until this date
+        :type end: datetime
+        :param max_points: only get the most recent points
+        :type max_points: int
+        :return: the history
+        :rtype: list
+        """
+        names = Livesynthesis.get_counters_names()
+        match = {'livesynthesis': {'$in': livesynthesis_id}, 'resolution': resolution}
+        if start is not None or end is not None:
+            match['date'] = {}
+            if start is not None:
+                match['date']['$gte'] = start
+            if end is not None:
+                match['date']['$lte'] = end
+
+        extremes = len(livesynthesis_id) == 1
+        group = {'_id': '$date'}
+        for name in names:
+            group['avg_%s' % name] = {'$sum': {'$divide': ['$sum.%s' % name, '$samples']}}
+            if extremes:
+                group['min_%s' % name] = {'$min': '$min.%s' % name}
+                group['max_%s' % name] = {'$max': '$max.%s' % name}
+        pipeline = [{'$match': match}, {'$group': group},
+                    {'$sort': {'_id': pymongo.DESCENDING}}]
+        if max_points:
+            pipeline.append({'$limit': max_points})
+
+        history = []
+        livesynthesistier_db = current_app.data.driver.db['livesynthesistier']
+        for point in livesynthesistier_db.aggregate(pipeline):
+            item = {'_created': point['_id']}
+            for name in names:
+                item[name] = int(round(point['avg_%s' % name]))
+            if extremes:
+                item['_min'] = dict([(name, int(point['min_%s' % name])) for name in names])
+                item['_max'] = dict([(name, int(point['max_%s' % name])) for name in names])
+            history.append(item)
+        return history
+
+    @staticmethod
+    def add_history_tiers(snapshots, date):
+        """
+            Add live synthesis history items to the history tiers: the items are added to the
+            period of each tier that includes their date
+
+        :param snapshots: live synthesis history items, with the live synthesis id in the
+        `livesynthesis` field
+        :type snapshots: list
+        :param date: date of the history items
+        :type date: datetime
+        :return: number of updated tiers periods
+        :rtype: int
+        """
+        tiers = current_app.config.get('LIVESYNTHESIS_HISTORY_TIERS', [])
+        if not tiers or not snapshots:
+            return 0
+
+        names = Livesynthesis.get_counters_names()
+        timestamp = calendar.timegm(date.utctimetuple())
+        operations = []
+        for resolution, retention in tiers:
+            period = datetime.utcfromtimestamp(timestamp - timestamp % resolution)
+            expire = period + timedelta(seconds=resolution + retention)
+            for snapshot in snapshots:
+                update = {'$min': {}, '$max': {}, '$inc': {'samples': 1},
+                          '$setOnInsert': {'expire': expire, 'schema_version': 1}}
+                for name in names:
+                    value = snapshot.get(name, 0)
+                    update['$min']['min.%s' % name] = value
+                    update['$max']['max.%s' % name] = value
+                    update['$inc']['sum.%s' % name] = value
+                operations.append(pymongo.UpdateOne(
+                    {'livesynthesis': snapshot['livesynthesis'], 'resolution': resolution,
+                     'date': period}, update, upsert=True))
+        current_app.data.driver.db['livesynthesistier'].bulk_write(operations, ordered=False)
+        return len(operations)
+
     @staticmethod
     def on_fetched_item_history(response):
         # pylint: disable=too-many-locals, too-many-nested-blocks
@@ -549,31 +1073,38 @@ class Livesynthesis(object):
         :type response: dict
         :return: None
         """
-        realm_drv = current_app.data.driver.db['realm']
         livesynthesis_db = current_app.data.driver.db['livesynthesis']
-        livesynthesisretention_db = current_app.data.driver.db['livesynthesisretention']
 
         history = request.args.get('history')
         concatenation = request.args.get('concatenation')
 
         current_app.logger.debug("LS - History: %s / %s", history, concatenation)
+        livesynthesis_id = []
         if concatenation is not None:
             # get the realm the user have access
-            realm = realm_drv.find_one({'_id': response['_realm']})
-            livesynthesis_id = []
             if g.get('back_role_super_admin', False):
                 # no restrictions, we are admin
-                livesynthesis = livesynthesis_db.find({'_realm': {'$in': realm['_all_children']}})
-                for lives in livesynthesis:
-                    livesynthesis_id.append(lives['_id'])
-                    for prop in [x for x in lives if not x.startswith('_')]:
-                        if prop in ['hosts_business_impact', 'services_business_impact']:
-                            continue
-                        response[prop] += lives[prop]
+                lookup = RealmTree.path_lookup(response['_realm'])
+                lookup['_id'] = {'$ne': response['_id']}
+                if response.get('_subtree'):
+                    # the sub-tree counters are maintained with the realm counters
+                    response.update(response['_subtree'])
+                    if history is not None:
+                        livesynthesis_id = [lives['_id'] for lives in
+                                            livesynthesis_db.find(lookup, {'_id': 1})]
+                else:
+                    livesynthesis = livesynthesis_db.find(lookup)
+                    for lives in livesynthesis:
+                        livesynthesis_id.append(lives['_id'])
+                        for prop in [x for x in lives if not x.startswith('_')]:
+                            if prop in ['hosts_business_impact', 'services_business_impact']:
+                                continue
+                            response[prop] += lives[prop]
 
             else:
                 resources_get = g.get('resources_get', {})
-                livesynthesis_access = resources_get['livesynthesis']
+                # Copy the list, the user rights are shared between requests
+                livesynthesis_access = list(resources_get['livesynthesis'])
                 custom_resources = g.get('resources_get_custom', {})
                 if 'livesynthesis' in custom_resources:
                     livesynthesis_access.extend(custom_resources['livesynthesis'])
@@ -587,27 +1118,27 @@ class Livesynthesis(object):
                             response[prop] += lives[prop]
 
         if history is not None:
-            response['history'] = []
-            lsretentions = livesynthesisretention_db.find({'livesynthesis': response['_id']}).sort(
-                '_created', pymongo.DESCENDING)
-            for lsretention in lsretentions:
-                for prop in ['livesynthesis', '_id', '_updated', '_etag']:
-                    if prop in lsretention:
-                        del lsretention[prop]
-                for prop in lsretention:
-                    if not prop == '_created':
-                        lsretention[prop] = int(lsretention[prop])
-                response['history'].append(lsretention)
-            if concatenation is not None:
-                for ls_id in livesynthesis_id:
-                    lsretentions = livesynthesisretention_db.find({'livesynthesis': ls_id}).sort(
-                        '_created', pymongo.DESCENDING)
-                num = 0
-                for lsretention in lsretentions:
-                    for prop in lsretention:
-                        if not prop.startswith('_') and prop != 'livesynthesis':
-                            response['history'][num][prop] += lsretention[prop]
-                    num += 1
+            try:
+                start = request.args.get('history_start')
+                if start is not None:
+                    start = str_to_date(start)
+                end = request.args.get('history_end')
+                if end is not None:
+                    end = str_to_date(end)
+                max_points = request.args.get('history_max')
+                if max_points is not None:
+                    max_points = int(max_points)
+                    if max_points < 1:
+                        raise ValueError("history_max must be at least 1")
+                resolution = request.args.get('history_resolution')
+                if resolution is not None:
+                    resolution = int(resolution)
+            except ValueError:
+                abort(make_response("Bad history_start, history_end, history_max or "
+                                    "history_resolution parameter", 412))
+            livesynthesis_id.insert(0, response['_id'])
+            response['history'] = Livesynthesis.get_history(livesynthesis_id, start, end,
+                                                            max_points, resolution)
 
         if 'history' in response:
             current_app.logger.debug("LS - History: %s", response['history'])
@@ -40,10 +40,13 @@ def get_schema():
     :rtype: dict
     """
     return {
+        'mongo_indexes': {
+            'index_realm_path': [('_realm_path', 1)],
+        },
         'schema': {
             'schema_version': {
                 'type': 'integer',
-                'default': 1,
+                'default': 2,
             },
             'action': {
                 'schema_version': 1,
@@ -162,6 +165,15 @@ def get_schema():
                 'type': 'boolean',
                 'default': True
             },
+            '_realm_path': {
+                'schema_version': 2,
+                'title': 'Realm path',
+                'comment': 'Path of the realm this element belongs to, built with the '
+                           'identifiers of the realm and its parents. It is set by the '
+                           'backend.',
+                'type': 'string',
+                'default': '',
+            },
 
             # Users CRUD permissions
             '_users_read': {
@@ -44,10 +44,13 @@ def get_schema():
     """
     return {
         'allow_unknown': True,
+        'mongo_indexes': {
+            'index_realm_path': [('_realm_path', 1)],
+        },
         'schema': {
             'schema_version': {
                 'type': 'integer',
-                'default': 1,
+                'default': 2,
             },
             'name': {
                 'schema_version': 1,
@@ -505,6 +508,15 @@ def get_schema():
                 'type': 'boolean',
                 'default': True
             },
+            '_realm_path': {
+                'schema_version': 2,
+                'title': 'Realm path',
+                'comment': 'Path of the realm this element belongs to, built with the '
+                           'identifiers of the realm and its parents. It is set by the '
+                           'backend.',
+                'type': 'string',
+                'default': '',
+            },
             '_users_read': {
                 'schema_version': 1,
                 'type': 'list',
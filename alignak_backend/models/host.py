@@ -51,11 +51,12 @@ def get_schema():
             'index_state_4': [('_realm', 1), ('_is_template', 1),
                               ('ls_state', 1), ('ls_state_type', 1),
                               ('active_checks_enabled', 1), ('passive_checks_enabled', 1)],
+            'index_realm_path': [('_realm_path', 1)],
         },
         'schema': {
             'schema_version': {
                 'type': 'integer',
-                'default': 3,
+                'default': 5,
             },
             # Importation source
             'imported_from': {
@@ -989,6 +990,14 @@ def get_schema():
                 'type': 'integer',
                 'default': 3
             },
+            '_services_overall': {
+                'schema_version': 5,
+                'title': 'Services overall states',
+                'comment': 'Number of host services (HARD state and monitored) for each '
+                           'overall state identifier, used to compute the host overall state.',
+                'type': 'dict',
+                'default': {}
+            },
 
             # Realm
             '_realm': {
@@ -1009,6 +1018,15 @@ def get_schema():
                 'type': 'boolean',
                 'default': True
             },
+            '_realm_path': {
+                'schema_version': 4,
+                'title': 'Realm path',
+                'comment': 'Path of the realm this element belongs to, built with the '
+                           'identifiers of the realm and its parents. It is set by the '
+                           'backend.',
+                'type': 'string',
+                'default': '',
+            },
 
             # Users CRUD permissions
             '_users_read': {
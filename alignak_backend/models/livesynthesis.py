@@ -35,6 +35,8 @@ def get_doc():  # pragma: no cover
     - a counter containing the number of host/service in downtime
     - a counter containing the number of host/service flapping
     - the maximum business impact of the host/service in the state
+
+    The live synthesis also stores the same counters for the realm and all its sub-realms.
     """
 
 
@@ -49,11 +51,12 @@ def get_schema():
             'index_tpl': [('_is_template', 1)],
             'index_name': [('name', 1)],
             'index_host': [('host', 1), ('name', 1)],
+            'index_realm_path': [('_realm_path', 1)],
         },
         'schema': {
             'schema_version': {
                 'type': 'integer',
-                'default': 2,
+                'default': 4,
             },
             'hosts_total': {
                 'schema_version': 1,
@@ -212,6 +215,15 @@ def get_schema():
                 'type': 'integer',
                 'default': 0
             },
+            '_subtree': {
+                'schema_version': 4,
+                'title': 'Sub-realms counters',
+                'comment': 'Counters of this realm and all its sub-realms. They are maintained '
+                           'by the backend when the counters of the realm or one of its '
+                           'sub-realms are modified.',
+                'type': 'dict',
+                'default': {}
+            },
 
             # Realm
             '_realm': {
@@ -232,6 +244,15 @@ def get_schema():
                 'type': 'boolean',
                 'default': True
             },
+            '_realm_path': {
+                'schema_version': 3,
+                'title': 'Realm path',
+                'comment': 'Path of the realm this element belongs to, built with the '
+                           'identifiers of the realm and its parents. It is set by the '
+                           'backend.',
+                'type': 'string',
+                'default': '',
+            },
 
             # Users CRUD permissions
             '_users_read': {
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resource information of livesynthesisgroup
+"""
+
+
+def get_name(friendly=False):
+    """Get name of this resource
+
+    :return: name of this resource
+    :rtype: str
+    """
+    if friendly:  # pragma: no cover
+        return 'Alignak groups live state synthesis'
+    return 'livesynthesisgroup'
+
+
+def get_doc():  # pragma: no cover
+    """Get documentation of this resource
+
+    :return: rst string
+    :rtype: str
+    """
+    return """
+    The ``livesynthesisgroup`` model is maintained by the Alignak backend to get an easy
+    overview of the state of the hosts groups and services groups.
+
+    It is maintained only when the LIVESYNTHESIS_GROUPS configuration parameter is set. For
+    each hosts group (services group), it stores the same counters as the live synthesis for
+    the hosts (services) of the group and of all its sub-groups.
+    """
+
+
+def get_schema():
+    """Schema structure of this resource
+
+    :return: schema dictionary
+    :rtype: dict
+    """
+    return {
+        'mongo_indexes': {
+            'index_hostgroup': [('hostgroup', 1)],
+            'index_servicegroup': [('servicegroup', 1)],
+            'index_realm_path': [('_realm_path', 1)],
+        },
+        'schema': {
+            'schema_version': {
+                'type': 'integer',
+                'default': 1,
+            },
+            'hostgroup': {
+                'schema_version': 1,
+                'title': 'Hosts group',
+                'comment': 'Hosts group of this live synthesis, the hosts counters are '
+                           'maintained',
+                'type': 'objectid',
+                'data_relation': {
+                    'resource': 'hostgroup',
+                    'embeddable': True
+                },
+                'nullable': True,
+                'default': None
+            },
+            'servicegroup': {
+                'schema_version': 1,
+                'title': 'Services group',
+                'comment': 'Services group of this live synthesis, the services counters are '
+                           'maintained',
+                'type': 'objectid',
+                'data_relation': {
+                    'resource': 'servicegroup',
+                    'embeddable': True
+                },
+                'nullable': True,
+                'default': None
+            },
+            'hosts_total': {
+                'schema_version': 1,
+                'title': 'Hosts count',
+                'type': 'integer',
+                'default': 0,
+            },
+            'hosts_not_monitored': {
+                'schema_version': 1,
+                'title': 'Hosts not monitored',
+                'type': 'integer',
+                'default': 0,
+            },
+            'hosts_up_hard': {
+                'schema_version': 1,
+                'title': 'Hosts Up hard',
+                'type': 'integer',
+                'default': 0,
+            },
+            'hosts_up_soft': {
+                'schema_version': 1,
+                'title': 'Hosts Up soft',
+                'type': 'integer',
+                'default': 0,
+            },
+            'hosts_down_hard': {
+                'schema_version': 1,
+                'title': 'Hosts Down hard',
+                'type': 'integer',
+                'default': 0,
+            },
+            'hosts_down_soft': {
+                'schema_version': 1,
+                'title': 'Hosts Down soft',
+                'type': 'integer',
+                'default': 0,
+            },
+            'hosts_unreachable_hard': {
+                'schema_version': 1,
+                'title': 'Hosts Unreachable hard',
+                'type': 'integer',
+                'default': 0,
+            },
+            'hosts_unreachable_soft': {
+                'schema_version': 1,
+                'title': 'Hosts Unreachable soft',
+                'type': 'integer',
+                'default': 0,
+            },
+            'hosts_acknowledged': {
+                'schema_version': 1,
+                'title': 'Hosts ackowledged',
+                'type': 'integer',
+                'default': 0,
+            },
+            'hosts_in_downtime': {
+                'schema_version': 1,
+                'title': 'Hosts in downtime',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_total': {
+                'schema_version': 1,
+                'title': 'Services count',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_not_monitored': {
+                'schema_version': 1,
+                'title': 'Services not monitored',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_ok_hard': {
+                'schema_version': 1,
+                'title': 'Services Ok hard',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_ok_soft': {
+                'schema_version': 1,
+                'title': 'Services Ok soft',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_warning_hard': {
+                'schema_version': 1,
+                'title': 'Services Warning hard',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_warning_soft': {
+                'schema_version': 1,
+                'title': 'Services Warning soft',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_critical_hard': {
+                'schema_version': 1,
+                'title': 'Services Critical hard',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_critical_soft': {
+                'schema_version': 1,
+                'title': 'Services Criticl soft',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_unknown_hard': {
+                'schema_version': 1,
+                'title': 'Services Unknown hard',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_unknown_soft': {
+                'schema_version': 1,
+                'title': 'Services Unknown soft',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_unreachable_hard': {
+                'schema_version': 1,
+                'title': 'Services Unreachable hard',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_unreachable_soft': {
+                'schema_version': 1,
+                'title': 'Services Unreachable soft',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_acknowledged': {
+                'schema_version': 1,
+                'title': 'Services acknowledged',
+                'type': 'integer',
+                'default': 0,
+            },
+            'services_in_downtime': {
+                'schema_version': 1,
+                'title': 'Services in downtime',
+                'type': 'integer',
+                'default': 0,
+            },
+
+            # Realm
+            '_realm': {
+                'schema_version': 1,
+                'title': 'Realm',
+                'comment': 'Realm this element belongs to.',
+                'type': 'objectid',
+                'data_relation': {
+                    'resource': 'realm',
+                    'embeddable': True
+                },
+                'required': True,
+            },
+            '_sub_realm': {
+                'schema_version': 1,
+                'title': 'Sub-realms',
+                'comment': 'Is this element visible in the sub-realms of its realm?',
+                'type': 'boolean',
+                'default': True
+            },
+            '_realm_path': {
+                'schema_version': 1,
+                'title': 'Realm path',
+                'comment': 'Path of the realm this element belongs to, built with the '
+                           'identifiers of the realm and its parents. It is set by the '
+                           'backend.',
+                'type': 'string',
+                'default': '',
+            },
+
+            # Users CRUD permissions
+            '_users_read': {
+                'schema_version': 1,
+                'type': 'list',
+                'schema': {
+                    'type': 'objectid',
+                    'data_relation': {
+                        'resource': 'user',
+                        'embeddable': True,
+                    }
+                },
+            },
+        },
+        'schema_deleted': {}
+    }
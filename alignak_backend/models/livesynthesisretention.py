@@ -38,6 +38,9 @@ def get_schema():
     """
     return {
         'internal_resource': True,
+        'mongo_indexes': {
+            'index_livesynthesis_created': [('livesynthesis', 1), ('_created', -1)],
+        },
         'schema': {
             'schema_version': {
                 'type': 'integer',
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resource information of livesynthesistier
+"""
+
+
+def get_name(friendly=False):
+    """Get name of this resource
+
+    :return: name of this resource
+    :rtype: str
+    """
+    if friendly:  # pragma: no cover
+        return "Live synthesis history tiers"
+    return 'livesynthesistier'
+
+
+def get_doc():  # pragma: no cover
+    """Get documentation of this resource
+
+    :return: rst string
+    :rtype: str
+    """
+    return """
+    The ``livesynthesistier`` model is an internal data model used by the backend to store the
+    down-sampled history of the live synthesis.
+
+    Each history tier has a resolution (eg. 15 minutes, 1 hour, 1 day) and a retention. For each
+    live synthesis and each period of the tier resolution, it stores the minimum, the maximum
+    and the sum of each counter of the live synthesis history items of the period. The items
+    are deleted when the tier retention is expired.
+    """
+
+
+def get_schema():
+    """Schema structure of this resource
+
+    :return: schema dictionary
+    :rtype: dict
+    """
+    return {
+        'internal_resource': True,
+        'mongo_indexes': {
+            'index_livesynthesis_date': [('livesynthesis', 1), ('resolution', 1),
+                                         ('date', -1)],
+            'index_expire': ([('expire', 1)], {'expireAfterSeconds': 0}),
+        },
+        'schema': {
+            'schema_version': {
+                'type': 'integer',
+                'default': 1,
+            },
+            'livesynthesis': {
+                'schema_version': 1,
+                'title': 'Live synthesis',
+                'type': 'objectid',
+                'data_relation': {
+                    'resource': 'livesynthesis',
+                    'embeddable': False
+                },
+                'required': True,
+            },
+            'resolution': {
+                'schema_version': 1,
+                'title': 'Resolution',
+                'comment': 'Resolution of the tier, in seconds',
+                'type': 'integer',
+                'required': True,
+            },
+            'date': {
+                'schema_version': 1,
+                'title': 'Date',
+                'comment': 'Beginning of the period',
+                'type': 'datetime',
+                'required': True,
+            },
+            'expire': {
+                'schema_version': 1,
+                'title': 'Expiration',
+                'comment': 'Date when the tier retention is expired for this period',
+                'type': 'datetime',
+                'required': True,
+            },
+            'samples': {
+                'schema_version': 1,
+                'title': 'Samples',
+                'comment': 'Number of live synthesis history items of the period',
+                'type': 'integer',
+                'default': 0,
+            },
+            'min': {
+                'schema_version': 1,
+                'title': 'Minimum',
+                'comment': 'Minimum of each counter during the period',
+                'type': 'dict',
+                'default': {}
+            },
+            'max': {
+                'schema_version': 1,
+                'title': 'Maximum',
+                'comment': 'Maximum of each counter during the period',
+                'type': 'dict',
+                'default': {}
+            },
+            'sum': {
+                'schema_version': 1,
+                'title': 'Sum',
+                'comment': 'Sum of each counter during the period, divide by the samples to '
+                           'get the average',
+                'type': 'dict',
+                'default': {}
+            },
+        },
+        'schema_deleted': {}
+    }
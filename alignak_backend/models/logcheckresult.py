@@ -45,11 +45,12 @@ def get_schema():
             'index_service': [('service', 1)],
             'index_service_name': [('service_name', 1)],
             'index_host_service_name': [('host_name', 1), ('service_name', 1)],
+            'index_realm_path': [('_realm_path', 1)],
         },
         'schema': {
             'schema_version': {
                 'type': 'integer',
-                'default': 3,
+                'default': 4,
             },
             'host': {
                 'schema_version': 2,
@@ -279,6 +280,15 @@ def get_schema():
                 'type': 'boolean',
                 'default': True
             },
+            '_realm_path': {
+                'schema_version': 4,
+                'title': 'Realm path',
+                'comment': 'Path of the realm this element belongs to, built with the '
+                           'identifiers of the realm and its parents. It is set by the '
+                           'backend.',
+                'type': 'string',
+                'default': '',
+            },
 
             # Users CRUD permissions
             '_users_read': {
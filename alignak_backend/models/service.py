@@ -52,11 +52,12 @@ def get_schema():
                               ('ls_state', 1), ('ls_state_type', 1),
                               ('active_checks_enabled', 1), ('passive_checks_enabled', 1)],
             'index_host': [('host', 1), ('name', 1)],
+            'index_realm_path': [('_realm_path', 1)],
         },
         'schema': {
             'schema_version': {
                 'type': 'integer',
-                'default': 3,
+                'default': 4,
             },
             # Importation source
             'imported_from': {
@@ -1031,6 +1032,15 @@ def get_schema():
                 'type': 'boolean',
                 'default': True
             },
+            '_realm_path': {
+                'schema_version': 4,
+                'title': 'Realm path',
+                'comment': 'Path of the realm this element belongs to, built with the '
+                           'identifiers of the realm and its parents. It is set by the '
+                           'backend.',
+                'type': 'string',
+                'default': '',
+            },
 
             # Users CRUD permissions
             '_users_read': {
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resource information of servicelivestate
+"""
+from copy import deepcopy
+
+from alignak_backend.models import service
+
+
+def get_name(friendly=False):
+    """Get name of this resource
+
+    :return: name of this resource
+    :rtype: str
+    """
+    if friendly:  # pragma: no cover
+        return "Services live state"
+    return 'servicelivestate'
+
+
+def get_doc():  # pragma: no cover
+    """Get documentation of this resource
+
+    :return: rst string
+    :rtype: str
+    """
+    return """
+    The ``servicelivestate`` model is an internal data model used by the backend to store the
+    live state of the services when the LIVESTATE_COLLECTIONS configuration parameter is set.
+
+    Each document has the same identifier as its service. It stores the live state fields that
+    are modified by each check result (output, performance data, last check, ...). They are
+    joined to the service when it is read.
+    """
+
+
+def get_schema():
+    """Schema structure of this resource
+
+    :return: schema dictionary
+    :rtype: dict
+    """
+    schema = {
+        'schema_version': {
+            'type': 'integer',
+            'default': 1,
+        }
+    }
+    for field, value in service.get_schema()['schema'].items():
+        if field.startswith('ls_'):
+            schema[field] = deepcopy(value)
+            schema[field]['schema_version'] = 1
+    return {
+        'internal_resource': True,
+        'schema': schema,
+        'schema_deleted': {}
+    }
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resource information of sessionrevocation
+"""
+
+
+def get_name(friendly=False):
+    """Get name of this resource
+
+    :return: name of this resource
+    :rtype: str
+    """
+    if friendly:  # pragma: no cover
+        return "Session tokens revocation"
+    return 'sessionrevocation'
+
+
+def get_doc():  # pragma: no cover
+    """Get documentation of this resource
+
+    :return: rst string
+    :rtype: str
+    """
+    return """
+    The ``sessionrevocation`` model is an internal data model used by the backend to store the
+    revoked session tokens.
+
+    A session token is revoked when the user logs out. All the session tokens of a user are
+    revoked when the user password is changed. The revocations are deleted when the revoked
+    tokens are expired.
+    """
+
+
+def get_schema():
+    """Schema structure of this resource
+
+    :return: schema dictionary
+    :rtype: dict
+    """
+    return {
+        'internal_resource': True,
+        'mongo_indexes': {
+            'index_expire': ([('expire', 1)], {'expireAfterSeconds': 0}),
+        },
+        'schema': {
+            'schema_version': {
+                'type': 'integer',
+                'default': 1,
+            },
+            'jti': {
+                'schema_version': 1,
+                'title': 'Token identifier',
+                'comment': 'Identifier of the revoked token, empty if all the user tokens '
+                           'issued before issued_before are revoked',
+                'type': 'string',
+                'default': '',
+            },
+            'user': {
+                'schema_version': 1,
+                'title': 'Concerned user',
+                'type': 'objectid',
+                'data_relation': {
+                    'resource': 'user',
+                    'embeddable': False
+                },
+                'required': True,
+            },
+            'issued_before': {
+                'schema_version': 1,
+                'title': 'Issued before',
+                'comment': 'The user tokens issued before this timestamp are revoked',
+                'type': 'float',
+                'default': 0.0,
+            },
+            'expire': {
+                'schema_version': 1,
+                'title': 'Expiration',
+                'comment': 'Date when the revoked tokens are expired',
+                'type': 'datetime',
+                'required': True,
+            },
+        },
+        'schema_deleted': {}
+    }
@@ -42,11 +42,12 @@ def get_schema():
             'index_updated': [('_updated', 1)],
             'index_tpl': [('_is_template', 1)],
             'index_name': [('name', 1)],
+            'index_realm_path': [('_realm_path', 1)],
         },
         'schema': {
             'schema_version': {
                 'type': 'integer',
-                'default': 2,
+                'default': 3,
             },
             # Importation source
             'imported_from': {
@@ -382,6 +383,15 @@ def get_schema():
                 'type': 'boolean',
                 'default': True
             },
+            '_realm_path': {
+                'schema_version': 3,
+                'title': 'Realm path',
+                'comment': 'Path of the realm this element belongs to, built with the '
+                           'identifiers of the realm and its parents. It is set by the '
+                           'backend.',
+                'type': 'string',
+                'default': '',
+            },
 
             # Users CRUD permissions
             '_users_read': {
@@ -86,7 +86,7 @@ def get_schema():
                     'service', 'servicegroup', 'servicedependency', 'serviceescalation',
                     'grafana', 'graphite', 'influxdb', 'statsd',
                     'timeseriesretention', 'aligank_notifications',
-                    'livesynthesis', 'livesynthesisretention',
+                    'livesynthesis', 'livesynthesisretention', 'livesynthesisgroup',
                     'logcheckresult', 'history'
                 ],
             },
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resource information of userrights
+"""
+
+
+def get_name(friendly=False):
+    """Get name of this resource
+
+    :return: name of this resource
+    :rtype: str
+    """
+    if friendly:  # pragma: no cover
+        return "User effective rights"
+    return 'userrights'
+
+
+def get_doc():  # pragma: no cover
+    """Get documentation of this resource
+
+    :return: rst string
+    :rtype: str
+    """
+    return """
+    The ``userrights`` model is an internal data model used by the backend to store the
+    effective rights of each user.
+
+    The effective rights are computed from the user restriction roles and the realms tree
+    when a user, one of its restriction roles or a realm is modified. They are read when a
+    user is authenticated to avoid resolving the user rights on each request.
+    """
+
+
+def get_schema():
+    """Schema structure of this resource
+
+    :return: schema dictionary
+    :rtype: dict
+    """
+    return {
+        'internal_resource': True,
+        'mongo_indexes': {
+            'index_user': [('user', 1)],
+            'index_token': [('token', 1)],
+            'index_name': [('name', 1)],
+        },
+        'schema': {
+            'schema_version': {
+                'type': 'integer',
+                'default': 1,
+            },
+            'user': {
+                'schema_version': 1,
+                'title': 'Concerned user',
+                'type': 'objectid',
+                'data_relation': {
+                    'resource': 'user',
+                    'embeddable': False
+                },
+                'required': True,
+            },
+            'name': {
+                'schema_version': 1,
+                'title': 'User name',
+                'type': 'string',
+                'required': True,
+            },
+            'token': {
+                'schema_version': 1,
+                'title': 'User token',
+                'type': 'string',
+                'default': '',
+            },
+            'rights': {
+                'schema_version': 1,
+                'title': 'Effective rights',
+                'comment': 'Realms of each resource the user is allowed to read, create, '
+                           'update and delete',
+                'type': 'dict',
+                'default': {}
+            },
+        },
+        'schema_deleted': {}
+    }
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.namecache`` module
+
+    This module manages the hosts, services and users names cache
+"""
+from __future__ import print_function
+import time
+import threading
+from collections import OrderedDict
+from flask import current_app
+
+
+class NameCache(object):
+    """
+        Names cache class
+
+        The name, realm and some properties of the hosts, services and users are stored in a
+        per-worker LRU cache of NAME_CACHE_SIZE entries, for NAME_CACHE_TTL seconds. They are
+        used to resolve a name to an id (and an id to a name) in the hooks of the history, the
+        actions and the check results.
+
+        An entry is removed from the cache when the element is updated or deleted. Other backend
+        processes do not see this modification before the entry expires.
+    """
+    # Cached fields of each resource
+    fields = {
+        'host': ['name', '_realm', '_sub_realm', 'process_perf_data'],
+        'service': ['name', 'host', '_realm', '_sub_realm', 'process_perf_data'],
+        'user': ['name', '_realm', '_sub_realm']
+    }
+
+    # Cached elements: (resource, id) -> element fields, the least recently used first
+    cache = OrderedDict()
+    # Names index: (resource, host, name) -> id
+    names = {}
+    # Protect the cache
+    lock = threading.Lock()
+
+    @staticmethod
+    def get(resource, element_id):
+        """
+            Get an element by its id
+
+        :param resource: host, service or user
+        :type resource: str
+        :param element_id: id of the element
+        :type element_id: ObjectId
+        :return: cached fields of the element, None if it does not exist
+        :rtype: dict
+        """
+        with NameCache.lock:
+            element = NameCache.cache.pop((resource, element_id), None)
+            if element is not None:
+                if time.time() - element['_cached'] <= current_app.config['NAME_CACHE_TTL']:
+                    NameCache.cache[(resource, element_id)] = element
+                    return element
+                NameCache.names.pop(element['_name_key'], None)
+        return NameCache.load(resource, {'_id': element_id})
+
+    @staticmethod
+    def get_by_name(resource, name, host=None):
+        """
+            Get an element by its name
+
+        :param resource: host, service or user
+        :type resource: str
+        :param name: name of the element
+        :type name: str
+        :param host: id of the host of a service
+        :type host: ObjectId
+        :return: cached fields of the element, None if it does not exist
+        :rtype: dict
+        """
+        element_id = NameCache.names.get((resource, host, name))
+        if element_id is not None:
+            element = NameCache.get(resource, element_id)
+            if element is not None and element['name'] == name \
+                    and element.get('host') == host:
+                return element
+        lookup = {'name': name}
+        if resource == 'service':
+            lookup['host'] = host
+        return NameCache.load(resource, lookup)
+
+    @staticmethod
+    def load(resource, lookup):
+        """
+            Get an element from the database and store it in the cache
+
+        :param resource: host, service or user
+        :type resource: str
+        :param lookup: filter of the element
+        :type lookup: dict
+        :return: cached fields of the element, None if it does not exist
+        :rtype: dict
+        """
+        projection = dict([(field, 1) for field in NameCache.fields[resource]])
+        element = current_app.data.driver.db[resource].find_one(lookup, projection)
+        size = current_app.config['NAME_CACHE_SIZE']
+        if element is None or size <= 0:
+            return element
+
+        element['_cached'] = time.time()
+        element['_name_key'] = (resource, element.get('host'), element['name'])
+        with NameCache.lock:
+            old = NameCache.cache.pop((resource, element['_id']), None)
+            if old is not None:
+                NameCache.names.pop(old['_name_key'], None)
+            NameCache.cache[(resource, element['_id'])] = element
+            NameCache.names[element['_name_key']] = element['_id']
+            while len(NameCache.cache) > size:
+                _, evicted = NameCache.cache.popitem(last=False)
+                NameCache.names.pop(evicted['_name_key'], None)
+        return element
+
+    @staticmethod
+    def invalidate(resource, element_id):
+        """
+            Remove an element from the cache
+
+        :param resource: host, service or user
+        :type resource: str
+        :param element_id: id of the element
+        :type element_id: ObjectId
+        :return: None
+        """
+        with NameCache.lock:
+            element = NameCache.cache.pop((resource, element_id), None)
+            if element is not None:
+                NameCache.names.pop(element['_name_key'], None)
+
+    @staticmethod
+    def clear(resource):
+        """
+            Remove all the elements of a resource from the cache
+
+        :param resource: host, service or user
+        :type resource: str
+        :return: None
+        """
+        with NameCache.lock:
+            for key in [key for key in NameCache.cache if key[0] == resource]:
+                NameCache.names.pop(NameCache.cache.pop(key)['_name_key'], None)
+
+    @staticmethod
+    def on_updated(resource, updated, original):
+        """
+            Remove an updated element from the cache if a cached field is modified
+
+        :param resource: host, service or user
+        :type resource: str
+        :param updated: updated fields
+        :type updated: dict
+        :param original: original fields
+        :type original: dict
+        :return: None
+        """
+        if any(field in updated for field in NameCache.fields[resource]):
+            NameCache.invalidate(resource, original['_id'])
+
+    @staticmethod
+    def on_updated_host(updated, original):
+        """
+            What to do when an host is updated ...
+        """
+        NameCache.on_updated('host', updated, original)
+
+    @staticmethod
+    def on_updated_service(updated, original):
+        """
+            What to do when a service is updated ...
+        """
+        NameCache.on_updated('service', updated, original)
+
+    @staticmethod
+    def on_updated_user(updated, original):
+        """
+            What to do when a user is updated ...
+        """
+        NameCache.on_updated('user', updated, original)
+
+    @staticmethod
+    def on_deleted_host(item):
+        """
+            What to do when an host is deleted ...
+        """
+        NameCache.invalidate('host', item['_id'])
+
+    @staticmethod
+    def on_deleted_service(item):
+        """
+            What to do when a service is deleted ...
+        """
+        NameCache.invalidate('service', item['_id'])
+
+    @staticmethod
+    def on_deleted_user(item):
+        """
+            What to do when a user is deleted ...
+        """
+        NameCache.invalidate('user', item['_id'])
+
+    @staticmethod
+    def on_deleted_resource_host():
+        """
+            What to do when all the hosts are deleted ...
+        """
+        NameCache.clear('host')
+
+    @staticmethod
+    def on_deleted_resource_service():
+        """
+            What to do when all the services are deleted ...
+        """
+        NameCache.clear('service')
+
+    @staticmethod
+    def on_deleted_resource_user():
+        """
+            What to do when all the users are deleted ...
+        """
+        NameCache.clear('user')
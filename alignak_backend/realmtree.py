@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.realmtree`` module
+
+    This module manages an in-process index of the realms tree
+"""
+from __future__ import print_function
+import time
+from flask import current_app
+
+
+class RealmTree(object):
+    """
+        Realms tree index class
+
+        The index is built once from the realm collection and it is shared by the users rights,
+        the timeseries and the Grafana management. It stores, for each realm:
+        - the ancestors (top level realm first)
+        - the descendants (all the sub-realms)
+        - the realms names path (eg. All.Europe.France)
+        - the level in the tree
+        - the realm path (eg. /<All id>/<Europe id>/<France id>/)
+
+        The realm path of its realm is stored in the `_realm_path` field of the realm scoped
+        documents. All the documents of a realm and its sub-realms are found with one anchored
+        prefix regex on this field.
+
+        The index carries a generation number that is bumped each time a realm is created,
+        updated or deleted. The index is rebuilt when its generation is not the current one or
+        when it is older than REALMS_TREE_TTL seconds (other backend processes may have
+        modified the realms). It is also rebuilt once when an unknown realm is looked for.
+    """
+    # Current realms tree generation
+    generation = 0
+
+    # Realms tree index
+    index = None
+
+    @staticmethod
+    def invalidate():
+        """
+            Bump the realms tree generation, the index will be rebuilt on next use
+        """
+        RealmTree.generation += 1
+        current_app.logger.debug("Realms tree - generation: %d", RealmTree.generation)
+
+    @staticmethod
+    def build():
+        """
+            Build the realms tree index from the realm collection
+
+        :return: the realms tree index
+        :rtype: dict
+        """
+        generation = RealmTree.generation
+        realm_db = current_app.data.driver.db['realm']
+        realms = {}
+        for realm in realm_db.find({}, {'name': 1, '_parent': 1}):
+            realms[realm['_id']] = realm
+
+        index = {
+            'generation': generation,
+            'built': time.time(),
+            'ancestors': {},
+            'descendants': {},
+            'names': {},
+            'name_paths': {},
+            'levels': {},
+            'paths': {},
+            # The realms that were not found in this index
+            'misses': set()
+        }
+        # The ancestors, the descendants and the paths are all got from the parents chain. The
+        # _tree_parents and _all_children fields of the realms are not maintained when a realm
+        # is moved in the tree.
+        for realm_id, realm in realms.items():
+            ancestors = RealmTree.build_ancestors(realm_id, realms, index['ancestors'])
+            index['descendants'].setdefault(realm_id, [])
+            for parent in ancestors:
+                index['descendants'].setdefault(parent, []).append(realm_id)
+            index['names'][realm_id] = realm['name']
+            index['levels'][realm_id] = len(ancestors)
+            index['name_paths'][realm_id] = '.'.join(
+                [realms[parent]['name'] for parent in ancestors] + [realm['name']])
+            index['paths'][realm_id] = RealmTree.build_path(realm_id, realms, index['paths'])
+
+        current_app.logger.debug("Realms tree - built index, generation %d, %d realms",
+                                 generation, len(realms))
+        RealmTree.index = index
+        return index
+
+    @staticmethod
+    def build_ancestors(realm_id, realms, ancestors):
+        """
+            Build the ancestors of a realm from its parents chain, top level realm first
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :param realms: all the realms, indexed by id
+        :type realms: dict
+        :param ancestors: the realms ancestors yet built
+        :type ancestors: dict
+        :return: the realm ancestors
+        :rtype: list
+        """
+        if realm_id not in ancestors:
+            parent = realms[realm_id].get('_parent')
+            if parent in realms and parent != realm_id:
+                ancestors[realm_id] = list(RealmTree.build_ancestors(parent, realms, ancestors))
+                ancestors[realm_id].append(parent)
+            else:
+                ancestors[realm_id] = []
+        return ancestors[realm_id]
+
+    @staticmethod
+    def build_path(realm_id, realms, paths):
+        """
+            Build the path of a realm from its parents chain
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :param realms: all the realms, indexed by id
+        :type realms: dict
+        :param paths: the realms paths yet built
+        :type paths: dict
+        :return: the realm path
+        :rtype: str
+        """
+        if realm_id not in paths:
+            parent = realms[realm_id].get('_parent')
+            if parent in realms and parent != realm_id:
+                paths[realm_id] = '%s%s/' % (RealmTree.build_path(parent, realms, paths),
+                                             realm_id)
+            else:
+                paths[realm_id] = '/%s/' % realm_id
+        return paths[realm_id]
+
+    @staticmethod
+    def get(realm_id=None):
+        """
+            Get the current realms tree index, build it if needed
+
+        :param realm_id: if provided, rebuild the index if this realm is not yet known. A realm
+        that is still unknown after the rebuild is not looked for again until the next rebuild.
+        :type realm_id: ObjectId
+        :return: the realms tree index
+        :rtype: dict
+        """
+        index = RealmTree.index
+        if index is None or index['generation'] != RealmTree.generation \
+                or time.time() - index['built'] > current_app.config['REALMS_TREE_TTL']:
+            index = RealmTree.build()
+        elif realm_id is not None and realm_id not in index['names'] \
+                and realm_id not in index['misses']:
+            index = RealmTree.build()
+        if realm_id is not None and realm_id not in index['names']:
+            index['misses'].add(realm_id)
+        return index
+
+    @staticmethod
+    def ancestors(realm_id):
+        """
+            Get the ancestors of a realm, top level realm first
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :return: list of the realm ancestors
+        :rtype: list
+        """
+        return RealmTree.get(realm_id)['ancestors'].get(realm_id, [])
+
+    @staticmethod
+    def descendants(realm_id):
+        """
+            Get all the sub-realms of a realm
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :return: list of the realm descendants
+        :rtype: list
+        """
+        return RealmTree.get(realm_id)['descendants'].get(realm_id, [])
+
+    @staticmethod
+    def name_path(realm_id):
+        """
+            Get the realms names path from the top level realm, separated with a dot
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :return: realms names separated by .
+        :rtype: str
+        """
+        return RealmTree.get(realm_id)['name_paths'].get(realm_id, '')
+
+    @staticmethod
+    def path(realm_id):
+        """
+            Get the realm path, built with the identifiers of the realm and its parents
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :return: realm path, eg. /<All id>/<Europe id>/<France id>/, empty if the realm does not
+        exist
+        :rtype: str
+        """
+        return RealmTree.get(realm_id)['paths'].get(realm_id, '')
+
+    @staticmethod
+    def path_lookup(realm_id):
+        """
+            Get the lookup filter for the documents of a realm and all its sub-realms
+
+        :param realm_id: id of the realm
+        :type realm_id: ObjectId
+        :return: lookup on the _realm_path field, matching no document if the realm does not
+        exist
+        :rtype: dict
+        """
+        path = RealmTree.path(realm_id)
+        if not path:
+            # An empty prefix would match the documents of all the realms
+            return {'_realm_path': {'$in': []}}
+        return {'_realm_path': {'$regex': '^%s' % path}}
+
+    @staticmethod
+    def update_paths(realms_id=None):
+        """
+            Update the `_realm_path` field of the realm scoped documents. It is used when a realm
+            is moved in the realms tree and to migrate the documents that do not have a realm
+            path (only the documents with a missing or empty `_realm_path` are read)
+
+        :param realms_id: update the documents of these realms, None for the documents that do
+        not have a realm path
+        :type realms_id: list
+        :return: number of updated documents
+        :rtype: int
+        """
+        paths = RealmTree.get()['paths']
+        count = 0
+        for resource, resource_settings in current_app.config['DOMAIN'].items():
+            if '_realm_path' not in resource_settings['schema']:
+                continue
+            collection = current_app.data.driver.db[resource_settings['datasource']['source']]
+            missing = {'$in': ['', None]}
+            realms = realms_id
+            if realms_id is None:
+                realms = collection.distinct('_realm', {'_realm_path': missing})
+            for realm_id in realms:
+                if realm_id not in paths:
+                    continue
+                path_lookup = missing if realms_id is None else {'$ne': paths[realm_id]}
+                result = collection.update_many({'_realm': realm_id, '_realm_path': path_lookup},
+                                                {'$set': {'_realm_path': paths[realm_id]}})
+                count += result.modified_count
+            current_app.logger.debug("Realms tree - updated realm path of %s", resource)
+        return count
+
+    @staticmethod
+    def realms_lookups(realms):
+        """
+            Get the lookup filters for the documents of a list of realms
+
+            When the list contains a realm and all its sub-realms, an anchored prefix regex on the
+            `_realm_path` field is used for this sub-tree rather than listing all the realms.
+
+        :param realms: list of realms id
+        :type realms: list
+        :return: list of lookup filters, one of them is matching the documents of the realms
+        :rtype: list
+        """
+        index = RealmTree.get()
+        realms_set = set(realms)
+        subtrees = set()
+        for realm_id in realms_set:
+            descendants = index['descendants'].get(realm_id)
+            if descendants and realms_set.issuperset(descendants):
+                subtrees.add(realm_id)
+        roots = [realm_id for realm_id in subtrees
+                 if not subtrees.intersection(index['ancestors'].get(realm_id, []))]
+
+        covered = set(roots)
+        for realm_id in roots:
+            covered.update(index['descendants'][realm_id])
+        others = [realm_id for realm_id in realms if realm_id not in covered]
+
+        lookups = [{'_realm_path': {'$regex': '^%s' % path}}
+                   for path in sorted([index['paths'][realm_id] for realm_id in roots])]
+        if others or not lookups:
+            lookups.append({'_realm': {'$in': others}})
+        return lookups
@@ -45,3 +45,30 @@ def cron_livesynthesis_history():
     :return: None
     """
     alignak_backend.app.cron_livesynthesis_history()
+
+
+def cron_livesynthesis_flush():
+    """
+    It's the scheduler used to write the pending livesynthesis counters
+
+    :return: None
+    """
+    alignak_backend.app.cron_livesynthesis_flush()
+
+
+def cron_livesynthesis_scheduled():
+    """
+    It's the scheduler used to recalculate the requested livesynthesis
+
+    :return: None
+    """
+    alignak_backend.app.cron_livesynthesis_scheduled()
+
+
+def cron_livesynthesis_check():
+    """
+    It's the scheduler used to check the livesynthesis counters of some realms
+
+    :return: None
+    """
+    alignak_backend.app.cron_livesynthesis_check()
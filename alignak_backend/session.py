@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    ``alignak_backend.session`` module
+
+    This module manages the signed session tokens
+"""
+from __future__ import print_function
+import time
+import uuid
+from datetime import datetime
+
+import jwt
+from bson.objectid import ObjectId
+from flask import current_app
+
+
+class SessionToken(object):
+    """
+        Session tokens class
+
+        A session token is a short-lived JWT signed with the SESSION_TOKEN_SECRET (HS256). It
+        embeds the user identifier and the version of the user rights when the token was
+        issued. The token is verified without any database access; the user rights are got
+        from the rights cache unless the cached rights are older than the token.
+
+        A revoked session token (logout) or the session tokens of a user issued before a
+        password change are stored in the sessionrevocation collection. This revocation list
+        is loaded by each backend process every RIGHTS_CACHE_TTL seconds.
+    """
+    # Revocation list: revoked tokens identifiers and users revocation time
+    revoked = None
+
+    @staticmethod
+    def enabled():
+        """
+            Session tokens are enabled if a secret is defined
+
+        :return: True if the session tokens are enabled
+        :rtype: bool
+        """
+        return bool(current_app.config.get('SESSION_TOKEN_SECRET'))
+
+    @staticmethod
+    def generate(user_id, version):
+        """
+            Generate a session token for a user
+
+        :param user_id: id of the user
+        :type user_id: ObjectId
+        :param version: version of the user rights
+        :type version: int
+        :return: session token
+        :rtype: str
+        """
+        now = time.time()
+        token = jwt.encode({
+            'user': str(user_id),
+            'version': version,
+            'iat': now,
+            'exp': int(now) + current_app.config['SESSION_TOKEN_TTL'],
+            'jti': str(uuid.uuid4())
+        }, current_app.config['SESSION_TOKEN_SECRET'], algorithm='HS256')
+        if isinstance(token, bytes):
+            token = token.decode('utf-8')
+        return token
+
+    @staticmethod
+    def is_session_token(token):
+        """
+            Check if a token is a session token (HS256 JWT)
+
+        :param token: authentication token
+        :type token: str
+        :return: True if it is a session token
+        :rtype: bool
+        """
+        if not SessionToken.enabled() or token.count('.') != 2:
+            return False
+        try:
+            return jwt.get_unverified_header(token).get('alg') == 'HS256'
+        except jwt.InvalidTokenError:
+            return False
+
+    @staticmethod
+    def decode(token):
+        """
+            Verify a session token and get its claims
+
+        :param token: session token
+        :type token: str
+        :return: the token claims, None if the token is not valid, expired or revoked
+        :rtype: dict
+        """
+        try:
+            claims = jwt.decode(token, current_app.config['SESSION_TOKEN_SECRET'],
+                                algorithms=['HS256'])
+            claims['user'] = ObjectId(claims['user'])
+        except (jwt.InvalidTokenError, KeyError, TypeError, ValueError):
+            return None
+
+        revoked = SessionToken.get_revoked()
+        if claims.get('jti') in revoked['tokens']:
+            return None
+        if claims.get('iat', 0) <= revoked['users'].get(claims['user'], 0):
+            return None
+        return claims
+
+    @staticmethod
+    def get_revoked():
+        """
+            Get the revocation list, load it if it is older than RIGHTS_CACHE_TTL seconds
+
+        :return: revoked tokens identifiers and users revocation time
+        :rtype: dict
+        """
+        revoked = SessionToken.revoked
+        if revoked is not None \
+                and time.time() - revoked['loaded'] <= current_app.config['RIGHTS_CACHE_TTL']:
+            return revoked
+
+        revoked = {'loaded': time.time(), 'tokens': set(), 'users': {}}
+        revocations = current_app.data.driver.db['sessionrevocation']
+        for revocation in revocations.find({'expire': {'$gt': datetime.utcnow()}}):
+            if revocation.get('jti'):
+                revoked['tokens'].add(revocation['jti'])
+            else:
+                revoked['users'][revocation['user']] = max(
+                    revocation['issued_before'], revoked['users'].get(revocation['user'], 0))
+        SessionToken.revoked = revoked
+        return revoked
+
+    @staticmethod
+    def revoke(claims):
+        """
+            Revoke a session token, used on logout
+
+        :param claims: claims of the session token
+        :type claims: dict
+        :return: None
+        """
+        current_app.data.driver.db['sessionrevocation'].insert_one({
+            'jti': claims['jti'],
+            'user': claims['user'],
+            'issued_before': 0,
+            'expire': datetime.utcfromtimestamp(claims['exp'])
+        })
+        SessionToken.get_revoked()['tokens'].add(claims['jti'])
+
+    @staticmethod
+    def revoke_user(user_id):
+        """
+            Revoke all the session tokens of a user, used when the user password changes
+
+        :param user_id: id of the user
+        :type user_id: ObjectId
+        :return: None
+        """
+        if not SessionToken.enabled():
+            return
+        now = time.time()
+        current_app.data.driver.db['sessionrevocation'].insert_one({
+            'jti': '',
+            'user': user_id,
+            'issued_before': now,
+            'expire': datetime.utcfromtimestamp(now + current_app.config['SESSION_TOKEN_TTL'])
+        })
+        SessionToken.get_revoked()['users'][user_id] = now
@@ -16,7 +16,9 @@ import statsd
 
 from eve.methods.post import post_internal
 from alignak_backend.carboniface import CarbonIface
+from alignak_backend.namecache import NameCache
 from alignak_backend.perfdata import PerfDatas, Metric
+from alignak_backend.realmtree import RealmTree
 
 
 class Timeseries(object):
@@ -92,24 +94,26 @@ class Timeseries(object):
         :type items: list
         :return: None
         """
-        host_db = current_app.data.driver.db['host']
-        service_db = current_app.data.driver.db['service']
         for dummy, item in enumerate(items):
-            host_info = host_db.find_one({'_id': item['host']})
+            host_info = NameCache.get('host', item['host'])
             if not host_info['process_perf_data']:
                 continue
             item_realm = host_info['_realm']
-            item['_overall_state_id'] = host_info['_overall_state_id']
             host_name = Timeseries.sanitize_name(host_info['name'])
             service_name = ''
+            resource, element_id = 'host', item['host']
             if item['service'] is not None:
-                service_info = service_db.find_one({'_id': item['service']})
+                service_info = NameCache.get('service', item['service'])
                 if not service_info['process_perf_data']:
                     continue
                 service_name = Timeseries.sanitize_name(service_info['name'])
                 # todo: really? a service realm may be different from its host's realm ?
                 item_realm = service_info['_realm']
-                item['_overall_state_id'] = service_info['_overall_state_id']
+                resource, element_id = 'service', item['service']
+            # The overall state is not cached, it is modified by the check results
+            element = current_app.data.driver.db[resource].find_one(
+                {'_id': element_id}, {'_overall_state_id': 1})
+            item['_overall_state_id'] = element['_overall_state_id']
             ts = Timeseries.prepare_data(item)
             send_data = []
             for d in ts['data']:
@@ -215,15 +219,7 @@ class Timeseries(object):
         :return: realms name separed by .
         :rtype: str
         """
-        prefix_realm = ''
-        realm_db = current_app.data.driver.db['realm']
-        realm_info = realm_db.find_one({'_id': realm_id})
-        if realm_info.get('_tree_parents', []):
-            realms = realm_db.find({'_id': {"$in": realm_info['_tree_parents']}}).sort("_level")
-            for realm in realms:
-                prefix_realm += realm['name'] + "."
-        prefix_realm += realm_info['name']
-        return prefix_realm
+        return RealmTree.name_path(realm_id)
 
     @staticmethod
     def send_to_timeseries_db(data, item_realm):
@@ -252,11 +248,9 @@ class Timeseries(object):
         """
         graphite_db = current_app.data.driver.db['graphite']
         influxdb_db = current_app.data.driver.db['influxdb']
-        realm_db = current_app.data.driver.db['realm']
 
         searches = [{'_realm': item_realm}]
-        realm_info = realm_db.find_one({'_id': item_realm})
-        for realm in realm_info.get('_tree_parents', []):
+        for realm in RealmTree.ancestors(item_realm):
             searches.append({'_realm': realm, '_sub_realm': True})
 
         # get graphite servers to send to
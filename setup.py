@@ -129,7 +129,8 @@ setup(
     # Entry points (if some) ...
     entry_points={
         'console_scripts': [
-            'alignak-backend = alignak_backend.main:main'
+            'alignak-backend = alignak_backend.main:main',
+            'alignak-backend-livesynthesis = alignak_backend.changestream:main'
         ],
     }
 )
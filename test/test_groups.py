@@ -10,6 +10,7 @@ import time
 import shlex
 import subprocess
 import copy
+import json
 import requests
 import unittest2
 
@@ -934,3 +935,191 @@ class TestGroups(unittest2.TestCase):
         self.assertEqual(re[6]['_tree_parents'], [
             self.hgAll_id, usergroupAll_C_id
         ])
+
+    def test_livesynthesis_hostgroup(self):
+        """Test the live synthesis of the hosts groups
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+        sort_id = {'sort': '_id'}
+
+        # get hostgroup All
+        params = {'where': json.dumps({'name': 'All'})}
+        response = requests.get(self.endpoint + '/hostgroup', params=params, auth=self.auth)
+        resp = response.json()
+        hg_all_id = resp['_items'][0]['_id']
+
+        # Add command and host
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = self.realmAll_id
+        requests.post(self.endpoint + '/command', json=data, headers=headers, auth=self.auth)
+        params = {'where': json.dumps({'name': 'ping'})}
+        response = requests.get(self.endpoint + '/command', params=params, auth=self.auth)
+        resp = response.json()
+        command_id = resp['_items'][0]['_id']
+
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['name'] = 'srv_ls'
+        data['check_command'] = command_id
+        del data['realm']
+        data['_realm'] = self.realmAll_id
+        response = requests.post(self.endpoint + '/host', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual('OK', resp['_status'], resp)
+        host_id = resp['_id']
+
+        # Add a hosts group with the host and a sub-group without hosts
+        data = {'name': 'LS group', '_parent': hg_all_id, 'hosts': [host_id]}
+        response = requests.post(self.endpoint + '/hostgroup', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual('OK', resp['_status'], resp)
+        hg_id = resp['_id']
+        data = {'name': 'LS sub-group', '_parent': hg_id}
+        response = requests.post(self.endpoint + '/hostgroup', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual('OK', resp['_status'], resp)
+        hg_sub_id = resp['_id']
+
+        params = {'where': json.dumps({'hostgroup': hg_id})}
+        response = requests.get(self.endpoint + '/livesynthesisgroup', params=params,
+                                auth=self.auth)
+        resp = response.json()
+        self.assertEqual(len(resp['_items']), 1)
+        ls = resp['_items'][0]
+        self.assertEqual(ls['hosts_total'], 1)
+        self.assertEqual(ls['hosts_unreachable_hard'], 1)
+        self.assertEqual(ls['hosts_up_hard'], 0)
+
+        params = {'where': json.dumps({'hostgroup': hg_sub_id})}
+        response = requests.get(self.endpoint + '/livesynthesisgroup', params=params,
+                                auth=self.auth)
+        resp = response.json()
+        self.assertEqual(len(resp['_items']), 1)
+        self.assertEqual(resp['_items'][0]['hosts_total'], 0)
+
+        # Update the host live state
+        response = requests.get(self.endpoint + '/host/' + host_id, auth=self.auth)
+        resp = response.json()
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': resp['_etag']}
+        data = {'ls_state': 'UP', 'ls_state_type': 'HARD'}
+        requests.patch(self.endpoint + '/host/' + host_id, json=data, headers=headers_patch,
+                       auth=self.auth)
+
+        params = {'where': json.dumps({'hostgroup': hg_id})}
+        response = requests.get(self.endpoint + '/livesynthesisgroup', params=params,
+                                auth=self.auth)
+        resp = response.json()
+        ls = resp['_items'][0]
+        self.assertEqual(ls['hosts_total'], 1)
+        self.assertEqual(ls['hosts_unreachable_hard'], 0)
+        self.assertEqual(ls['hosts_up_hard'], 1)
+
+        # Disable / enable the host monitoring, the groups live synthesis is recalculated
+        for monitored in [False, True]:
+            response = requests.get(self.endpoint + '/host/' + host_id, auth=self.auth)
+            resp = response.json()
+            headers_patch = {'Content-Type': 'application/json', 'If-Match': resp['_etag']}
+            data = {'active_checks_enabled': monitored, 'passive_checks_enabled': monitored}
+            response = requests.patch(self.endpoint + '/host/' + host_id, json=data,
+                                      headers=headers_patch, auth=self.auth)
+            resp = response.json()
+            self.assertEqual('OK', resp['_status'], resp)
+
+            params = {'where': json.dumps({'hostgroup': hg_id})}
+            response = requests.get(self.endpoint + '/livesynthesisgroup', params=params,
+                                    auth=self.auth)
+            ls = response.json()['_items'][0]
+            self.assertEqual(ls['hosts_total'], 1)
+            self.assertEqual(ls['hosts_not_monitored'], 0 if monitored else 1)
+            self.assertEqual(ls['hosts_up_hard'], 1 if monitored else 0)
+
+        # Move the host to the sub-group, the parent group still counts it
+        response = requests.get(self.endpoint + '/hostgroup/' + hg_sub_id, auth=self.auth)
+        resp = response.json()
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': resp['_etag']}
+        requests.patch(self.endpoint + '/hostgroup/' + hg_sub_id, json={'hosts': [host_id]},
+                       headers=headers_patch, auth=self.auth)
+        response = requests.get(self.endpoint + '/hostgroup/' + hg_id, auth=self.auth)
+        resp = response.json()
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': resp['_etag']}
+        requests.patch(self.endpoint + '/hostgroup/' + hg_id, json={'hosts': []},
+                       headers=headers_patch, auth=self.auth)
+
+        response = requests.get(self.endpoint + '/livesynthesisgroup', params=sort_id,
+                                auth=self.auth)
+        resp = response.json()
+        ls = dict([(item['hostgroup'], item) for item in resp['_items']
+                   if item.get('hostgroup')])
+        self.assertEqual(ls[hg_id]['hosts_total'], 1)
+        self.assertEqual(ls[hg_id]['hosts_up_hard'], 1)
+        self.assertEqual(ls[hg_sub_id]['hosts_total'], 1)
+        self.assertEqual(ls[hg_sub_id]['hosts_up_hard'], 1)
+
+        # Delete the sub-group, its live synthesis is deleted
+        response = requests.get(self.endpoint + '/hostgroup/' + hg_sub_id, auth=self.auth)
+        resp = response.json()
+        headers_delete = {'If-Match': resp['_etag']}
+        requests.delete(self.endpoint + '/hostgroup/' + hg_sub_id, headers=headers_delete,
+                        auth=self.auth)
+        params = {'where': json.dumps({'hostgroup': hg_sub_id})}
+        response = requests.get(self.endpoint + '/livesynthesisgroup', params=params,
+                                auth=self.auth)
+        resp = response.json()
+        self.assertEqual(len(resp['_items']), 0)
+
+    def test_livesynthesis_group_write_behind(self):
+        """Test the groups live synthesis modifications kept pending and the scheduled
+        recalculations
+
+        :return: None
+        """
+        from bson.objectid import ObjectId
+        from alignak_backend.app import app
+        from alignak_backend.groupsynthesis import Groupsynthesis
+
+        headers = {'Content-Type': 'application/json'}
+        params = {'where': json.dumps({'name': 'All'})}
+        response = requests.get(self.endpoint + '/hostgroup', params=params, auth=self.auth)
+        hg_all_id = response.json()['_items'][0]['_id']
+        data = {'name': 'WB group', '_parent': hg_all_id}
+        response = requests.post(self.endpoint + '/hostgroup', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual('OK', resp['_status'], resp)
+        hg_id = ObjectId(resp['_id'])
+
+        with app.test_request_context():
+            livesynthesisgroup_db = app.data.driver.db['livesynthesisgroup']
+            Groupsynthesis.recalculate('hostgroup')
+            app.config['LIVESYNTHESIS_FLUSH_PERIOD'] = 60
+            app.config['LIVESYNTHESIS_RECALCULATE_PERIOD'] = 60
+            try:
+                # The modifications are pending until the flush
+                Groupsynthesis.increment('hostgroup', [hg_id], {'hosts_total': 1})
+                ls = livesynthesisgroup_db.find_one({'hostgroup': hg_id})
+                self.assertEqual(ls['hosts_total'], 0)
+                self.assertEqual(Groupsynthesis.flush(), 1)
+                ls = livesynthesisgroup_db.find_one({'hostgroup': hg_id})
+                self.assertEqual(ls['hosts_total'], 1)
+
+                # The recalculation is scheduled
+                Groupsynthesis.schedule_recalculate('hostgroup')
+                self.assertEqual(Groupsynthesis.pending_recalculate, set(['hostgroup']))
+                self.assertGreaterEqual(Groupsynthesis.recalculate_scheduled(), 1)
+                self.assertEqual(Groupsynthesis.pending_recalculate, set())
+                ls = livesynthesisgroup_db.find_one({'hostgroup': hg_id})
+                self.assertEqual(ls['hosts_total'], 0)
+
+                # Modifications made before the recalculation are dropped
+                Groupsynthesis.add_pending('hostgroup', hg_id, {'hosts_total': 1},
+                                           time.time() - 10)
+                self.assertEqual(Groupsynthesis.flush(), 0)
+                ls = livesynthesisgroup_db.find_one({'hostgroup': hg_id})
+                self.assertEqual(ls['hosts_total'], 0)
+            finally:
+                app.config['LIVESYNTHESIS_FLUSH_PERIOD'] = 0
+                app.config['LIVESYNTHESIS_RECALCULATE_PERIOD'] = 0
@@ -566,3 +566,116 @@ class TestHistory(unittest2.TestCase):
         re = resp['_items']
         # No results ...
         self.assertEqual(len(re), 3)
+
+    def test_history_names(self):
+        """Test history: the host and service names are resolved, and resolved again when the
+        service is renamed
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+        sort_id = {'sort': '_id'}
+
+        response = requests.get(self.endpoint + '/host', params={'sort': 'name'}, auth=self.auth)
+        resp = response.json()
+        rh = resp['_items']
+        self.assertEqual(rh[1]['name'], "srv001")
+        response = requests.get(self.endpoint + '/service', auth=self.auth)
+        resp = response.json()
+        rs = resp['_items']
+        self.assertEqual(rs[0]['name'], "ping")
+
+        data = {
+            "host_name": "srv001",
+            "service_name": "ping",
+            "user_name": "admin",
+            "type": "webui.comment",
+            "message": "User comment"
+        }
+        response = requests.post(
+            self.endpoint + '/history', json=data, headers=headers, auth=self.auth
+        )
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+
+        # Rename the service
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': rs[0]['_etag']}
+        response = requests.patch(self.endpoint + '/service/' + rs[0]['_id'],
+                                  json={'name': 'ping2'}, headers=headers_patch, auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+
+        data = {
+            "host": rh[1]['_id'],
+            "service": rs[0]['_id'],
+            "user": self.user_admin,
+            "type": "webui.comment",
+            "message": "User comment"
+        }
+        response = requests.post(
+            self.endpoint + '/history', json=data, headers=headers, auth=self.auth
+        )
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+        data = {
+            "host_name": "srv001",
+            "service_name": "ping2",
+            "user_name": "admin",
+            "type": "webui.comment",
+            "message": "User comment"
+        }
+        response = requests.post(
+            self.endpoint + '/history', json=data, headers=headers, auth=self.auth
+        )
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/history', params=sort_id, auth=self.auth)
+        resp = response.json()
+        re = resp['_items']
+        self.assertEqual(len(re), 3)
+        for history, service_name in zip(re, ['ping', 'ping2', 'ping2']):
+            self.assertEqual(history['host'], rh[1]['_id'])
+            self.assertEqual(history['host_name'], 'srv001')
+            self.assertEqual(history['service'], rs[0]['_id'])
+            self.assertEqual(history['service_name'], service_name)
+            self.assertEqual(history['user'], self.user_admin)
+            self.assertEqual(history['user_name'], 'admin')
+            self.assertEqual(history['_realm'], self.realm_all)
+
+    def test_history_out_of_request(self):
+        """Test history: the events of the hooks run out of a backend request (cron routes,
+        scheduler jobs) are written immediately, they are buffered during a backend request
+
+        :return: None
+        """
+        response = requests.get(self.endpoint + '/host', params={'where': '{"name":"srv001"}'},
+                                auth=self.auth)
+        host_id = response.json()['_items'][0]['_id']
+
+        from bson.objectid import ObjectId
+        from flask import g
+        from alignak_backend.app import app, after_insert_actionacknowledge
+        from alignak_backend.historywriter import HistoryWriter
+        acknowledge = {'host': ObjectId(host_id), 'service': None,
+                       'user': ObjectId(self.user_admin), 'action': 'add',
+                       'comment': 'Acknowledged out of a request'}
+        params = {'where': '{"type":"ack.add"}'}
+        with app.test_request_context():
+            after_insert_actionacknowledge([acknowledge])
+            response = requests.get(self.endpoint + '/history', params=params, auth=self.auth)
+            re = response.json()['_items']
+            self.assertEqual(len(re), 1)
+            self.assertEqual(re[0]['host'], host_id)
+            self.assertEqual(re[0]['host_name'], 'srv001')
+            self.assertEqual(re[0]['user_name'], 'admin')
+            self.assertEqual(re[0]['message'], 'Acknowledged out of a request')
+
+        with app.test_request_context():
+            g.deferred_writes = True
+            after_insert_actionacknowledge([acknowledge])
+            response = requests.get(self.endpoint + '/history', params=params, auth=self.auth)
+            self.assertEqual(len(response.json()['_items']), 1)
+            self.assertEqual(HistoryWriter.flush(), 1)
+            response = requests.get(self.endpoint + '/history', params=params, auth=self.auth)
+            self.assertEqual(len(response.json()['_items']), 2)
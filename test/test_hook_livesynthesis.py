@@ -12,7 +12,9 @@ import subprocess
 import copy
 import requests
 import unittest2
+from bson.objectid import ObjectId
 from alignak_backend.livesynthesis import Livesynthesis
+from alignak_backend.changestream import LivesynthesisStream
 
 
 class TestHookLivesynthesis(unittest2.TestCase):
@@ -2258,6 +2260,86 @@ class TestHookLivesynthesis(unittest2.TestCase):
                 self.assertEqual(ls['services_unreachable_hard'], 0)
                 self.assertEqual(ls['services_unreachable_soft'], 0)
 
+    def test_realms_subtree(self):
+        """
+        Test the sub-tree counters of nested realms: a service state change is counted in the
+        sub-tree counters of its realm and of all the realm ancestors
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+        data = {"name": "All A", "_parent": self.realm_all}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realm_a = response.json()['_id']
+        data = {"name": "All A.1", "_parent": realm_a}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realm_a1 = response.json()['_id']
+
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = self.realm_all
+        requests.post(self.endpoint + '/command', json=data, headers=headers, auth=self.auth)
+        params = {'where': json.dumps({'name': 'ping'})}
+        response = requests.get(self.endpoint + '/command', params=params, auth=self.auth)
+        command_id = response.json()['_items'][0]['_id']
+
+        # Add an host and a service in the realm All A.1
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['check_command'] = command_id
+        if 'realm' in data:
+            del data['realm']
+        data['_realm'] = realm_a1
+        response = requests.post(self.endpoint + '/host', json=data, headers=headers,
+                                 auth=self.auth)
+        host_id = response.json()['_id']
+        data = json.loads(open('cfg/service_srv001_ping.json').read())
+        data['host'] = host_id
+        data['check_command'] = command_id
+        data['_realm'] = realm_a1
+        response = requests.post(self.endpoint + '/service', json=data, headers=headers,
+                                 auth=self.auth)
+        service = response.json()
+
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': service['_etag']}
+        data = {'ls_state': 'CRITICAL', 'ls_state_id': 2, 'ls_state_type': 'HARD'}
+        response = requests.patch(self.endpoint + '/service/' + service['_id'], json=data,
+                                  headers=headers_patch, auth=self.auth)
+        self.assertEqual(response.json()['_status'], 'OK')
+
+        from alignak_backend.app import app
+        with app.app_context():
+            livesynthesis_db = app.data.driver.db['livesynthesis']
+            for realm_id, count in [(realm_a1, 1), (realm_a, 0), (self.realm_all, 0)]:
+                ls = livesynthesis_db.find_one({'_realm': ObjectId(realm_id)})
+                self.assertEqual(ls['services_critical_hard'], count)
+                self.assertEqual(ls['_subtree']['hosts_total'], 1)
+                self.assertEqual(ls['_subtree']['services_total'], 1)
+                self.assertEqual(ls['_subtree']['services_critical_hard'], 1)
+                self.assertEqual(ls['_subtree']['services_unknown_hard'], 0)
+
+        # The sub-trees counters are computed at the end of a backend request, and immediately
+        # out of a backend request (cron routes, scheduler jobs)
+        from flask import g
+        with app.test_request_context():
+            livesynthesis_db.update_one({'_realm': ObjectId(self.realm_all)},
+                                        {'$set': {'_subtree.hosts_total': 10}})
+            g.deferred_writes = True
+            Livesynthesis.schedule_rollup()
+            ls = livesynthesis_db.find_one({'_realm': ObjectId(self.realm_all)})
+            self.assertEqual(ls['_subtree']['hosts_total'], 10)
+            Livesynthesis.flush_rollup()
+            ls = livesynthesis_db.find_one({'_realm': ObjectId(self.realm_all)})
+            self.assertEqual(ls['_subtree']['hosts_total'], 1)
+
+        with app.test_request_context():
+            livesynthesis_db.update_one({'_realm': ObjectId(self.realm_all)},
+                                        {'$set': {'_subtree.hosts_total': 10}})
+            Livesynthesis.schedule_rollup()
+            ls = livesynthesis_db.find_one({'_realm': ObjectId(self.realm_all)})
+            self.assertEqual(ls['_subtree']['hosts_total'], 1)
+
     def test_ack_downtime_raise_expire(self):
         """
         Test livesynthesis when updating only ls_acknowledged and ls_downtime by broker module
@@ -2993,3 +3075,283 @@ class TestHookLivesynthesis(unittest2.TestCase):
         self.assertEqual(r[0]['services_unreachable_soft'], 0)
         self.assertEqual(r[0]['services_acknowledged'], 0)
         self.assertEqual(r[0]['services_in_downtime'], 0)
+
+    def test_write_behind(self):
+        """
+        Test the live synthesis counters modifications merged in memory and flushed
+
+        :return: None
+        """
+        from alignak_backend.app import app
+        from alignak_backend.timeseries import Timeseries
+        send_livesynthesis_metrics = Timeseries.__dict__['send_livesynthesis_metrics']
+        with app.test_request_context():
+            Livesynthesis.recalculate()
+            app.config['LIVESYNTHESIS_FLUSH_PERIOD'] = 60
+            app.config['LIVESYNTHESIS_FLUSH_COUNT'] = 3
+            try:
+                realm_all = ObjectId(self.realm_all)
+                livesynthesis_db = app.data.driver.db['livesynthesis']
+
+                # The modifications are pending
+                Livesynthesis.update_counters(realm_all, {'hosts_total': 1,
+                                                          'hosts_up_hard': 1})
+                Livesynthesis.update_counters(realm_all, {'hosts_up_hard': -1,
+                                                          'hosts_down_hard': 1})
+                ls = livesynthesis_db.find_one({'_realm': realm_all})
+                self.assertEqual(ls['hosts_total'], 0)
+                self.assertEqual(ls['hosts_up_hard'], 0)
+                self.assertEqual(ls['hosts_down_hard'], 0)
+                self.assertEqual(Livesynthesis.pending_count, 2)
+
+                # Too many pending modifications, they are merged and written
+                Livesynthesis.update_counters(realm_all, {'hosts_down_hard': -1,
+                                                          'hosts_down_soft': 1})
+                ls = livesynthesis_db.find_one({'_realm': realm_all})
+                self.assertEqual(ls['hosts_total'], 1)
+                self.assertEqual(ls['hosts_up_hard'], 0)
+                self.assertEqual(ls['hosts_down_hard'], 0)
+                self.assertEqual(ls['hosts_down_soft'], 1)
+                self.assertEqual(Livesynthesis.pending_count, 0)
+
+                # Periodic flush
+                Livesynthesis.update_counters(realm_all, {'hosts_total': -1,
+                                                          'hosts_down_soft': -1})
+                self.assertEqual(Livesynthesis.flush(send_metrics=True), 1)
+                self.assertEqual(Livesynthesis.pending_metrics, set())
+                ls = livesynthesis_db.find_one({'_realm': realm_all})
+                self.assertEqual(ls['hosts_total'], 0)
+                self.assertEqual(ls['hosts_down_soft'], 0)
+
+                # The pending modifications are written before a recalculation
+                Livesynthesis.update_counters(realm_all, {'hosts_total': 1})
+                Livesynthesis.recalculate([realm_all])
+                self.assertEqual(Livesynthesis.pending_count, 0)
+                ls = livesynthesis_db.find_one({'_realm': realm_all})
+                self.assertEqual(ls['hosts_total'], 0)
+                self.assertNotIn('_recalculating', ls)
+
+                # Modifications of another process made before the recalculation are dropped
+                Livesynthesis.add_pending(realm_all, {'hosts_total': 1}, time.time() - 10)
+                self.assertEqual(Livesynthesis.flush(), 0)
+                ls = livesynthesis_db.find_one({'_realm': realm_all})
+                self.assertEqual(ls['hosts_total'], 0)
+
+                # Modifications made during a recalculation are kept for the next flush
+                livesynthesis_db.update_one({'_realm': realm_all},
+                                            {'$set': {'_recalculating': time.time() - 5}})
+                Livesynthesis.add_pending(realm_all, {'hosts_total': 1})
+                self.assertEqual(Livesynthesis.flush(), 0)
+                self.assertEqual(Livesynthesis.pending_count, 1)
+                livesynthesis_db.update_one({'_realm': realm_all},
+                                            {'$unset': {'_recalculating': ''}})
+                self.assertEqual(Livesynthesis.flush(), 1)
+                ls = livesynthesis_db.find_one({'_realm': realm_all})
+                self.assertEqual(ls['hosts_total'], 1)
+                Livesynthesis.update_counters(realm_all, {'hosts_total': -1})
+                Livesynthesis.flush()
+
+                # A missing realm live synthesis is recalculated, the other realms are
+                # updated and their metrics are sent
+                app.config['LIVESYNTHESIS_RECALCULATE_PERIOD'] = 60
+                sent = []
+                Timeseries.send_livesynthesis_metrics = staticmethod(
+                    lambda realm_id, livesynthesis: sent.append(realm_id))
+                unknown_realm = ObjectId()
+                Livesynthesis.update_counters(realm_all, {'hosts_total': 1})
+                Livesynthesis.add_pending(unknown_realm, {'hosts_total': 1})
+                self.assertEqual(Livesynthesis.flush(send_metrics=True), 2)
+                self.assertEqual(Livesynthesis.pending_recalculate, set([unknown_realm]))
+                self.assertEqual(sent, [realm_all])
+                ls = livesynthesis_db.find_one({'_realm': realm_all})
+                self.assertEqual(ls['hosts_total'], 1)
+                Livesynthesis.update_counters(realm_all, {'hosts_total': -1})
+                Livesynthesis.flush()
+            finally:
+                app.config['LIVESYNTHESIS_FLUSH_PERIOD'] = 0
+                app.config['LIVESYNTHESIS_RECALCULATE_PERIOD'] = 0
+                Livesynthesis.pending_recalculate = set()
+                Timeseries.send_livesynthesis_metrics = send_livesynthesis_metrics
+
+    def test_add_hosts_bulk(self):
+        """
+        Test livesynthesis when add several hosts and services with one request, and when
+        delete a host with its services
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+        sort_id = {'sort': '_id'}
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = self.realm_all
+        requests.post(self.endpoint + '/command', json=data, headers=headers, auth=self.auth)
+        response = requests.get(self.endpoint + '/command', params=sort_id, auth=self.auth)
+        rc = response.json()['_items']
+
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['check_command'] = rc[2]['_id']
+        if 'realm' in data:
+            del data['realm']
+        data['_realm'] = self.realm_all
+        hosts = []
+        for name in ['srv001', 'srv002', 'srv003']:
+            host = copy.copy(data)
+            host['name'] = name
+            hosts.append(host)
+        hosts[2]['active_checks_enabled'] = False
+        hosts[2]['passive_checks_enabled'] = False
+        response = requests.post(self.endpoint + '/host', json=hosts, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+        host_id = resp['_items'][0]['_id']
+        host_etag = resp['_items'][0]['_etag']
+
+        data = json.loads(open('cfg/service_srv001_ping.json').read())
+        data['host'] = host_id
+        data['check_command'] = rc[2]['_id']
+        data['_realm'] = self.realm_all
+        services = []
+        for name in ['ping', 'http', 'ssh']:
+            service = copy.copy(data)
+            service['name'] = name
+            services.append(service)
+        response = requests.post(self.endpoint + '/service', json=services, headers=headers,
+                                 auth=self.auth)
+        self.assertEqual(response.json()['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/livesynthesis', params=sort_id, auth=self.auth)
+        r = response.json()['_items']
+        self.assertEqual(len(r), 1)
+        self.assertEqual(r[0]['hosts_total'], 3)
+        self.assertEqual(r[0]['hosts_not_monitored'], 1)
+        self.assertEqual(r[0]['hosts_unreachable_hard'], 2)
+        self.assertEqual(r[0]['services_total'], 3)
+        self.assertEqual(r[0]['services_unknown_hard'], 3)
+
+        # Delete the host and its services
+        headers_delete = {'Content-Type': 'application/json', 'If-Match': host_etag}
+        response = requests.delete(self.endpoint + '/host/' + host_id,
+                                   headers=headers_delete, auth=self.auth)
+        self.assertEqual(response.status_code, 204)
+
+        response = requests.get(self.endpoint + '/livesynthesis', params=sort_id, auth=self.auth)
+        r = response.json()['_items']
+        self.assertEqual(r[0]['hosts_total'], 2)
+        self.assertEqual(r[0]['hosts_not_monitored'], 1)
+        self.assertEqual(r[0]['hosts_unreachable_hard'], 1)
+        self.assertEqual(r[0]['services_total'], 0)
+        self.assertEqual(r[0]['services_unknown_hard'], 0)
+
+    def test_recalculate_scheduled(self):
+        """
+        Test the live synthesis recalculations grouped and deduplicated per realm
+
+        :return: None
+        """
+        from alignak_backend.app import app
+        with app.test_request_context():
+            Livesynthesis.recalculate()
+            app.config['LIVESYNTHESIS_RECALCULATE_PERIOD'] = 60
+            try:
+                realm_all = ObjectId(self.realm_all)
+                livesynthesis_db = app.data.driver.db['livesynthesis']
+                livesynthesis_db.update_one({'_realm': realm_all}, {'$set': {'hosts_total': 10}})
+
+                # The recalculation requests are deduplicated
+                for _ in range(0, 5):
+                    Livesynthesis.schedule_recalculate(realm_all)
+                self.assertEqual(Livesynthesis.pending_recalculate, set([realm_all]))
+                ls = livesynthesis_db.find_one({'_realm': realm_all})
+                self.assertEqual(ls['hosts_total'], 10)
+
+                # Only the requested realm is recalculated
+                result = Livesynthesis.recalculate_scheduled()
+                self.assertEqual(result['realms'], 1)
+                self.assertEqual(Livesynthesis.pending_recalculate, set())
+                ls = livesynthesis_db.find_one({'_realm': realm_all})
+                self.assertEqual(ls['hosts_total'], 0)
+
+                # Nothing to recalculate
+                self.assertIsNone(Livesynthesis.recalculate_scheduled())
+            finally:
+                app.config['LIVESYNTHESIS_RECALCULATE_PERIOD'] = 0
+
+    def test_check(self):
+        """
+        Test the live synthesis counters check: the drifted realms are recalculated
+
+        :return: None
+        """
+        from alignak_backend.app import app
+        with app.test_request_context():
+            Livesynthesis.recalculate()
+            realm_all = ObjectId(self.realm_all)
+            livesynthesis_db = app.data.driver.db['livesynthesis']
+
+            result = Livesynthesis.check(10)
+            self.assertEqual(result['realms'], 1)
+            self.assertEqual(result['drift'], {})
+
+            livesynthesis_db.update_one({'_realm': realm_all},
+                                        {'$inc': {'hosts_total': 2, 'services_ok_hard': -1}})
+            result = Livesynthesis.check(10)
+            self.assertEqual(result['drift'], {self.realm_all: 3})
+            ls = livesynthesis_db.find_one({'_realm': realm_all})
+            self.assertEqual(ls['hosts_total'], 0)
+            self.assertEqual(ls['services_ok_hard'], 0)
+
+            result = Livesynthesis.check(10)
+            self.assertEqual(result['drift'], {})
+
+    def test_changestream(self):
+        """
+        Test the live synthesis update from the change stream events, the changes already
+        known are ignored
+
+        :return: None
+        """
+        from alignak_backend.app import app
+        with app.test_request_context():
+            realm_all = ObjectId(self.realm_all)
+            host_db = app.data.driver.db['host']
+            livesynthesis_db = app.data.driver.db['livesynthesis']
+            self.assertEqual(LivesynthesisStream.load(), 0)
+
+            # A host written directly in the database
+            host = {'name': 'srv_stream', '_realm': realm_all, '_is_template': False,
+                    'active_checks_enabled': True, 'passive_checks_enabled': True,
+                    'ls_state': 'UNREACHABLE', 'ls_state_type': 'HARD',
+                    'ls_acknowledged': False, 'ls_downtimed': False}
+            host_id = host_db.insert_one(host).inserted_id
+            change = {'operationType': 'insert', 'ns': {'coll': 'host'},
+                      'documentKey': {'_id': host_id},
+                      'fullDocument': host_db.find_one({'_id': host_id})}
+            self.assertEqual(LivesynthesisStream.process([change]), 1)
+            ls = livesynthesis_db.find_one({'_realm': realm_all})
+            self.assertEqual(ls['hosts_total'], 1)
+            self.assertEqual(ls['hosts_unreachable_hard'], 1)
+            self.assertEqual(ls['_subtree']['hosts_total'], 1)
+
+            # The same change again
+            self.assertEqual(LivesynthesisStream.process([change]), 0)
+
+            host_db.update_one({'_id': host_id}, {'$set': {'ls_state': 'UP'}})
+            change = {'operationType': 'update', 'ns': {'coll': 'host'},
+                      'documentKey': {'_id': host_id},
+                      'fullDocument': host_db.find_one({'_id': host_id})}
+            self.assertEqual(LivesynthesisStream.process([change, change]), 1)
+            ls = livesynthesis_db.find_one({'_realm': realm_all})
+            self.assertEqual(ls['hosts_total'], 1)
+            self.assertEqual(ls['hosts_unreachable_hard'], 0)
+            self.assertEqual(ls['hosts_up_hard'], 1)
+
+            host_db.delete_one({'_id': host_id})
+            change = {'operationType': 'delete', 'ns': {'coll': 'host'},
+                      'documentKey': {'_id': host_id}}
+            self.assertEqual(LivesynthesisStream.process([change]), 1)
+            ls = livesynthesis_db.find_one({'_realm': realm_all})
+            self.assertEqual(ls['hosts_total'], 0)
+            self.assertEqual(ls['hosts_up_hard'], 0)
+            self.assertEqual(ls['_subtree']['hosts_total'], 0)
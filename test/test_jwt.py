@@ -80,3 +80,48 @@ class TestJWT(unittest2.TestCase):
         """
         headers = {'Authorization': 'Bearer '}
         assert requests.get(self.endpoint, headers=headers).status_code == 401
+
+    def test_session_token(self):
+        """
+        Test the signed session tokens: log in, use, log out and password change
+        """
+        headers = {'Content-Type': 'application/json'}
+        params = {'username': 'admin', 'password': 'admin', 'action': 'session'}
+        response = requests.post(self.endpoint + '/login', json=params, headers=headers)
+        token = response.json()['token']
+        assert token.count('.') == 2
+
+        # Use the session token as a basic auth token or as a bearer token
+        auth = requests.auth.HTTPBasicAuth(token, '')
+        response = requests.get(self.endpoint + '/realm', auth=auth)
+        assert response.status_code == 200
+        headers = {'Authorization': 'Bearer {}'.format(token)}
+        assert requests.get(self.endpoint + '/realm', headers=headers).status_code == 200
+
+        # Log out revokes the session token
+        response = requests.post(self.endpoint + '/logout', auth=auth)
+        assert response.status_code == 200
+        assert requests.get(self.endpoint + '/realm', auth=auth).status_code == 401
+
+        # A password change revokes the user session tokens
+        headers = {'Content-Type': 'application/json'}
+        response = requests.post(self.endpoint + '/login', json=params, headers=headers)
+        auth = requests.auth.HTTPBasicAuth(response.json()['token'], '')
+        response = requests.get(self.endpoint + '/user', params={'where': '{"name": "admin"}'},
+                                auth=auth)
+        user = response.json()['_items'][0]
+        headers = {'Content-Type': 'application/json', 'If-Match': user['_etag']}
+        response = requests.patch(self.endpoint + '/user/' + user['_id'],
+                                  json={'password': 'admin'}, headers=headers, auth=auth)
+        assert response.json()['_status'] == 'OK'
+        assert requests.get(self.endpoint + '/realm', auth=auth).status_code == 401
+
+        # A new session token is valid
+        headers = {'Content-Type': 'application/json'}
+        response = requests.post(self.endpoint + '/login', json=params, headers=headers)
+        auth = requests.auth.HTTPBasicAuth(response.json()['token'], '')
+        assert requests.get(self.endpoint + '/realm', auth=auth).status_code == 200
+
+        # An altered session token is refused
+        auth = requests.auth.HTTPBasicAuth(response.json()['token'][:-2] + 'xx', '')
+        assert requests.get(self.endpoint + '/realm', auth=auth).status_code == 401
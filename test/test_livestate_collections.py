@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This test checks the live state stored in the live state collections (LIVESTATE_COLLECTIONS)
+"""
+
+from __future__ import print_function
+import os
+import json
+import shlex
+import subprocess
+import time
+import requests
+import unittest2
+
+
+class TestLivestateCollections(unittest2.TestCase):
+    """
+    This class tests the live state collections
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """This method:
+          * deletes mongodb database
+          * starts the backend with uwsgi, the live state collections being enabled
+          * logs in the backend and get the token
+          * gets the realm
+          * adds a command, an host and a service
+
+        :return: None
+        """
+        # Set test mode for Alignak backend
+        os.environ['ALIGNAK_BACKEND_TEST'] = '1'
+        os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'] = 'alignak-backend-test'
+        os.environ['ALIGNAK_BACKEND_CONFIGURATION_FILE'] = './cfg/settings/' \
+                                                           'settings_livestate_collections.json'
+
+        # Delete used mongo DBs
+        exit_code = subprocess.call(
+            shlex.split(
+                'mongo %s --eval "db.dropDatabase()"' % os.environ['ALIGNAK_BACKEND_MONGO_DBNAME'])
+        )
+        assert exit_code == 0
+
+        cls.p = subprocess.Popen(['uwsgi', '--plugin', 'python', '-w', 'alignak_backend.app:app',
+                                  '--socket', '0.0.0.0:5000',
+                                  '--protocol=http', '--enable-threads', '--pidfile',
+                                  '/tmp/uwsgi.pid'])
+        time.sleep(3)
+
+        cls.endpoint = 'http://127.0.0.1:5000'
+
+        headers = {'Content-Type': 'application/json'}
+        params = {'username': 'admin', 'password': 'admin', 'action': 'generate'}
+        # get token
+        response = requests.post(cls.endpoint + '/login', json=params, headers=headers)
+        resp = response.json()
+        cls.token = resp['token']
+        cls.auth = requests.auth.HTTPBasicAuth(cls.token, '')
+
+        # get realms
+        response = requests.get(cls.endpoint + '/realm', auth=cls.auth)
+        resp = response.json()
+        cls.realm_all = resp['_items'][0]['_id']
+
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = cls.realm_all
+        requests.post(cls.endpoint + '/command', json=data, headers=headers, auth=cls.auth)
+        response = requests.get(cls.endpoint + '/command', auth=cls.auth)
+        rc = response.json()['_items']
+
+        # Add an host
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['check_command'] = rc[0]['_id']
+        if 'realm' in data:
+            del data['realm']
+        data['_realm'] = cls.realm_all
+        response = requests.post(cls.endpoint + '/host', json=data, headers=headers,
+                                 auth=cls.auth)
+        cls.host_id = response.json()['_id']
+
+        # Add a service
+        data = json.loads(open('cfg/service_srv001_ping.json').read())
+        data['host'] = cls.host_id
+        data['check_command'] = rc[0]['_id']
+        data['_realm'] = cls.realm_all
+        response = requests.post(cls.endpoint + '/service', json=data, headers=headers,
+                                 auth=cls.auth)
+        cls.service_id = response.json()['_id']
+
+    @classmethod
+    def tearDownClass(cls):
+        """Kill uwsgi
+
+        :return: None
+        """
+        subprocess.call(['uwsgi', '--stop', '/tmp/uwsgi.pid'])
+        time.sleep(2)
+
+    def test_livestate_joined(self):
+        """Test the live state joined to the services when they are read, the service document
+        is not modified when only the output changes
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        # The state changes
+        data = [{'service': self.service_id, 'ls_state': 'CRITICAL', 'ls_state_id': 2,
+                 'ls_state_type': 'HARD', 'ls_output': 'Service output 1',
+                 'ls_last_check': 1000}]
+        response = requests.post(self.endpoint + '/livestate', json=data, headers=headers,
+                                 auth=self.auth)
+        self.assertEqual(response.json()['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/service/' + self.service_id, auth=self.auth)
+        service = response.json()
+        self.assertEqual(service['ls_state'], 'CRITICAL')
+        self.assertEqual(service['ls_output'], 'Service output 1')
+        self.assertEqual(service['ls_last_check'], 1000)
+        etag = service['_etag']
+
+        # Only the output changes
+        data = [{'service': self.service_id, 'ls_state': 'CRITICAL', 'ls_state_id': 2,
+                 'ls_state_type': 'HARD', 'ls_output': 'Service output 2',
+                 'ls_last_check': 1010}]
+        response = requests.post(self.endpoint + '/livestate', json=data, headers=headers,
+                                 auth=self.auth)
+        self.assertEqual(response.json()['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/service/' + self.service_id, auth=self.auth)
+        service = response.json()
+        self.assertEqual(service['_etag'], etag)
+        self.assertEqual(service['ls_output'], 'Service output 2')
+        self.assertEqual(service['ls_last_check'], 1010)
+
+        params = {'where': json.dumps({'ls_state': 'CRITICAL'})}
+        response = requests.get(self.endpoint + '/service', params=params, auth=self.auth)
+        resp = response.json()
+        self.assertEqual(len(resp['_items']), 1)
+        self.assertEqual(resp['_items'][0]['_id'], self.service_id)
+        self.assertEqual(resp['_items'][0]['ls_output'], 'Service output 2')
+        self.assertEqual(resp['_items'][0]['ls_last_check'], 1010)
+
+        # The projection is respected
+        params = {'projection': json.dumps({'name': 1})}
+        response = requests.get(self.endpoint + '/service/' + self.service_id, params=params,
+                                auth=self.auth)
+        self.assertNotIn('ls_output', response.json())
+
+        # A live state field modified by a PATCH is stored in the live state collection
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': etag}
+        response = requests.patch(self.endpoint + '/service/' + self.service_id,
+                                  json={'ls_output': 'Service output 3'},
+                                  headers=headers_patch, auth=self.auth)
+        self.assertEqual(response.json()['_status'], 'OK')
+        params = {'where': json.dumps({'_id': self.service_id})}
+        response = requests.get(self.endpoint + '/service', params=params, auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['_items'][0]['ls_output'], 'Service output 3')
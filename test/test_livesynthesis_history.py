@@ -607,6 +607,8 @@ class TestHookLivesynthesis(unittest2.TestCase):
             u'services_in_downtime': 0,
             u'services_flapping': 0,
         }
+        # The sub-tree counters are maintained by the backend
+        self.assertEqual(ref, resp['_subtree'])
         for prop in copy.copy(resp):
             if prop.startswith('_'):
                 del resp[prop]
@@ -915,9 +917,83 @@ class TestHookLivesynthesis(unittest2.TestCase):
 
         response = requests.get(self.endpoint + '/cron_livesynthesis_history')
         resp = response.json()
+        # One history line for each of the 2 realms, nothing deleted (no retention configured)
+        self.assertEqual(resp['inserted'], 2)
+        self.assertEqual(resp['deleted'], 0)
+        self.assertIn('total', resp['timing'])
 
         response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
                                 params={'history': 1}, auth=self.auth)
         resp = response.json()
         self.assertEqual(len(resp['history']), (history_count + 1))
         # self.assertGreater(resp['history'][0]['_created'], last_history_date)
+
+    def test_07_get_history_window(self):
+        """
+        Test get item with a limited history: time range and number of items
+
+        :return: None
+        """
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1}, auth=self.auth)
+        history = response.json()['history']
+        self.assertGreater(len(history), 3)
+
+        # Only the most recent items
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1, 'history_max': 3}, auth=self.auth)
+        self.assertEqual(response.json()['history'], history[:3])
+
+        # Nothing in the future
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1, 'concatenation': 1,
+                                        'history_start': 'Fri, 01 Jan 2100 00:00:00 GMT'},
+                                auth=self.auth)
+        self.assertEqual(response.json()['history'], [])
+
+        # Bad parameter
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1, 'history_max': 'ten'}, auth=self.auth)
+        self.assertEqual(response.status_code, 412)
+        for history_max in [0, -5]:
+            response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                    params={'history': 1, 'history_max': history_max},
+                                    auth=self.auth)
+            self.assertEqual(response.status_code, 412)
+
+    def test_08_get_history_tiers(self):
+        """
+        Test get item with the history from the down-sampled history tiers
+
+        :return: None
+        """
+        requests.get(self.endpoint + '/cron_livesynthesis_history')
+
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1, 'history_resolution': 7200},
+                                auth=self.auth)
+        resp = response.json()
+        self.assertGreaterEqual(len(resp['history']), 1)
+        for item in resp['history']:
+            for counter in ['hosts_total', 'services_total', 'hosts_down_hard']:
+                self.assertLessEqual(item['_min'][counter], item[counter])
+                self.assertGreaterEqual(item['_max'][counter], item[counter])
+        self.assertEqual(resp['history'][0]['hosts_total'], resp['hosts_total'])
+
+        # The averages of the sub-realms are summed, not their minimum and maximum
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1, 'history_resolution': 7200,
+                                        'concatenation': 1},
+                                auth=self.auth)
+        resp = response.json()
+        self.assertGreaterEqual(len(resp['history']), 1)
+        self.assertNotIn('_min', resp['history'][0])
+        self.assertNotIn('_max', resp['history'][0])
+        self.assertEqual(resp['history'][0]['hosts_total'], resp['hosts_total'])
+
+        # No tier with this resolution, get the history items
+        response = requests.get(self.endpoint + '/livesynthesis/' + self.ls_all,
+                                params={'history': 1, 'history_resolution': 60},
+                                auth=self.auth)
+        resp = response.json()
+        self.assertNotIn('_min', resp['history'][0])
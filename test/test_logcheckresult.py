@@ -755,3 +755,563 @@ class TestLogcheckresult(unittest2.TestCase):
         self.assertEqual(re[1]['type'], "check.result")
         self.assertEqual(re[1]['message'], "UP[HARD] (False/False): Check output 2")
         self.assertEqual(re[1]['logcheckresult'], check_id)
+
+    def test_logcheckresult_bulk_mixed(self):
+        # pylint: disable=too-many-locals
+        """
+        Test log checks results - bulk posting for hosts and services by names, the livestate
+        of each item is updated if its check result is not too old
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+        sort_id = {'sort': '_id'}
+
+        # Get host and service in the backend
+        response = requests.get(self.endpoint + '/host', params={'sort': 'name'}, auth=self.auth)
+        resp = response.json()
+        rh = resp['_items']
+        self.assertEqual(rh[1]['name'], "srv001")
+        response = requests.get(self.endpoint + '/service', params={'sort': 'name'}, auth=self.auth)
+        resp = response.json()
+        rs = resp['_items']
+        self.assertEqual(rs[0]['name'], "ping")
+
+        # A check result for the service
+        now = timegm(datetime.utcnow().timetuple())
+        data = {
+            "last_check": now,
+            "host": rh[1]['_id'],
+            "service": rs[0]['_id'],
+            'acknowledged': False,
+            'state_id': 0,
+            'state': 'OK',
+            'state_type': 'HARD',
+            'last_state_id': 0,
+            'last_state': 'OK',
+            'last_state_type': 'HARD',
+            'state_changed': False,
+            'output': 'Service output'
+        }
+        response = requests.post(
+            self.endpoint + '/logcheckresult', json=data, headers=headers, auth=self.auth
+        )
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+
+        # A recent check result for the host and an old one for the service, by names
+        data = [
+            {
+                "last_check": now,
+                "host_name": "srv001",
+                'acknowledged': False,
+                'state_id': 1,
+                'state': 'DOWN',
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'UP',
+                'last_state_type': 'HARD',
+                'state_changed': True,
+                'output': 'Host output'
+            },
+            {
+                "last_check": now - 10,
+                "host_name": "srv001",
+                "service_name": "ping",
+                'acknowledged': False,
+                'state_id': 2,
+                'state': 'CRITICAL',
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'OK',
+                'last_state_type': 'HARD',
+                'state_changed': True,
+                'output': 'Old service output'
+            }
+        ]
+        response = requests.post(
+            self.endpoint + '/logcheckresult', json=data, headers=headers, auth=self.auth
+        )
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+
+        response = requests.get(
+            self.endpoint + '/logcheckresult', params=sort_id, auth=self.auth
+        )
+        resp = response.json()
+        rl = resp['_items']
+        self.assertEqual(len(rl), 3)
+        self.assertEqual(rl[1]['host'], rh[1]['_id'])
+        self.assertEqual(rl[1]['host_name'], 'srv001')
+        self.assertEqual(rl[1]['service'], None)
+        self.assertEqual(rl[1]['service_name'], '')
+        self.assertEqual(rl[2]['host'], rh[1]['_id'])
+        self.assertEqual(rl[2]['host_name'], 'srv001')
+        self.assertEqual(rl[2]['service'], rs[0]['_id'])
+        self.assertEqual(rl[2]['service_name'], 'ping')
+
+        # The host livestate is updated, not the service one
+        response = requests.get(self.endpoint + '/host/' + rh[1]['_id'], auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['ls_state'], 'DOWN')
+        self.assertEqual(resp['ls_output'], 'Host output')
+        response = requests.get(self.endpoint + '/service/' + rs[0]['_id'], auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['ls_state'], 'OK')
+        self.assertEqual(resp['ls_output'], 'Service output')
+
+        # A check result for an unknown host
+        data = {
+            "last_check": now,
+            "host_name": "unknown",
+            'state_id': 0,
+            'state': 'UP',
+            'state_type': 'HARD',
+            'last_state_type': 'HARD'
+        }
+        response = requests.post(
+            self.endpoint + '/logcheckresult', json=data, headers=headers, auth=self.auth
+        )
+        self.assertEqual(response.status_code, 412)
+
+    def test_logcheckresult_bulk_livestate(self):
+        """
+        Test log checks results - the livestate, the overall states, the etags and the live
+        synthesis are updated for all the check results of a bulk post
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        response = requests.get(self.endpoint + '/host', params={'sort': 'name'}, auth=self.auth)
+        resp = response.json()
+        rh = resp['_items']
+        self.assertEqual(rh[1]['name'], "srv001")
+        response = requests.get(self.endpoint + '/service', params={'sort': 'name'}, auth=self.auth)
+        resp = response.json()
+        rs = resp['_items']
+        self.assertEqual(rs[0]['name'], "ping")
+
+        now = timegm(datetime.utcnow().timetuple())
+        data = [
+            {
+                "last_check": now,
+                "host": rh[1]['_id'],
+                "service": rs[0]['_id'],
+                'acknowledged': False,
+                'state_id': 2,
+                'state': 'CRITICAL',
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'OK',
+                'last_state_type': 'HARD',
+                'state_changed': True,
+                'output': 'Service output'
+            },
+            {
+                "last_check": now,
+                "host": rh[1]['_id'],
+                'acknowledged': False,
+                'state_id': 0,
+                'state': 'UP',
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'UP',
+                'last_state_type': 'HARD',
+                'state_changed': False,
+                'output': 'Host output'
+            }
+        ]
+        response = requests.post(
+            self.endpoint + '/logcheckresult', json=data, headers=headers, auth=self.auth
+        )
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/service/' + rs[0]['_id'], auth=self.auth)
+        service = response.json()
+        self.assertEqual(service['ls_state'], 'CRITICAL')
+        self.assertEqual(service['ls_output'], 'Service output')
+        self.assertEqual(service['_overall_state_id'], 4)
+        self.assertNotEqual(service['_etag'], rs[0]['_etag'])
+        self.assertEqual(service['_updated'], rs[0]['_updated'])
+
+        response = requests.get(self.endpoint + '/host/' + rh[1]['_id'], auth=self.auth)
+        host = response.json()
+        self.assertEqual(host['ls_state'], 'UP')
+        self.assertEqual(host['ls_output'], 'Host output')
+        # The host is UP but its service is CRITICAL
+        self.assertEqual(host['_overall_state_id'], 4)
+        self.assertNotEqual(host['_etag'], rh[1]['_etag'])
+
+        response = requests.get(self.endpoint + '/livesynthesis', auth=self.auth)
+        resp = response.json()
+        ls = resp['_items'][0]
+        self.assertEqual(ls['hosts_up_hard'], 1)
+        self.assertEqual(ls['services_critical_hard'], 1)
+
+        # The stored etags are the current ones
+        headers_patch = {'Content-Type': 'application/json', 'If-Match': service['_etag']}
+        response = requests.patch(self.endpoint + '/service/' + rs[0]['_id'],
+                                  json={'ls_acknowledged': True, 'ls_state_type': 'HARD'},
+                                  headers=headers_patch,
+                                  auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+        response = requests.get(self.endpoint + '/host/' + rh[1]['_id'], auth=self.auth)
+        host = response.json()
+        self.assertEqual(host['_overall_state_id'], 1)
+
+        # One history event for each check result
+        response = requests.get(self.endpoint + '/logcheckresult', params={'sort': '_id'},
+                                auth=self.auth)
+        resp = response.json()
+        rl = resp['_items']
+        response = requests.get(self.endpoint + '/history', params={'sort': '_id'},
+                                auth=self.auth)
+        resp = response.json()
+        re = resp['_items']
+        self.assertEqual(len(re), 2)
+        for history, lcr in zip(re, rl):
+            self.assertEqual(history['type'], 'check.result')
+            self.assertEqual(history['logcheckresult'], lcr['_id'])
+            self.assertEqual(history['host'], rh[1]['_id'])
+            self.assertEqual(history['host_name'], 'srv001')
+            self.assertEqual(history['service'], lcr['service'])
+            self.assertEqual(history['service_name'], lcr['service_name'])
+            self.assertEqual(history['user'], None)
+            self.assertEqual(history['user_name'], 'Alignak')
+            self.assertEqual(history['_realm'], self.realm_all)
+            self.assertIn('_etag', history)
+        self.assertEqual(re[0]['message'], 'CRITICAL[HARD] (False/False): Service output')
+
+    def test_livestate_bulk(self):
+        """
+        Test the live state bulk update - the livestate, the overall states and the live
+        synthesis are updated, the other fields are refused
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        response = requests.get(self.endpoint + '/host', params={'sort': 'name'}, auth=self.auth)
+        resp = response.json()
+        rh = resp['_items']
+        self.assertEqual(rh[1]['name'], "srv001")
+        response = requests.get(self.endpoint + '/service', params={'sort': 'name'}, auth=self.auth)
+        resp = response.json()
+        rs = resp['_items']
+        self.assertEqual(rs[0]['name'], "ping")
+
+        data = [
+            {'service': rs[0]['_id'], 'ls_state': 'CRITICAL', 'ls_state_id': 2,
+             'ls_state_type': 'HARD', 'ls_output': 'Service output'},
+            {'host': rh[1]['_id'], 'ls_state': 'UP', 'ls_state_id': 0,
+             'ls_state_type': 'HARD', 'ls_output': 'Host output'}
+        ]
+        response = requests.post(self.endpoint + '/livestate', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK')
+        self.assertEqual(resp['_items'], [{'_status': 'OK', '_id': rs[0]['_id']},
+                                          {'_status': 'OK', '_id': rh[1]['_id']}])
+
+        response = requests.get(self.endpoint + '/service/' + rs[0]['_id'], auth=self.auth)
+        service = response.json()
+        self.assertEqual(service['ls_state'], 'CRITICAL')
+        self.assertEqual(service['ls_output'], 'Service output')
+        self.assertEqual(service['_overall_state_id'], 4)
+        self.assertNotEqual(service['_etag'], rs[0]['_etag'])
+
+        response = requests.get(self.endpoint + '/host/' + rh[1]['_id'], auth=self.auth)
+        host = response.json()
+        self.assertEqual(host['ls_state'], 'UP')
+        self.assertEqual(host['ls_output'], 'Host output')
+        # The host is UP but its service is CRITICAL
+        self.assertEqual(host['_overall_state_id'], 4)
+
+        response = requests.get(self.endpoint + '/livesynthesis', auth=self.auth)
+        resp = response.json()
+        ls = resp['_items'][0]
+        self.assertEqual(ls['hosts_up_hard'], 1)
+        self.assertEqual(ls['services_critical_hard'], 1)
+
+        # Only the live state fields are accepted, the valid updates are applied
+        data = [
+            {'host': rh[1]['_id'], 'name': 'renamed'},
+            {'host': rh[1]['_id'], 'ls_state': 'FOO'},
+            {'service': 'foo', 'ls_state': 'OK'},
+            {'ls_state': 'OK'},
+            {'service': rs[0]['_id'], 'ls_state': 'OK', 'ls_state_id': 0, 'ls_state_type': 'HARD'}
+        ]
+        response = requests.post(self.endpoint + '/livestate', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'ERR')
+        self.assertEqual(resp['_items'][0]['_issues'], {'name': 'unknown field'})
+        self.assertIn('ls_state', resp['_items'][1]['_issues'])
+        self.assertIn('service', resp['_items'][2]['_issues'])
+        self.assertIn('host', resp['_items'][3]['_issues'])
+        self.assertEqual(resp['_items'][4]['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/host/' + rh[1]['_id'], auth=self.auth)
+        host = response.json()
+        self.assertEqual(host['name'], 'srv001')
+        self.assertEqual(host['ls_state'], 'UP')
+        self.assertEqual(host['_overall_state_id'], 0)
+
+        # The overall state is a live state field, -1 recomputes the host overall state
+        from bson.objectid import ObjectId
+        from alignak_backend.app import app
+        with app.app_context():
+            app.data.driver.db['host'].update_one({'_id': ObjectId(rh[1]['_id'])},
+                                                  {'$set': {'_overall_state_id': 4}})
+        data = [{'host': rh[1]['_id'], '_overall_state_id': -1}]
+        response = requests.post(self.endpoint + '/livestate', json=data, headers=headers,
+                                 auth=self.auth)
+        self.assertEqual(response.json()['_status'], 'OK')
+        response = requests.get(self.endpoint + '/host/' + rh[1]['_id'], auth=self.auth)
+        self.assertEqual(response.json()['_overall_state_id'], 0)
+
+        # The issues are reported for each update, an element may be updated several times
+        data = [
+            {'host': rh[1]['_id'], 'ls_output': 'Host output 2'},
+            {'host': rh[1]['_id'], 'ls_state': 'FOO'}
+        ]
+        response = requests.post(self.endpoint + '/livestate', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'ERR')
+        self.assertEqual(resp['_items'][0], {'_status': 'OK', '_id': rh[1]['_id']})
+        self.assertIn('ls_state', resp['_items'][1]['_issues'])
+
+        response = requests.get(self.endpoint + '/host/' + rh[1]['_id'], auth=self.auth)
+        host = response.json()
+        self.assertEqual(host['ls_state'], 'UP')
+        self.assertEqual(host['ls_output'], 'Host output 2')
+        # As for a PATCH of the live state fields, the _updated field is not modified
+        self.assertEqual(host['_updated'], rh[1]['_updated'])
+
+        # The update hooks are run as for a PATCH
+        from alignak_backend.livestate import Livestate
+        hooks = []
+
+        def on_update_host(updates, original):
+            """Hook before an host update"""
+            hooks.append(('on_update_host', original['_id'], sorted(updates)))
+
+        def on_updated_host(updates, original):
+            """Hook after an host update"""
+            hooks.append(('on_updated_host', original['_id'], sorted(updates)))
+
+        app.on_update_host += on_update_host
+        app.on_updated_host += on_updated_host
+        try:
+            with app.test_request_context():
+                Livestate.apply([('host', ObjectId(rh[1]['_id']), ObjectId(rh[1]['_id']),
+                                  {'ls_output': 'Host output 3'})])
+        finally:
+            app.on_update_host -= on_update_host
+            app.on_updated_host -= on_updated_host
+        self.assertEqual(hooks, [('on_update_host', ObjectId(rh[1]['_id']), ['ls_output']),
+                                 ('on_updated_host', ObjectId(rh[1]['_id']),
+                                  ['_etag', 'ls_output'])])
+
+    def test_livestate_bulk_rights(self):
+        """
+        Test the live state bulk update with a user who is not an administrator - the hosts
+        that the user is not allowed to update are refused and they are not modified
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        response = requests.get(self.endpoint + '/host', params={'sort': 'name'}, auth=self.auth)
+        rh = response.json()['_items']
+        self.assertEqual(rh[1]['name'], "srv001")
+
+        # An host in a sub-realm, the user may only update the hosts of this sub-realm
+        data = {"name": "All A", "_parent": self.realm_all}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realm_a = response.json()['_id']
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['check_command'] = rh[1]['check_command']
+        if 'realm' in data:
+            del data['realm']
+        data['name'] = 'srv_a'
+        data['_realm'] = realm_a
+        response = requests.post(self.endpoint + '/host', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        self.assertEqual(resp['_status'], 'OK', resp)
+        host_a = resp['_id']
+        data = {'name': 'ls_user', 'password': 'test', 'back_role_super_admin': False,
+                '_realm': realm_a, '_sub_realm': False}
+        response = requests.post(self.endpoint + '/user', json=data, headers=headers,
+                                 auth=self.auth)
+        user_id = response.json()['_id']
+        data = {'user': user_id, 'realm': realm_a, 'sub_realm': False, 'resource': 'host',
+                'crud': ['read', 'update']}
+        response = requests.post(self.endpoint + '/userrestrictrole', json=data,
+                                 headers=headers, auth=self.auth)
+        self.assertEqual(response.json()['_status'], 'OK')
+        params = {'username': 'ls_user', 'password': 'test'}
+        response = requests.post(self.endpoint + '/login', json=params, headers=headers)
+        user_auth = requests.auth.HTTPBasicAuth(response.json()['token'], '')
+
+        try:
+            data = [
+                {'host': rh[1]['_id'], 'ls_state': 'DOWN', 'ls_state_id': 1,
+                 'ls_state_type': 'HARD'},
+                {'host': host_a, 'ls_state': 'DOWN', 'ls_state_id': 1, 'ls_state_type': 'HARD'}
+            ]
+            response = requests.post(self.endpoint + '/livestate', json=data, headers=headers,
+                                     auth=user_auth)
+            resp = response.json()
+            self.assertEqual(resp['_status'], 'ERR')
+            self.assertEqual(resp['_items'][0]['_status'], 'ERR')
+            self.assertIn('host', resp['_items'][0]['_issues'])
+            self.assertEqual(resp['_items'][1], {'_status': 'OK', '_id': host_a})
+
+            response = requests.get(self.endpoint + '/host/' + rh[1]['_id'], auth=self.auth)
+            host = response.json()
+            self.assertEqual(host['ls_state'], rh[1]['ls_state'])
+            self.assertEqual(host['_etag'], rh[1]['_etag'])
+            response = requests.get(self.endpoint + '/host/' + host_a, auth=self.auth)
+            host = response.json()
+            self.assertEqual(host['ls_state'], 'DOWN')
+        finally:
+            response = requests.get(self.endpoint + '/user/' + user_id, auth=self.auth)
+            requests.delete(self.endpoint + '/user/' + user_id, auth=self.auth,
+                            headers={'If-Match': response.json()['_etag']})
+            response = requests.get(self.endpoint + '/host/' + host_a, auth=self.auth)
+            requests.delete(self.endpoint + '/host/' + host_a, auth=self.auth,
+                            headers={'If-Match': response.json()['_etag']})
+            response = requests.get(self.endpoint + '/realm/' + realm_a, auth=self.auth)
+            requests.delete(self.endpoint + '/realm/' + realm_a, auth=self.auth,
+                            headers={'If-Match': response.json()['_etag']})
+
+    def test_livestate_collections(self):
+        """
+        Test the live state stored in the live state collections - the host and service
+        documents are modified only when their state changes
+
+        :return: None
+        """
+        from bson.objectid import ObjectId
+        from alignak_backend.app import app
+        from alignak_backend.livestate import Livestate
+
+        response = requests.get(self.endpoint + '/host', params={'sort': 'name'}, auth=self.auth)
+        resp = response.json()
+        rh = resp['_items']
+        self.assertEqual(rh[1]['name'], "srv001")
+        response = requests.get(self.endpoint + '/service', params={'sort': 'name'}, auth=self.auth)
+        resp = response.json()
+        rs = resp['_items']
+        self.assertEqual(rs[0]['name'], "ping")
+        host_id = ObjectId(rh[1]['_id'])
+        service_id = ObjectId(rs[0]['_id'])
+
+        with app.test_request_context():
+            app.config['LIVESTATE_COLLECTIONS'] = True
+            try:
+                service_db = app.data.driver.db['service']
+                servicelivestate_db = app.data.driver.db['servicelivestate']
+
+                # The state is modified: the service document is modified
+                Livestate.apply([('service', service_id, host_id, {
+                    'ls_state': 'CRITICAL', 'ls_state_id': 2, 'ls_state_type': 'HARD',
+                    'ls_output': 'Service output 1', 'ls_last_check': 1000})])
+                service = service_db.find_one({'_id': service_id})
+                self.assertEqual(service['ls_state'], 'CRITICAL')
+                self.assertEqual(service['_overall_state_id'], 4)
+                self.assertEqual(service['ls_output'], rs[0]['ls_output'])
+                self.assertNotEqual(service['_etag'], rs[0]['_etag'])
+                livestate = servicelivestate_db.find_one({'_id': service_id})
+                self.assertEqual(livestate['ls_output'], 'Service output 1')
+                self.assertEqual(livestate['ls_last_check'], 1000)
+                self.assertNotIn('ls_state', livestate)
+                etag = service['_etag']
+
+                # Only the output is modified: the service document is not modified
+                Livestate.apply([('service', service_id, host_id, {
+                    'ls_state': 'CRITICAL', 'ls_state_id': 2, 'ls_state_type': 'HARD',
+                    'ls_output': 'Service output 2', 'ls_last_check': 1010})])
+                service = service_db.find_one({'_id': service_id})
+                self.assertEqual(service['_etag'], etag)
+                livestate = servicelivestate_db.find_one({'_id': service_id})
+                self.assertEqual(livestate['ls_output'], 'Service output 2')
+
+                # The live state is joined when the service is read
+                service = Livestate.join('service', [service])[0]
+                self.assertEqual(service['ls_output'], 'Service output 2')
+                self.assertEqual(service['ls_last_check'], 1010)
+                services = Livestate.find('service', {'ls_last_check': {'$ne': 0}})
+                self.assertEqual([service['_id'] for service in services], [service_id])
+            finally:
+                app.config['LIVESTATE_COLLECTIONS'] = False
+
+    def test_logcheckresult_realm_path(self):
+        """
+        Test log checks results - the realm path of a check result is set, a user with the
+        rights on a realm and its sub-realms gets the check results of this realm
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        # The realm All has a sub-realm, the user rights are a sub-tree of the realms
+        data = {"name": "All A", "_parent": self.realm_all}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realm_a = response.json()['_id']
+        data = {'name': 'lcr_user', 'password': 'test', 'back_role_super_admin': False,
+                '_realm': self.realm_all, '_sub_realm': True}
+        response = requests.post(self.endpoint + '/user', json=data, headers=headers,
+                                 auth=self.auth)
+        user_id = response.json()['_id']
+        params = {'username': 'lcr_user', 'password': 'test'}
+        response = requests.post(self.endpoint + '/login', json=params, headers=headers)
+        user_auth = requests.auth.HTTPBasicAuth(response.json()['token'], '')
+
+        try:
+            response = requests.get(self.endpoint + '/host', params={'sort': 'name'},
+                                    auth=self.auth)
+            rh = response.json()['_items']
+            self.assertEqual(rh[1]['name'], "srv001")
+
+            data = {
+                "last_check": timegm(datetime.utcnow().timetuple()),
+                "host": rh[1]['_id'],
+                'acknowledged': False,
+                'state_id': 0,
+                'state': 'UP',
+                'state_type': 'HARD',
+                'last_state_id': 0,
+                'last_state': 'UP',
+                'last_state_type': 'HARD',
+                'state_changed': False,
+                'output': 'Host output'
+            }
+            response = requests.post(self.endpoint + '/logcheckresult', json=data,
+                                     headers=headers, auth=self.auth)
+            self.assertEqual(response.json()['_status'], 'OK')
+
+            response = requests.get(self.endpoint + '/logcheckresult', auth=self.auth)
+            rl = response.json()['_items']
+            self.assertEqual(len(rl), 1)
+            self.assertEqual(rl[0]['_realm_path'], '/%s/' % self.realm_all)
+
+            response = requests.get(self.endpoint + '/logcheckresult', auth=user_auth)
+            rl = response.json()['_items']
+            self.assertEqual(len(rl), 1)
+            self.assertEqual(rl[0]['host'], rh[1]['_id'])
+        finally:
+            response = requests.get(self.endpoint + '/user/' + user_id, auth=self.auth)
+            requests.delete(self.endpoint + '/user/' + user_id, auth=self.auth,
+                            headers={'If-Match': response.json()['_etag']})
+            response = requests.get(self.endpoint + '/realm/' + realm_a, auth=self.auth)
+            requests.delete(self.endpoint + '/realm/' + realm_a, auth=self.auth,
+                            headers={'If-Match': response.json()['_etag']})
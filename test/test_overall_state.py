@@ -1251,3 +1251,177 @@ class TestOverallState(unittest2.TestCase):
         ls_host = response.json()
         # _overall_state_id field is 2 (at least one service is problem and downtimed)
         self.assertEqual(2, ls_host['_overall_state_id'])
+
+    def test_services_overall(self):  # pylint: disable=too-many-locals
+        """Test the host services overall states maintained when its services are created,
+        updated and deleted
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+        sort_id = {'sort': '_id'}
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = self.realm_all
+        requests.post(self.endpoint + '/command', json=data, headers=headers, auth=self.auth)
+        response = requests.get(self.endpoint + '/command', params=sort_id, auth=self.auth)
+        resp = response.json()
+        rc = resp['_items']
+
+        # Add host and 2 services
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['check_command'] = rc[2]['_id']
+        if 'realm' in data:
+            del data['realm']
+        data['_realm'] = self.realm_all
+        response = requests.post(self.endpoint + '/host', json=data, headers=headers,
+                                 auth=self.auth)
+        host_id = response.json()['_id']
+        for filename in ['cfg/service_srv001_ping.json', 'cfg/service_srv002_ping.json']:
+            data = json.loads(open(filename).read())
+            data['host'] = host_id
+            data['check_command'] = rc[2]['_id']
+            data['_realm'] = self.realm_all
+            requests.post(self.endpoint + '/service', json=data, headers=headers,
+                          auth=self.auth)
+        response = requests.get(self.endpoint + '/service', params=sort_id, auth=self.auth)
+        resp = response.json()
+        services = resp['_items']
+        self.assertEqual(len(services), 2)
+
+        def patch(resource, element_id, data):
+            """Patch an element"""
+            response = requests.get(self.endpoint + '/%s/%s' % (resource, element_id),
+                                    auth=self.auth)
+            headers_patch = {'Content-Type': 'application/json',
+                             'If-Match': response.json()['_etag']}
+            response = requests.patch(self.endpoint + '/%s/%s' % (resource, element_id),
+                                      json=data, headers=headers_patch, auth=self.auth)
+            self.assertEqual(response.json()['_status'], 'OK')
+
+        def get_host():
+            """Get the host and its non-zero services overall states"""
+            response = requests.get(self.endpoint + '/host/' + host_id, auth=self.auth)
+            host = response.json()
+            return host, dict([(state_id, count) for state_id, count
+                               in host['_services_overall'].items() if count])
+
+        for service in services:
+            patch('service', service['_id'], {'ls_state': 'OK', 'ls_state_type': 'HARD'})
+        host, services_overall = get_host()
+        self.assertEqual(services_overall, {'0': 2})
+
+        patch('service', services[0]['_id'], {'ls_state': 'CRITICAL', 'ls_state_type': 'HARD'})
+        patch('host', host_id, {'ls_state': 'UP', 'ls_state_type': 'HARD'})
+        host, services_overall = get_host()
+        self.assertEqual(services_overall, {'0': 1, '4': 1})
+        self.assertEqual(host['_overall_state_id'], 4)
+
+        # A SOFT state is not counted
+        patch('service', services[1]['_id'], {'ls_state': 'WARNING', 'ls_state_type': 'SOFT'})
+        host, services_overall = get_host()
+        self.assertEqual(services_overall, {'4': 1})
+
+        # Delete the critical service
+        response = requests.get(self.endpoint + '/service/' + services[0]['_id'],
+                                auth=self.auth)
+        headers_delete = {'If-Match': response.json()['_etag']}
+        requests.delete(self.endpoint + '/service/' + services[0]['_id'],
+                        headers=headers_delete, auth=self.auth)
+        host, services_overall = get_host()
+        self.assertEqual(services_overall, {})
+
+        patch('host', host_id, {'ls_state': 'UP', 'ls_state_type': 'HARD'})
+        host, services_overall = get_host()
+        self.assertEqual(host['_overall_state_id'], 0)
+
+        # Drifted counters are recalculated by the maintenance command
+        patch('service', services[1]['_id'], {'ls_state': 'WARNING', 'ls_state_type': 'HARD'})
+        from bson.objectid import ObjectId
+        from alignak_backend.app import app
+        with app.app_context():
+            app.data.driver.db['host'].update_one({'_id': ObjectId(host_id)},
+                                                  {'$set': {'_services_overall': {'4': 5},
+                                                            '_overall_state_id': 4}})
+        response = requests.get(self.endpoint + '/cron_livestate_recalculate')
+        self.assertGreaterEqual(response.json()['hosts'], 1)
+        host, services_overall = get_host()
+        self.assertEqual(services_overall, {'3': 1})
+        self.assertEqual(host['_overall_state_id'], 3)
+
+    def test_services_overall_bulk(self):
+        """Test the host overall state updated once when several of its services are created
+        in the same request
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+        sort_id = {'sort': '_id'}
+        # Add command
+        data = json.loads(open('cfg/command_ping.json').read())
+        data['_realm'] = self.realm_all
+        requests.post(self.endpoint + '/command', json=data, headers=headers, auth=self.auth)
+        response = requests.get(self.endpoint + '/command', params=sort_id, auth=self.auth)
+        resp = response.json()
+        rc = resp['_items']
+
+        # Add host
+        data = json.loads(open('cfg/host_srv001.json').read())
+        data['check_command'] = rc[2]['_id']
+        if 'realm' in data:
+            del data['realm']
+        data['_realm'] = self.realm_all
+        response = requests.post(self.endpoint + '/host', json=data, headers=headers,
+                                 auth=self.auth)
+        host_id = response.json()['_id']
+        response = requests.get(self.endpoint + '/host/' + host_id, auth=self.auth)
+        host = response.json()
+        self.assertEqual(host['_overall_state_id'], 0)
+
+        # Add 2 critical services in one request
+        services = []
+        for filename in ['cfg/service_srv001_ping.json', 'cfg/service_srv002_ping.json']:
+            data = json.loads(open(filename).read())
+            data['host'] = host_id
+            data['check_command'] = rc[2]['_id']
+            data['_realm'] = self.realm_all
+            data['ls_state'] = 'CRITICAL'
+            data['ls_state_type'] = 'HARD'
+            services.append(data)
+        response = requests.post(self.endpoint + '/service', json=services, headers=headers,
+                                 auth=self.auth)
+        self.assertEqual(response.json()['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/service', params=sort_id, auth=self.auth)
+        resp = response.json()
+        for service in resp['_items']:
+            self.assertEqual(service['_overall_state_id'], 4)
+
+        # The host overall state is updated at the end of the request
+        response = requests.get(self.endpoint + '/host/' + host_id, auth=self.auth)
+        host = response.json()
+        self.assertEqual(dict([(state_id, count) for state_id, count
+                               in host['_services_overall'].items() if count]), {'4': 2})
+        self.assertEqual(host['_overall_state_id'], 4)
+
+        # The hosts requested several times during a request are patched once, an host update
+        # that fails is only logged
+        from bson.objectid import ObjectId
+        from flask import g
+        from alignak_backend.app import app
+        from alignak_backend.livestate import Livestate
+        with app.test_request_context():
+            g.deferred_writes = True
+            Livestate.update_host_overall(ObjectId(host_id))
+            Livestate.update_host_overall(ObjectId(host_id))
+            self.assertEqual(Livestate.flush(), 1)
+            self.assertEqual(Livestate.flush(), 0)
+
+            Livestate.update_host_overall(ObjectId())
+            self.assertEqual(Livestate.flush(), 0)
+
+        # Out of a backend request (cron routes, scheduler jobs), the host is patched
+        # immediately
+        with app.test_request_context():
+            Livestate.update_host_overall(ObjectId(host_id))
+            self.assertEqual(Livestate.flush(), 0)
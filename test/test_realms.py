@@ -12,6 +12,7 @@ import subprocess
 import copy
 import requests
 import unittest2
+from bson.objectid import ObjectId
 
 
 class TestRealms(unittest2.TestCase):
@@ -570,3 +571,126 @@ class TestRealms(unittest2.TestCase):
         self.assertEqual(len(re), 1)
         self.assertEqual(re[0]['_children'], [])
         self.assertEqual(re[0]['_all_children'], [])
+
+    def test_realm_tree_index(self):
+        """
+        Test the realms tree index: ancestors, descendants, names path and generation
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        data = {"name": "All A", "_parent": self.realmAll_id}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realmAll_A_id = response.json()['_id']
+
+        data = {"name": "All A1", "_parent": realmAll_A_id}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realmAll_A1_id = response.json()['_id']
+
+        from alignak_backend.app import app
+        from alignak_backend.realmtree import RealmTree
+        with app.test_request_context():
+            index = RealmTree.get(ObjectId(realmAll_A1_id))
+            self.assertEqual(index['levels'][ObjectId(realmAll_A1_id)], 2)
+            self.assertEqual(RealmTree.ancestors(ObjectId(realmAll_A1_id)),
+                             [ObjectId(self.realmAll_id), ObjectId(realmAll_A_id)])
+            self.assertEqual(sorted(RealmTree.descendants(ObjectId(self.realmAll_id))),
+                             sorted([ObjectId(realmAll_A_id), ObjectId(realmAll_A1_id)]))
+            self.assertEqual(RealmTree.name_path(ObjectId(realmAll_A1_id)), 'All.All A.All A1')
+
+            # The index is built once for a generation
+            self.assertIs(RealmTree.get(), index)
+
+            # A new generation rebuilds the index
+            RealmTree.invalidate()
+            self.assertIsNot(RealmTree.get(), index)
+            self.assertEqual(RealmTree.get()['generation'], RealmTree.generation)
+
+            # An unknown realm rebuilds the index only once
+            index = RealmTree.get()
+            unknown_id = ObjectId()
+            index = RealmTree.get(unknown_id)
+            self.assertIs(RealmTree.get(unknown_id), index)
+            self.assertEqual(RealmTree.path(unknown_id), '')
+            self.assertIs(RealmTree.get(), index)
+
+    def test_realm_path(self):
+        """
+        Test the realm path of the realm scoped elements, also when a realm is moved
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        data = {"name": "All A", "_parent": self.realmAll_id}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realmAll_A_id = response.json()['_id']
+
+        data = {"name": "All B", "_parent": self.realmAll_id}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realmAll_B_id = response.json()['_id']
+
+        data = {"name": "All A1", "_parent": realmAll_A_id}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realmAll_A1_id = response.json()['_id']
+
+        data = {"name": "cmd A1", "command_line": "check_ping", "_realm": realmAll_A1_id}
+        response = requests.post(self.endpoint + '/command', json=data, headers=headers,
+                                 auth=self.auth)
+        command_id = response.json()['_id']
+
+        response = requests.get(self.endpoint + '/command/' + command_id, auth=self.auth)
+        self.assertEqual(response.json()['_realm_path'],
+                         '/%s/%s/%s/' % (self.realmAll_id, realmAll_A_id, realmAll_A1_id))
+
+        from alignak_backend.app import app
+        from alignak_backend.realmtree import RealmTree
+        with app.test_request_context():
+            # A realm with all its sub-realms is a prefix on the realm path
+            self.assertEqual(
+                RealmTree.realms_lookups([ObjectId(realmAll_A_id), ObjectId(realmAll_A1_id)]),
+                [{'_realm_path': {'$regex': '^/%s/%s/' % (self.realmAll_id, realmAll_A_id)}}])
+            self.assertEqual(
+                RealmTree.realms_lookups([ObjectId(realmAll_A_id), ObjectId(realmAll_B_id)]),
+                [{'_realm': {'$in': [ObjectId(realmAll_A_id), ObjectId(realmAll_B_id)]}}])
+
+        # Move the realm All A1 in All B
+        response = requests.get(self.endpoint + '/realm/' + realmAll_A1_id, auth=self.auth)
+        headers = {'Content-Type': 'application/json', 'If-Match': response.json()['_etag']}
+        response = requests.patch(self.endpoint + '/realm/' + realmAll_A1_id,
+                                  json={'_parent': realmAll_B_id}, headers=headers,
+                                  auth=self.auth)
+        self.assertEqual(response.json()['_status'], 'OK')
+
+        response = requests.get(self.endpoint + '/command/' + command_id, auth=self.auth)
+        self.assertEqual(response.json()['_realm_path'],
+                         '/%s/%s/%s/' % (self.realmAll_id, realmAll_B_id, realmAll_A1_id))
+
+        with app.test_request_context():
+            # The sub-realms and the paths are got from the parents chain of the moved realm
+            RealmTree.build()
+            self.assertEqual(RealmTree.descendants(ObjectId(realmAll_A_id)), [])
+            self.assertEqual(RealmTree.descendants(ObjectId(realmAll_B_id)),
+                             [ObjectId(realmAll_A1_id)])
+            self.assertEqual(
+                RealmTree.realms_lookups([ObjectId(realmAll_B_id), ObjectId(realmAll_A1_id)]),
+                [{'_realm_path': {'$regex': '^/%s/%s/' % (self.realmAll_id, realmAll_B_id)}}])
+
+            # An unknown realm does not match the documents of all the realms
+            self.assertEqual(RealmTree.path_lookup(ObjectId()), {'_realm_path': {'$in': []}})
+
+        # Move the command in the realm All A
+        headers = {'Content-Type': 'application/json', 'If-Match': response.json()['_etag']}
+        response = requests.patch(self.endpoint + '/command/' + command_id,
+                                  json={'_realm': realmAll_A_id}, headers=headers,
+                                  auth=self.auth)
+        self.assertEqual(response.json()['_status'], 'OK')
+        response = requests.get(self.endpoint + '/command/' + command_id, auth=self.auth)
+        self.assertEqual(response.json()['_realm_path'],
+                         '/%s/%s/' % (self.realmAll_id, realmAll_A_id))
@@ -162,3 +162,18 @@ class TestRecalculateLivesynthesis(unittest2.TestCase):
         self.assertEqual(r[0]['services_unknown_soft'], 0)
         self.assertEqual(r[0]['services_acknowledged'], 0)
         self.assertEqual(r[0]['services_in_downtime'], 0)
+
+        # Recalculate on demand
+        response = requests.get(self.endpoint + '/cron_livesynthesis_recalculate')
+        resp = response.json()
+        self.assertEqual(resp['realms'], 1)
+        for step in ['realms', 'hosts', 'services', 'write', 'timeseries', 'total']:
+            self.assertIn(step, resp['timing'])
+        response = requests.get(self.endpoint + '/livesynthesis', params=sort_id, auth=self.auth)
+        resp = response.json()
+        r = resp['_items']
+        self.assertEqual(len(r), 1)
+        self.assertEqual(r[0]['hosts_total'], 1)
+        self.assertEqual(r[0]['hosts_unreachable_hard'], 1)
+        self.assertEqual(r[0]['services_total'], 1)
+        self.assertEqual(r[0]['services_unknown_hard'], 1)
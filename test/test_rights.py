@@ -345,3 +345,140 @@ class TestRights(unittest2.TestCase):
             elif realm['name'] == 'Dagobah':
                 assert realm['_parent'] == parent
                 assert realm['_tree_parents'] == [parent]
+
+    def test_rights_lookup(self):
+        """Test the lookup filters compiled from the user rights
+
+        :return: None
+        """
+        from bson.objectid import ObjectId
+        from flask import g
+        from alignak_backend.app import app, add_rights_lookup
+
+        realm_a = ObjectId()
+        realm_b = ObjectId()
+        user_id = ObjectId()
+        with app.test_request_context():
+            g.users_id = user_id
+            g.resources_get = {'host': [realm_a], 'realm': [realm_a, realm_b]}
+            g.resources_get_parents = {'host': [], 'service': [realm_b]}
+            g.resources_get_custom = {'service': [realm_a]}
+            g.rights_lookups = {}
+
+            # Only realm rights: a single condition on _realm
+            lookup = {}
+            add_rights_lookup('get', 'host', lookup)
+            self.assertEqual(lookup, {'_realm': {'$in': [realm_a]}})
+
+            # Sub-realm and custom rights
+            lookup = {}
+            add_rights_lookup('get', 'service', lookup)
+            self.assertEqual(lookup, {'$or': [
+                {'$and': [{'_sub_realm': True}, {'_realm': {'$in': [realm_b]}}]},
+                {'$and': [{'_users_read': user_id}, {'_realm': {'$in': [realm_a]}}]}
+            ]})
+
+            # The request lookup is kept
+            lookup = {'_id': realm_b}
+            add_rights_lookup('get', 'realm', lookup)
+            self.assertEqual(lookup, {'_id': realm_b,
+                                      '$and': [{'_id': {'$in': [realm_a, realm_b]}}]})
+
+            # The compiled filters are reused but each request gets its own copy
+            self.assertIn(('get', 'host'), g.rights_lookups)
+            lookup['$and'][0]['_id']['$in'].append(user_id)
+            lookup = {}
+            add_rights_lookup('get', 'realm', lookup)
+            self.assertEqual(lookup, {'_id': {'$in': [realm_a, realm_b]}})
+
+    def test_rights_cache(self):
+        """Test the users rights cache: a cached right is used without reading the database, it
+        is revoked when the user, its restriction roles or the realms tree are modified and when
+        it expires
+
+        :return: None
+        """
+        import base64
+        from bson.objectid import ObjectId
+        from flask import g
+        from alignak_backend.app import app, MyTokenAuth
+
+        # User with read right on All realm and no sub-realms
+        headers = {'Content-Type': 'application/json'}
+        data = {'name': 'user_cache', 'password': 'test', 'back_role_super_admin': False,
+                '_realm': self.realmAll_id, '_sub_realm': False}
+        response = requests.post(self.endpoint + '/user', json=data, headers=headers,
+                                 auth=self.auth)
+        user_id = response.json()['_id']
+        params = {'username': 'user_cache', 'password': 'test'}
+        response = requests.post(self.endpoint + '/login', json=params, headers=headers)
+        token = response.json()['token']
+
+        def check_auth():
+            """Authenticate the user in this process and get its rights"""
+            authorization = 'Basic %s' % base64.b64encode(
+                ('%s:' % token).encode('utf-8')).decode('utf-8')
+            with app.test_request_context(headers={'Authorization': authorization}):
+                assert MyTokenAuth().check_auth(token, [], 'command', 'GET')
+                return {'can_submit_commands': g.can_submit_commands,
+                        'resources_get': g.resources_get,
+                        'resources_post': g.resources_post}
+
+        # The requests are made in this process to run the hooks that clear its cache
+        client = app.test_client()
+        admin_headers = {'Content-Type': 'application/json',
+                         'Authorization': 'Basic %s' % base64.b64encode(
+                             ('%s:' % self.token).encode('utf-8')).decode('utf-8')}
+
+        def patch(resource, item_id, data):
+            """PATCH an item in this process"""
+            response = client.get('/%s/%s' % (resource, item_id), headers=admin_headers)
+            patch_headers = dict(admin_headers)
+            patch_headers['If-Match'] = json.loads(response.get_data())['_etag']
+            response = client.patch('/%s/%s' % (resource, item_id), data=json.dumps(data),
+                                    headers=patch_headers)
+            assert json.loads(response.get_data())['_status'] == 'OK'
+
+        MyTokenAuth.clear_rights_cache()
+        rights = check_auth()
+        assert rights['can_submit_commands'] is False
+        assert token in MyTokenAuth.rights_cache
+
+        # Cache hit: the materialized rights are not read again
+        with app.app_context():
+            userrights_db = app.data.driver.db['userrights']
+            userrights_db.update_one({'user': ObjectId(user_id)},
+                                     {'$set': {'rights.can_submit_commands': True}})
+        rights = check_auth()
+        assert rights['can_submit_commands'] is False
+
+        # Expired cached rights are read again
+        with app.app_context():
+            MyTokenAuth.rights_cache[token]['_cached'] -= app.config['RIGHTS_CACHE_TTL'] + 1
+        rights = check_auth()
+        assert rights['can_submit_commands'] is True
+
+        # A user modification revokes the cached rights
+        patch('user', user_id, {'can_submit_commands': False})
+        rights = check_auth()
+        assert rights['can_submit_commands'] is False
+
+        # A user restriction role modification revokes the cached rights
+        assert 'command' not in rights['resources_post']
+        response = client.get('/userrestrictrole?where=%s' % json.dumps({'user': user_id}),
+                              headers=admin_headers)
+        role = json.loads(response.get_data())['_items'][0]
+        patch('userrestrictrole', role['_id'], {'crud': ['create', 'read']})
+        rights = check_auth()
+        assert rights['resources_post']['command'] == [ObjectId(self.realmAll_id)]
+
+        # A realms tree modification revokes the cached rights
+        patch('userrestrictrole', role['_id'], {'sub_realm': True})
+        check_auth()
+        assert token in MyTokenAuth.rights_cache
+        response = client.post('/realm', data=json.dumps({'name': 'Naboo',
+                                                          '_parent': self.realmAll_id}),
+                               headers=admin_headers)
+        realm_id = json.loads(response.get_data())['_id']
+        rights = check_auth()
+        assert ObjectId(realm_id) in rights['resources_get']['command']
@@ -384,3 +384,170 @@ class TestUserrestrict(unittest2.TestCase):
 
         my_auth = requests.auth.HTTPBasicAuth(resp['token'], '')
         self.crud_command(my_auth, 'command', 'default-powered-user', crud='crud')
+
+    def test_user_rights_materialized(self):
+        """Test that the user effective rights are materialized and updated
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        # Add a normal user (not a super-admin user)
+        data = {
+            'name': 'normal_user_materialized', 'password': 'test',
+            'back_role_super_admin': False, '_realm': self.realmAll_id
+        }
+        response = requests.post(self.endpoint + '/user', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        user_id = resp['_id']
+
+        # Get new user token
+        params = {'username': 'normal_user_materialized', 'password': 'test'}
+        response = requests.post(self.endpoint + '/login', json=params, headers=headers)
+        token = response.json()['token']
+        my_auth = requests.auth.HTTPBasicAuth(token, '')
+
+        from bson.objectid import ObjectId
+        from alignak_backend.app import app
+        with app.app_context():
+            userrights_db = app.data.driver.db['userrights']
+            user_rights = userrights_db.find_one({'user': ObjectId(user_id)})
+            assert user_rights['name'] == 'normal_user_materialized'
+            assert user_rights['token'] == token
+            assert user_rights['rights']['resources_get']['command'] == \
+                [ObjectId(self.realmAll_id)]
+            assert 'command' not in user_rights['rights']['resources_post']
+
+        # Update user's rights - set full CRUD rights
+        params = {'where': json.dumps({'user': user_id})}
+        response = requests.get(self.endpoint + '/userrestrictrole', params=params, auth=self.auth)
+        resp = response.json()
+        headers = {'Content-Type': 'application/json', 'If-Match': resp['_items'][0]['_etag']}
+        data = {'crud': ['create', 'read', 'update', 'delete']}
+        resp = requests.patch(self.endpoint + '/userrestrictrole/' + resp['_items'][0]['_id'],
+                              json=data, headers=headers, auth=self.auth)
+        resp = resp.json()
+        assert resp['_status'] == 'OK'
+
+        with app.app_context():
+            user_rights = userrights_db.find_one({'user': ObjectId(user_id)})
+            assert user_rights['rights']['resources_post']['command'] == \
+                [ObjectId(self.realmAll_id)]
+        self.crud_command(my_auth, 'command', 'materialized-user', crud='crud')
+
+        # Modifying the realms tree materializes again the rights of the users that have a
+        # restriction role on a parent realm
+        with app.app_context():
+            version = userrights_db.find_one({'user': ObjectId(user_id)})['rights']['_version']
+        data = {"name": "All A", "_parent": self.realmAll_id}
+        headers = {'Content-Type': 'application/json'}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        assert resp['_status'] == 'OK'
+        with app.app_context():
+            user_rights = userrights_db.find_one({'user': ObjectId(user_id)})
+            assert user_rights['rights']['_version'] > version
+            version = user_rights['rights']['_version']
+        response = requests.get(self.endpoint + '/command', auth=my_auth)
+        assert response.status_code == 200
+
+        # Renaming a realm does not modify the rights
+        headers = {'Content-Type': 'application/json', 'If-Match': resp['_etag']}
+        response = requests.patch(self.endpoint + '/realm/' + resp['_id'],
+                                  json={'name': 'All A renamed'}, headers=headers,
+                                  auth=self.auth)
+        assert response.json()['_status'] == 'OK'
+
+        # Updating the user preferences does not modify the rights
+        response = requests.get(self.endpoint + '/user/' + user_id, auth=self.auth)
+        headers = {'Content-Type': 'application/json', 'If-Match': response.json()['_etag']}
+        response = requests.patch(self.endpoint + '/user/' + user_id,
+                                  json={'ui_preferences': {'table': 'hosts'}}, headers=headers,
+                                  auth=self.auth)
+        assert response.json()['_status'] == 'OK'
+        with app.app_context():
+            user_rights = userrights_db.find_one({'user': ObjectId(user_id)})
+            assert user_rights['rights']['_version'] == version
+
+        # Rebuild all the users rights
+        response = requests.get(self.endpoint + '/cron_users_rights')
+        resp = response.json()
+        with app.app_context():
+            assert resp['users'] == userrights_db.count()
+
+        # Deleting the user deletes its rights
+        response = requests.get(self.endpoint + '/user/' + user_id, auth=self.auth)
+        headers = {'If-Match': response.json()['_etag']}
+        response = requests.delete(self.endpoint + '/user/' + user_id, headers=headers,
+                                   auth=self.auth)
+        assert response.status_code == 204
+        with app.app_context():
+            assert userrights_db.find_one({'user': ObjectId(user_id)}) is None
+
+    def test_user_rights_materialized_realms(self):
+        """Test the user rights materialized again when the realms tree is modified, only for
+        the users concerned by the modification
+
+        :return: None
+        """
+        headers = {'Content-Type': 'application/json'}
+
+        data = {"name": "All R", "_parent": self.realmAll_id}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realm_r_id = response.json()['_id']
+        data = {"name": "All S", "_parent": self.realmAll_id}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        realm_s_id = response.json()['_id']
+
+        # An user with rights on the realm All and its sub-realms, another one on the realm All S
+        data = {
+            'name': 'normal_user_realms', 'password': 'test',
+            'back_role_super_admin': False, '_realm': self.realmAll_id, '_sub_realm': True
+        }
+        response = requests.post(self.endpoint + '/user', json=data, headers=headers,
+                                 auth=self.auth)
+        user_id = response.json()['_id']
+        data = {
+            'name': 'normal_user_realm_s', 'password': 'test',
+            'back_role_super_admin': False, '_realm': realm_s_id, '_sub_realm': True
+        }
+        response = requests.post(self.endpoint + '/user', json=data, headers=headers,
+                                 auth=self.auth)
+        user_s_id = response.json()['_id']
+
+        from bson.objectid import ObjectId
+        from alignak_backend.app import app
+        with app.app_context():
+            userrights_db = app.data.driver.db['userrights']
+            version_s = userrights_db.find_one(
+                {'user': ObjectId(user_s_id)})['rights']['_version']
+
+        # Add a sub-realm in the realm All R
+        data = {"name": "All R.1", "_parent": realm_r_id}
+        response = requests.post(self.endpoint + '/realm', json=data, headers=headers,
+                                 auth=self.auth)
+        resp = response.json()
+        realm_id = resp['_id']
+
+        with app.app_context():
+            user_rights = userrights_db.find_one({'user': ObjectId(user_id)})
+            assert ObjectId(realm_id) in user_rights['rights']['resources_get']['command']
+            user_rights = userrights_db.find_one({'user': ObjectId(user_s_id)})
+            assert user_rights['rights']['_version'] == version_s
+            assert ObjectId(realm_id) not in user_rights['rights']['resources_get']['command']
+
+        # Move the sub-realm in the realm All S
+        headers = {'Content-Type': 'application/json', 'If-Match': resp['_etag']}
+        response = requests.patch(self.endpoint + '/realm/' + realm_id,
+                                  json={'_parent': realm_s_id}, headers=headers,
+                                  auth=self.auth)
+        assert response.json()['_status'] == 'OK'
+
+        with app.app_context():
+            user_rights = userrights_db.find_one({'user': ObjectId(user_s_id)})
+            assert user_rights['rights']['_version'] > version_s
+            assert ObjectId(realm_id) in user_rights['rights']['resources_get']['command']